@@ -0,0 +1,101 @@
+"""Read-replica routing.
+
+Writes always go to 'default' (the primary). Reads go to a replica only while a request that is
+known to be safe is being served: a GET/HEAD to a view using ReplicaReadsMixin (product, category
+and bid lists, the notification feed), and only once DRF has authenticated the request. Until then
+(authentication's own queries included) and everywhere else, including background workers and
+management commands, reads go to the primary. The router never looks at `request.user` itself: it
+reads the flag ReplicaReadsMixin sets on the request.
+
+After a successful write request the user is pinned to the primary for DATABASE_REPLICA_PIN_SECONDS
+(longer than the expected replication lag), so a bidder always sees their own bid. The pin is kept in
+the cache and only works if every process sees the same cache, so replicas require a shared cache
+(REDIS_URL, see auctioncraft_api/shared_cache.py): the router refuses to start without one.
+
+Replicas are the aliases listed in DATABASE_REPLICAS; with none configured the router is a no-op.
+"""
+import random
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from . import shared_cache
+
+_request = ContextVar('replica_request', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _pin_key(user_id):
+    return f'db:pin-primary:{user_id}'
+
+
+def pin_primary(user_id):
+    """Serve this user's reads from the primary for the next DATABASE_REPLICA_PIN_SECONDS."""
+    cache.set(_pin_key(user_id), 1, getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5))
+
+
+def allow_replica_reads(request, user):
+    """Let the rest of `request` read from a replica unless `user` (already authenticated) is pinned."""
+    if _request.get() is request:
+        request._replica_allowed = not (user.is_authenticated and cache.get(_pin_key(user.pk)))
+
+
+class ReplicaReadsMixin:
+    """For DRF views whose safe requests may be served from a read replica."""
+    replica_reads = True
+
+    def perform_authentication(self, request):
+        super().perform_authentication(request)
+        allow_replica_reads(request._request, request.user)
+
+
+class ReplicaRouter:
+    def __init__(self):
+        if replicas() and not shared_cache.is_shared():
+            raise ImproperlyConfigured('DB_REPLICA_HOSTS needs a cache shared by all processes (REDIS_URL): '
+                                       'the primary pin after a write is kept in the cache.')
+
+    def db_for_read(self, model, **hints):
+        request = _request.get()
+        if request is None or not getattr(request, '_replica_allowed', False) or not replicas():
+            return 'default'
+        return random.choice(replicas())
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    """Marks safe requests to ReplicaReadsMixin views as replica-eligible and pins users after writes."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                _request.reset(request._replica_token)
+        user = getattr(request, 'user', None)
+        if (request.method not in SAFE_METHODS and response.status_code < 400
+                and replicas() and user is not None and user.is_authenticated):
+            pin_primary(user.pk)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if request.method in SAFE_METHODS and getattr(view_class, 'replica_reads', False):
+            request._replica_token = _request.set(request)
@@ -0,0 +1,260 @@
+"""Per-request performance instrumentation, exported in the Prometheus text format at /metrics.
+
+For every request the middleware records, under the route name and method (e.g. `POST product-place-bid`):
+wall time, SQL query count and time (connection.execute_wrapper on every database alias), time spent
+serializing (DRF serializer `.data` and the auctions fast path), time in outbound calls named in
+INSTRUMENTATION_HOOKS (email sends, Stripe API calls) and response cache hits/misses. Outbound calls made
+by background workers (the email outbox, webhook processing) are counted under `background`.
+
+Requests slower than INSTRUMENTATION_SLOW_MS are logged with their breakdown on the
+`auctioncraft.slow_requests` logger, sampled at INSTRUMENTATION_SLOW_SAMPLE_RATE.
+
+Disabled unless INSTRUMENTATION_ENABLED: the middleware then removes itself from the stack
+(MiddlewareNotUsed) and no hooks are installed, so there is no per-request or per-query cost.
+Metrics are kept per process; with several worker processes scrape each one (or run one per pod).
+"""
+import bisect
+import importlib
+import inspect
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, Http404
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('auctioncraft.slow_requests')
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+TIMERS = ('sql', 'serializer', 'email', 'stripe')
+COUNTERS = ('queries', 'cache_hits', 'cache_misses', 'cache_not_modified')
+
+_current = ContextVar('instrumented_request', default=None)
+
+
+def enabled():
+    return getattr(settings, 'INSTRUMENTATION_ENABLED', False)
+
+
+class Sample:
+    """Measurements of one request (or of background work, which has no request)."""
+    __slots__ = TIMERS + COUNTERS + ('depth',)
+
+    def __init__(self):
+        for name in TIMERS + COUNTERS:
+            setattr(self, name, 0)
+        self.depth = 0  # nesting of serializer calls; only the outermost is timed
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def observe(self, route, status, duration, sample):
+        with self.lock:
+            entry = self.routes.get(route)
+            if entry is None:
+                entry = self.routes[route] = {'count': 0, 'duration': 0.0, 'buckets': [0] * (len(BUCKETS) + 1),
+                                              'status': {}, **{name: 0 for name in TIMERS + COUNTERS}}
+            entry['count'] += 1
+            entry['duration'] += duration
+            entry['buckets'][bisect.bisect_left(BUCKETS, duration)] += 1
+            status_class = f'{status // 100}xx'
+            entry['status'][status_class] = entry['status'].get(status_class, 0) + 1
+            for name in TIMERS + COUNTERS:
+                entry[name] += getattr(sample, name)
+
+    def render(self):
+        with self.lock:
+            routes = {route: {**entry, 'buckets': list(entry['buckets']), 'status': dict(entry['status'])}
+                      for route, entry in self.routes.items()}
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP auctioncraft_{name} {help_text}')
+            lines.append(f'# TYPE auctioncraft_{name} {kind}')
+
+        family('request_duration_seconds', 'histogram', 'Request wall time.')
+        for (view, method), entry in sorted(routes.items()):
+            labels = f'view="{view}",method="{method}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ('+Inf',), entry['buckets']):
+                cumulative += n
+                lines.append(f'auctioncraft_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'auctioncraft_request_duration_seconds_sum{{{labels}}} {entry["duration"]:.6f}')
+            lines.append(f'auctioncraft_request_duration_seconds_count{{{labels}}} {entry["count"]}')
+        family('responses_total', 'counter', 'Responses by status class.')
+        for (view, method), entry in sorted(routes.items()):
+            for status_class, n in sorted(entry['status'].items()):
+                lines.append(f'auctioncraft_responses_total{{view="{view}",method="{method}",status="{status_class}"}} {n}')
+        for name in TIMERS:
+            family(f'{name}_seconds_total', 'counter', f'Time spent in {name}.')
+            for (view, method), entry in sorted(routes.items()):
+                lines.append(f'auctioncraft_{name}_seconds_total{{view="{view}",method="{method}"}} {entry[name]:.6f}')
+        for name in COUNTERS:
+            family(f'{name}_total', 'counter', f'Number of {name.replace("_", " ")}.')
+            for (view, method), entry in sorted(routes.items()):
+                lines.append(f'auctioncraft_{name}_total{{view="{view}",method="{method}"}} {entry[name]}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+_background = Sample()
+_background_lock = threading.Lock()
+
+
+def _add(name, value):
+    sample = _current.get()
+    if sample is not None:
+        setattr(sample, name, getattr(sample, name) + value)
+    else:
+        with _background_lock:
+            setattr(_background, name, getattr(_background, name) + value)
+
+
+def _flush_background():
+    global _background
+    with _background_lock:
+        sample, _background = _background, Sample()
+    registry.observe(('background', '-'), 200, 0.0, sample)
+
+
+def _sql_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample = _current.get()
+        if sample is not None:
+            sample.sql += time.perf_counter() - started
+            sample.queries += 1
+
+
+def _timed(kind, func):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _add(kind, time.perf_counter() - started)
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def _timed_serializer(func):
+    def wrapper(*args, **kwargs):
+        sample = _current.get()
+        if sample is None or sample.depth:
+            return func(*args, **kwargs)
+        sample.depth += 1
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sample.depth -= 1
+            sample.serializer += time.perf_counter() - started
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def _patch(path, make_wrapper):
+    """Replace the function, method, classmethod or property at dotted `path` with a wrapped one."""
+    owner_path, name = path.rsplit('.', 1)
+    try:
+        owner = importlib.import_module(owner_path)
+    except ImportError:
+        owner = import_string(owner_path)  # a class
+    original = inspect.getattr_static(owner, name)
+    if isinstance(original, classmethod):
+        setattr(owner, name, classmethod(make_wrapper(original.__func__)))
+    elif isinstance(original, staticmethod):
+        setattr(owner, name, staticmethod(make_wrapper(original.__func__)))
+    elif isinstance(original, property):
+        setattr(owner, name, property(make_wrapper(original.fget), original.fset, original.fdel))
+    else:
+        setattr(owner, name, make_wrapper(original))
+
+
+def _record_cache(func):
+    def wrapper(kind, n=1):
+        _add(f'cache_{kind}', n)
+        return func(kind, n)
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install_hooks():
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        for path in ('rest_framework.serializers.Serializer.data', 'rest_framework.serializers.ListSerializer.data',
+                     'auctions.fast_serializers.product_rows', 'auctions.fast_serializers.bid_rows',
+                     'auctions.fast_serializers.product_detail'):
+            _patch(path, _timed_serializer)
+        _patch('auctions.caching.record', _record_cache)
+        for kind, paths in getattr(settings, 'INSTRUMENTATION_HOOKS', {}).items():
+            for path in paths:
+                try:
+                    _patch(path, lambda func, kind=kind: _timed(kind, func))
+                except ImportError:
+                    pass  # optional dependency not installed
+        _installed = True
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow = getattr(settings, 'INSTRUMENTATION_SLOW_MS', 1000) / 1000
+        self.sample_rate = getattr(settings, 'INSTRUMENTATION_SLOW_SAMPLE_RATE', 1.0)
+        install_hooks()
+
+    def __call__(self, request):
+        sample = Sample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        route = (match.view_name if match else 'unmatched', request.method)
+        registry.observe(route, response.status_code, duration, sample)
+        if duration >= self.slow and random.random() < self.sample_rate:
+            logger.warning('slow request %s %s -> %s in %.0f ms: sql %.0f ms (%d queries), serializer %.0f ms, '
+                           'email %.0f ms, stripe %.0f ms', request.method, request.get_full_path(),
+                           response.status_code, duration * 1000, sample.sql * 1000, sample.queries,
+                           sample.serializer * 1000, sample.email * 1000, sample.stripe * 1000)
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint. Needs `Authorization: Bearer <INSTRUMENTATION_METRICS_TOKEN>` when a token
+    is configured; otherwise it only answers requests from INTERNAL_IPS / localhost."""
+    if not enabled():
+        raise Http404
+    token = getattr(settings, 'INSTRUMENTATION_METRICS_TOKEN', '')
+    if token:
+        if not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+            return HttpResponse(status=403)
+    elif request.META.get('REMOTE_ADDR') not in {'127.0.0.1', '::1', *getattr(settings, 'INTERNAL_IPS', ())}:
+        return HttpResponse(status=403)
+    _flush_background()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
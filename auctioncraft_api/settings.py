@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctioncraft_api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -36,6 +37,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'auctioncraft_api.db_routing.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'auctioncraft_api.urls'
@@ -62,13 +64,37 @@ DATABASES = {
         'NAME': os.getenv('DB_NAME', 'auctioncraft_db'),
         'USER': os.getenv('DB_USER', 'auctioncraft_user'),
         'PASSWORD': os.getenv('DB_PASSWORD', 'change-me-in-production'),
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'HOST': os.getenv('DB_HOST', 'localhost'),
+        'PORT': os.getenv('DB_PORT', '5432'),
+        # persistent connections: reused across requests for up to DB_CONN_MAX_AGE seconds
+        # (0 = reconnect every request, as before), checked for liveness before each request reuses them
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
-
-
+# Read replicas (auctioncraft_api/db_routing.py): DB_REPLICA_HOSTS="replica1:5432,replica2:5432"
+# (requires a shared cache, REDIS_URL, for the primary pin below)
+DATABASE_REPLICAS = []
+for _index, _host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    _name, _, _port = _host.partition(':')
+    DATABASES[f'replica{_index}'] = {**DATABASES['default'], 'HOST': _name, 'PORT': _port or DATABASES['default']['PORT'],
+                                     'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{_index}')
+DATABASE_ROUTERS = ['auctioncraft_api.db_routing.ReplicaRouter']
+# reads of a user who just wrote stay on the primary this long (should exceed replication lag)
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 5))
+
+
+
+# Local-memory LRU cache by default; set REDIS_URL to share the cache between processes.
+if os.getenv('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('REDIS_URL')}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 20000}}}
+# Whether every process sees the same cache (auctioncraft_api/shared_cache.py); detected from the backend
+# unless CACHE_SHARED=1/0 is set. CACHE_SHARED=1 with a local cache is only safe with one process in total.
+CACHE_SHARED = {'1': True, '0': False}.get(os.getenv('CACHE_SHARED', ''))
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -82,29 +108,92 @@ TIME_ZONE = 'UTC'
 USE_I18N = True
 USE_TZ = True
 STATIC_URL = '/static/'
+MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 12,
+    # proxies in front of the app that append to X-Forwarded-For; with 0 the client IP used by the
+    # throttles is REMOTE_ADDR, since a client can send any X-Forwarded-For it likes
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # access tokens carry the user claims trusted by users.authentication.ClaimsJWTAuthentication
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.TokenRefreshSerializer',
 }
+# Token staleness/revocation lookups are memoized per process for this many seconds (users/authentication.py)
+AUTH_CLAIMS_LOCAL_TTL = int(os.getenv('AUTH_CLAIMS_LOCAL_TTL', 5))
+
+# Number of most recent bids embedded in the product detail response (full history: /api/bids/?product=<id>)
+AUCTIONS_DETAIL_BID_LIMIT = int(os.getenv('AUCTIONS_DETAIL_BID_LIMIT', 50))
+
+# Maximum number of bids accepted by POST /api/bids/bulk/
+AUCTIONS_BULK_BID_LIMIT = int(os.getenv('AUCTIONS_BULK_BID_LIMIT', 1000))
+
+# Step used by proxy (maximum) bids when outbidding another bidder
+AUCTIONS_BID_INCREMENT = os.getenv('AUCTIONS_BID_INCREMENT', '1.00')
+
+# Optional in-process bid book (auctions/orderbook.py): bids are accepted in memory and written in batches.
+# Only enable where a single process serves the bids of a given auction.
+AUCTIONS_BID_BOOK = os.getenv('AUCTIONS_BID_BOOK', '0') == '1'
+AUCTIONS_BID_BOOK_SHARDS = int(os.getenv('AUCTIONS_BID_BOOK_SHARDS', 64))
+AUCTIONS_BID_BOOK_FLUSH_SIZE = int(os.getenv('AUCTIONS_BID_BOOK_FLUSH_SIZE', 500))
+
+# Seconds the auto-close scheduler waits past a lot's end_time before closing it (auctions/scheduler.py)
+AUCTIONS_CLOSE_GRACE = float(os.getenv('AUCTIONS_CLOSE_GRACE', 2))
+
+# Worker pool that sends "auction ended" notifications after close_auction (auctions/fanout.py)
+AUCTIONS_FANOUT_WORKERS = int(os.getenv('AUCTIONS_FANOUT_WORKERS', 4))
+AUCTIONS_FANOUT_CHUNK_SIZE = int(os.getenv('AUCTIONS_FANOUT_CHUNK_SIZE', 500))
+
+# Bid streaming (GET /api/products/<id>/events/, auctions/events.py). 'auto' fans events out across processes
+# with Postgres LISTEN/NOTIFY and falls back to the single-process LocalBroker on other databases.
+AUCTIONS_EVENT_BROKER = os.getenv('AUCTIONS_EVENT_BROKER', 'auto')
+AUCTIONS_EVENT_QUEUE_SIZE = int(os.getenv('AUCTIONS_EVENT_QUEUE_SIZE', 100))
+AUCTIONS_EVENT_HEARTBEAT = int(os.getenv('AUCTIONS_EVENT_HEARTBEAT', 15))
+
+# Versioned response cache for product/category reads (auctions/caching.py); only used with a shared cache
+AUCTIONS_CACHE_ALIAS = 'default'
+AUCTIONS_CACHE_TIMEOUT = int(os.getenv('AUCTIONS_CACHE_TIMEOUT', 300))
+
+# Read product/bid pages with .values() and precompiled converters instead of DRF serializers (auctions/fast_serializers.py)
+AUCTIONS_FAST_SERIALIZERS = os.getenv('AUCTIONS_FAST_SERIALIZERS', '0') == '1'
+
+# Closed lots that ended this many days ago are moved to the archive tables by `manage.py archive_auctions`
+AUCTIONS_ARCHIVE_AFTER_DAYS = int(os.getenv('AUCTIONS_ARCHIVE_AFTER_DAYS', 180))
+
+# Product photos (auctions/images.py): originals are stored once per content hash and resized off-request
+# into these sizes (longest side, px), each as JPEG and WebP
+AUCTIONS_IMAGE_VARIANTS = {'thumb': 320, 'medium': 960}
+AUCTIONS_IMAGE_QUALITY = int(os.getenv('AUCTIONS_IMAGE_QUALITY', 80))
+AUCTIONS_IMAGE_WORKERS = int(os.getenv('AUCTIONS_IMAGE_WORKERS', 2))
+AUCTIONS_IMAGE_MAX_ATTEMPTS = int(os.getenv('AUCTIONS_IMAGE_MAX_ATTEMPTS', 3))
+
+# Product search (auctions/search.py): 'auto' uses Postgres full-text search on Postgres, the in-process index otherwise
+AUCTIONS_SEARCH_BACKEND = os.getenv('AUCTIONS_SEARCH_BACKEND', 'auto')
+AUCTIONS_SEARCH_CONFIG = 'english'
 
 # Stripe settings - set in .env
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', 'sk_test_your_secret')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', 'whsec_...')
+PAYMENTS_CURRENCY = 'usd'
+# Stripe events are stored on receipt and processed in batches by payments/webhooks.py workers
+PAYMENTS_WEBHOOK_WORKERS = int(os.getenv('PAYMENTS_WEBHOOK_WORKERS', 2))
+PAYMENTS_WEBHOOK_BATCH_SIZE = int(os.getenv('PAYMENTS_WEBHOOK_BATCH_SIZE', 500))
 
 # Use custom user model
 AUTH_USER_MODEL = 'users.User'
@@ -117,3 +206,36 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', '0') == '1'
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'no-reply@auctioncraft.local')
+
+# OTP codes: at most OTP_MAX_ACTIVE recent codes per email are accepted. Throttles are token buckets
+# (capacity, refill period in seconds) per client IP and per requested email (users/throttling.py).
+OTP_MAX_ACTIVE = 5
+OTP_THROTTLE = {
+    'otp_request': {'ip': (20, 3600), 'email': (5, 3600)},
+    'otp_verify': {'ip': (60, 3600), 'email': (10, 600)},
+}
+
+# Notifications older than this are deleted by `manage.py prune_notifications`
+NOTIFICATIONS_TTL_DAYS = int(os.getenv('NOTIFICATIONS_TTL_DAYS', 180))
+
+# Email outbox (users/outbox.py): mail is queued in the database and sent by background workers
+OUTBOX_EMAIL_BACKEND = os.getenv('OUTBOX_EMAIL_BACKEND', '') or None  # defaults to EMAIL_BACKEND
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 2))
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_RETRY_DELAY = int(os.getenv('OUTBOX_RETRY_DELAY', 30))  # seconds, doubled on every failed attempt
+OUTBOX_RATE_LIMIT = int(os.getenv('OUTBOX_RATE_LIMIT', 10))  # messages per recipient per OUTBOX_RATE_WINDOW seconds
+OUTBOX_RATE_WINDOW = int(os.getenv('OUTBOX_RATE_WINDOW', 60))
+OUTBOX_SENT_TTL_DAYS = int(os.getenv('OUTBOX_SENT_TTL_DAYS', 7))  # sent rows (bodies already blanked) kept this long
+
+# Per-request timing (auctioncraft_api/instrumentation.py), scraped from /metrics. Without a token /metrics
+# only answers INTERNAL_IPS and localhost. Requests slower than INSTRUMENTATION_SLOW_MS are logged on
+# `auctioncraft.slow_requests`, sampled at INSTRUMENTATION_SLOW_SAMPLE_RATE.
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', '0') == '1'
+INSTRUMENTATION_METRICS_TOKEN = os.getenv('INSTRUMENTATION_METRICS_TOKEN', '')
+INSTRUMENTATION_SLOW_MS = int(os.getenv('INSTRUMENTATION_SLOW_MS', 1000))
+INSTRUMENTATION_SLOW_SAMPLE_RATE = float(os.getenv('INSTRUMENTATION_SLOW_SAMPLE_RATE', 0.1))
+INSTRUMENTATION_HOOKS = {
+    'email': ['django.core.mail.EmailMessage.send'],
+    'stripe': ['stripe.PaymentIntent.create', 'stripe.PaymentIntent.retrieve'],
+}
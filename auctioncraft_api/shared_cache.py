@@ -0,0 +1,19 @@
+"""Whether a cache is seen by every process of the deployment.
+
+Gunicorn runs several workers, and the scheduler and management commands run in processes of their
+own. State one process writes for the others to read (response cache version tokens, replica pins,
+token revocations) only works on a shared backend such as Redis (REDIS_URL); a local-memory cache
+is private to each process. Features that depend on it check `is_shared` and fall back otherwise.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+PROCESS_LOCAL_BACKENDS = ('LocMemCache', 'DummyCache')
+
+
+def is_shared(alias='default'):
+    """CACHE_SHARED when set, otherwise whether the alias uses a backend other than local memory."""
+    shared = getattr(settings, 'CACHE_SHARED', None)
+    if shared is not None:
+        return shared
+    return type(caches[alias]).__name__ not in PROCESS_LOCAL_BACKENDS
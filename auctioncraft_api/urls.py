@@ -1,9 +1,12 @@
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
 from auctions import views as auction_views
 from users import views as user_views
 from payments import views as payment_views
+from . import instrumentation
 
 router = routers.DefaultRouter()
 router.register(r'products', auction_views.ProductViewSet, basename='product')
@@ -12,8 +15,15 @@ router.register(r'categories', auction_views.CategoryViewSet, basename='category
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/products/<int:pk>/events/', auction_views.product_events, name='product_events'),
+    path('api/cache/stats/', auction_views.cache_stats, name='cache_stats'),
+    path('api/exports/<str:kind>.<str:output>', auction_views.ExportView.as_view(), name='export'),
     path('api/', include(router.urls)),
     path('api/auth/', include('users.urls')),
     path('api/payments/', include('payments.urls')),
     path('api/stripe/webhook/', payment_views.stripe_webhook),
+    path('metrics', instrumentation.metrics_view, name='metrics'),
 ]
+
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
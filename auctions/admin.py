@@ -1,6 +1,25 @@
 from django.contrib import admin
-from .models import Category, Product, Bid
+from .models import Category, Product, ProductImage, Bid, ProxyBid, NotificationFanout, ArchivedProduct, ArchivedBid
 
 admin.site.register(Category)
-admin.site.register(Product)
-admin.site.register(Bid)
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('title', 'seller', 'current_price', 'bid_count', 'end_time', 'is_active')
+    list_filter = ('is_active',)
+    search_fields = ('title',)
+    # these tables are large: pick rows by id instead of rendering every one in a <select>
+    raw_id_fields = ('seller', 'leading_bid', 'proxy_bidder', 'image_asset')
+    # maintained with every accepted bid (auctions/services.py); repair with `manage.py rebuild_bid_stats`
+    readonly_fields = ('bid_count', 'unique_bidder_count', 'last_bid_at')
+
+admin.site.register(ProductImage)
+
+@admin.register(Bid)
+class BidAdmin(admin.ModelAdmin):
+    list_display = ('product', 'bidder', 'amount', 'timestamp')
+    raw_id_fields = ('product', 'bidder')
+admin.site.register(ProxyBid)
+admin.site.register(NotificationFanout)
+admin.site.register(ArchivedProduct)
+admin.site.register(ArchivedBid)
@@ -0,0 +1,78 @@
+"""Lifecycle of closed auctions: lots that ended more than AUCTIONS_ARCHIVE_AFTER_DAYS ago are moved, with
+their bids, from Product/Bid into ArchivedProduct/ArchivedBid, keeping their ids.
+
+Each batch is one transaction: the lots are locked (SKIP LOCKED, so runs can overlap), copied and
+deleted together, so an interrupted run leaves every lot either fully hot or fully archived and the
+next run simply continues. Bids are copied and deleted in chunks to bound memory on busy lots.
+Lots whose notification fanout is still running or whose order is still awaiting payment stay put.
+
+The hot tables and their indexes then only hold open and recently closed lots. The product detail
+endpoint falls back to `product_detail` for archived ids.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from payments.models import Order
+from .models import Product, Bid, ArchivedProduct, ArchivedBid
+
+PRODUCT_FIELDS = ('id', 'seller_id', 'title', 'description', 'category_id', 'starting_price', 'current_price',
+                  'start_time', 'end_time', 'image', 'image_asset_id', 'created_at', 'bid_count',
+                  'unique_bidder_count', 'leading_bid_id', 'last_bid_at')
+BID_FIELDS = ('id', 'product_id', 'bidder_id', 'amount', 'timestamp')
+
+
+def cutoff(days=None):
+    days = days if days is not None else getattr(settings, 'AUCTIONS_ARCHIVE_AFTER_DAYS', 180)
+    return timezone.now() - timedelta(days=days)
+
+
+def candidates(ended_before):
+    """Closed lots that ended before `ended_before` and have nothing left to do."""
+    return (Product.objects.filter(is_active=False, end_time__lt=ended_before)
+            .filter(Q(fanout__isnull=True) | Q(fanout__completed_at__isnull=False))
+            .exclude(order__status=Order.PENDING))
+
+
+def archive_batch(ended_before, batch_size=200, bid_chunk_size=5000):
+    """Move one batch of lots. Returns (lots, bids) moved; (0, 0) when nothing is left."""
+    with transaction.atomic():
+        rows = list(candidates(ended_before).select_for_update(skip_locked=True, of=('self',))
+                    .order_by('end_time', 'id').values(*PRODUCT_FIELDS)[:batch_size])
+        if not rows:
+            return 0, 0
+        ids = [row['id'] for row in rows]
+        ArchivedProduct.objects.bulk_create([ArchivedProduct(**row) for row in rows], ignore_conflicts=True)
+        Product.objects.filter(pk__in=ids).exclude(leading_bid=None).update(leading_bid=None)
+        bids = 0
+        while True:
+            chunk = list(Bid.objects.filter(product_id__in=ids).order_by('id').values_list(*BID_FIELDS)[:bid_chunk_size])
+            if not chunk:
+                break
+            ArchivedBid.objects.bulk_create([ArchivedBid(**dict(zip(BID_FIELDS, bid))) for bid in chunk], ignore_conflicts=True)
+            Bid.objects.filter(pk__in=[bid[0] for bid in chunk]).delete()
+            bids += len(chunk)
+        # cascades to proxy bids and the finished fanout job; signals drop the lots from caches and search
+        Product.objects.filter(pk__in=ids).delete()
+    return len(ids), bids
+
+
+def archive(ended_before, batch_size=200):
+    """Archive every eligible lot, batch by batch. Returns (lots, bids) moved."""
+    lots = bids = 0
+    while True:
+        moved_lots, moved_bids = archive_batch(ended_before, batch_size)
+        if not moved_lots:
+            return lots, bids
+        lots += moved_lots
+        bids += moved_bids
+
+
+def product_detail(pk, request=None):
+    """Detail payload for an archived lot (same shape as the live one), or None."""
+    from .serializers import ArchivedProductSerializer
+    product = ArchivedProduct.objects.select_related('seller', 'image_asset').filter(pk=pk).first()
+    if product is None:
+        return None
+    return ArchivedProductSerializer(product, context={'request': request}).data
@@ -0,0 +1,134 @@
+"""Versioned response cache for product and category reads.
+
+Every product and the category list carry a version token kept in the cache. Cached payloads are
+stored under keys that include the token, so invalidating is just replacing the token: stale
+entries become unreachable and age out of the LRU. Tokens are random, never counters, so an
+evicted token cannot come back with a value that matches old entries.
+
+- Product rows (list items) and detail bodies are keyed by the product's version; a bid, edit or
+  close bumps only that product.
+- A list page is cached as the ids it contains (plus its pagination links), keyed by the list
+  version, which only changes when membership or order can change (create, edit, delete, close).
+  Orderings that move with every bid (bid_count, current_price, last_bid_at) are not cached.
+- Payloads are stored under tokens read *before* the query that loads them: a bump committed in
+  between then files the stale payload under the old, unreachable token. A page's rows are not known
+  before its query, so they are cached when a later hit loads the missing rows by id.
+- Detail responses carry an ETag built from the version, so If-None-Match is answered with 304
+  without touching the database or the serializer.
+
+Tokens are bumped by whichever process takes the bid or closes the lot (a web worker, the
+scheduler), so responses are only cached when that cache is shared by all of them (`enabled`).
+With a per-process cache every read goes to the database and no ETag is sent.
+"""
+import threading
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from auctioncraft_api import shared_cache
+
+CACHEABLE_ORDERINGS = {None, '', 'created_at', '-created_at', 'end_time', '-end_time'}
+
+_stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+_stats_lock = threading.Lock()
+
+
+def alias():
+    return getattr(settings, 'AUCTIONS_CACHE_ALIAS', 'default')
+
+
+def get_cache():
+    return caches[alias()]
+
+
+def enabled():
+    """Cache responses only when every process sees the same version tokens."""
+    return shared_cache.is_shared(alias())
+
+
+def timeout():
+    return getattr(settings, 'AUCTIONS_CACHE_TIMEOUT', 300)
+
+
+def record(kind, n=1):
+    with _stats_lock:
+        _stats[kind] += n
+
+
+def stats():
+    with _stats_lock:
+        data = dict(_stats)
+    lookups = data['hits'] + data['misses']
+    data['hit_rate'] = round(data['hits'] / lookups, 4) if lookups else None
+    return data
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+def versions(names):
+    """Current version token for each name, minting tokens for names the cache has not seen (or evicted)."""
+    cache = get_cache()
+    keys = {name: f'ver:{name}' for name in names}
+    found = cache.get_many(keys.values())
+    result, missing = {}, {}
+    for name, key in keys.items():
+        if key in found:
+            result[name] = found[key]
+        else:
+            result[name] = missing[key] = _new_token()
+    if missing:
+        cache.set_many(missing, None)
+    return result
+
+
+def version(name):
+    return versions([name])[name]
+
+
+def bump(*names):
+    """Invalidate everything cached under these names once the current transaction commits."""
+    def _bump():
+        get_cache().set_many({f'ver:{name}': _new_token() for name in names}, None)
+    transaction.on_commit(_bump)
+
+
+def bump_products(product_ids, membership=False):
+    names = [f'product:{pk}' for pk in product_ids]
+    if membership:
+        names.append('product-list')
+    if names:
+        bump(*names)
+
+
+def list_cacheable(request):
+    return enabled() and request.query_params.get('ordering') in CACHEABLE_ORDERINGS
+
+
+def list_key(request):
+    return f"products:list:{version('product-list')}:{request.get_full_path()}"
+
+
+def row_versions(product_ids):
+    return versions([f'product:{pk}' for pk in product_ids])
+
+
+def get_rows(product_ids, vers):
+    """Cached list rows by product id (only the ones present), for tokens from `row_versions`."""
+    keys = {f"row:{pk}:{vers[f'product:{pk}']}": pk for pk in product_ids}
+    found = get_cache().get_many(keys.keys())
+    return {keys[key]: row for key, row in found.items()}
+
+
+def set_rows(rows, vers):
+    """Cache rows under tokens read before they were queried."""
+    get_cache().set_many({f"row:{pk}:{vers[f'product:{pk}']}": row for pk, row in rows.items()}, timeout())
+
+
+def detail_etag(product_id):
+    return f'"p{product_id}-{version(f"product:{product_id}")}"'
+
+
+def category_list_key(request):
+    return f"categories:list:{version('category-list')}:{request.get_full_path()}"
@@ -0,0 +1,209 @@
+"""Per-auction event fan-out for the streaming endpoint (GET /api/products/<id>/events/).
+
+Writers (bid placement, auction close) publish small delta events through the configured broker,
+picked by AUCTIONS_EVENT_BROKER ('auto' chooses by database vendor, like the search backend):
+
+- PostgresBroker: NOTIFY on the default database; every process serving streams LISTENs on one
+  extra connection and hands what arrives to its Hub. Bids taken by any web worker and closes made
+  by the scheduler process reach every subscriber.
+- LocalBroker: hands events straight to this process's Hub, so subscribers only see events published
+  by the same process. docker-entrypoint.sh refuses to start several ASGI workers with it.
+
+Any other dotted path works as long as it ends up calling `hub.dispatch` in every process.
+
+Each subscriber owns a bounded asyncio queue. Frames are encoded once per event and delivered with
+one call_soon_threadsafe per event loop, not per subscriber. A consumer that falls behind has its
+backlog replaced by a single `resync` event (refetch the lot) instead of buffering without bound.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def sse_frame(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+RESYNC = sse_frame('resync', {})
+
+
+class Subscription:
+    def __init__(self, product_id, maxsize):
+        self.product_id = product_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def offer(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # slow consumer: drop what it has not read yet and tell it to refetch the lot
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+def _deliver(subscriptions, frame):
+    for sub in subscriptions:
+        sub.offer(frame)
+
+
+class Hub:
+    def __init__(self):
+        self._subs = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, product_id, maxsize=None):
+        """Register a subscriber; must be called from the event loop that will consume it."""
+        sub = Subscription(int(product_id), maxsize or getattr(settings, 'AUCTIONS_EVENT_QUEUE_SIZE', 100))
+        with self._lock:
+            self._subs[sub.product_id].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.product_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.product_id]
+
+    def subscriber_count(self, product_id=None):
+        with self._lock:
+            if product_id is not None:
+                return len(self._subs.get(int(product_id), ()))
+            return sum(len(s) for s in self._subs.values())
+
+    def product_ids(self):
+        with self._lock:
+            return list(self._subs)
+
+    def dispatch(self, product_id, frame):
+        """Deliver an encoded frame to every local subscriber of the lot. Safe to call from any thread."""
+        with self._lock:
+            subs = list(self._subs.get(int(product_id), ()))
+        by_loop = defaultdict(list)
+        for sub in subs:
+            by_loop[sub.loop].append(sub)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, group, frame)
+            except RuntimeError:
+                # the subscriber's loop has shut down; its stream is gone
+                pass
+
+
+hub = Hub()
+
+
+class LocalBroker:
+    """Delivers events to subscribers in this process only."""
+    def publish(self, product_id, frame):
+        hub.dispatch(product_id, frame)
+
+    def listen(self):
+        pass
+
+
+CHANNEL = 'auction_events'
+
+
+def receive(payload):
+    """Dispatch a NOTIFY payload written by PostgresBroker.publish to this process's subscribers."""
+    product_id, frame = json.loads(payload)
+    hub.dispatch(product_id, frame)
+
+
+class PostgresBroker:
+    """Fans events out to every process through LISTEN/NOTIFY on the `using` database.
+
+    `publish` only sends the NOTIFY; the publishing process gets its own events back through its
+    listener like everyone else. Notifications sent while a listener is reconnecting are lost, so
+    after a reconnect each local subscriber gets a `resync`.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, product_id, frame):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps([int(product_id), frame])])
+
+    def listen(self):
+        """Start this process's listener thread once; called by the streaming view before it subscribes."""
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    self._listener = threading.Thread(target=self._run, name='auction-events', daemon=True)
+                    self._listener.start()
+
+    def _run(self):
+        reconnect = False
+        while True:
+            conn = None
+            try:
+                wrapper = connections[self.using]
+                conn = wrapper.get_new_connection(wrapper.get_connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                if reconnect:
+                    for product_id in hub.product_ids():
+                        hub.dispatch(product_id, RESYNC)
+                reconnect = True
+                while True:  # psycopg2's notification API (requirements.txt)
+                    if select.select([conn], [], [], 5)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            receive(conn.notifies.pop(0).payload)
+            except Exception:
+                logger.exception('auction event listener failed; reconnecting')
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+_broker = None
+
+
+def broker_path():
+    path = getattr(settings, 'AUCTIONS_EVENT_BROKER', 'auto')
+    if path == 'auto':
+        vendor = connection.vendor
+        path = 'auctions.events.PostgresBroker' if vendor == 'postgresql' else 'auctions.events.LocalBroker'
+    return path
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(broker_path())()
+    return _broker
+
+
+def publish(product_id, event_type, data):
+    get_broker().publish(product_id, sse_frame(event_type, data))
+
+
+def publish_on_commit(product_id, event_type, data):
+    transaction.on_commit(lambda: publish(product_id, event_type, data))
+
+
+def bid_event(bid):
+    return {'id': bid.pk, 'product': bid.product_id, 'bidder': bid.bidder_id,
+            'amount': str(bid.amount), 'timestamp': bid.timestamp.isoformat()}
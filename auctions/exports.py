@@ -0,0 +1,164 @@
+"""Bulk export of bid histories and auction results as CSV or JSON Lines, in constant memory.
+
+Rows are read with `.values_list().iterator(chunk_size=...)` (a server-side cursor on Postgres) and
+rendered a chunk at a time, so the export endpoint (StreamingHttpResponse) and `manage.py
+export_auctions` hold one chunk in memory however many rows there are. Archived lots
+(auctions/archive.py) are included after the live ones.
+
+Filters: seller, category (id or slug), product, and a date range on the bid time (bids) or the
+auction end time (results). `manage.py bench_export` seeds bids and checks memory stays flat.
+"""
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal
+from django.db.models import BooleanField, Case, F, OuterRef, Subquery, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from payments.models import Order
+from .models import Category, Product, Bid, ArchivedProduct, ArchivedBid
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+BID_COLUMNS = ('bid_id', 'product_id', 'product_title', 'seller_id', 'category_id', 'bidder_id', 'bidder_username',
+               'amount', 'timestamp', 'is_leading', 'archived')
+RESULT_COLUMNS = ('product_id', 'title', 'seller_id', 'seller_username', 'category_id', 'starting_price', 'final_price',
+                  'start_time', 'end_time', 'is_active', 'bid_count', 'unique_bidder_count', 'leading_bid_id',
+                  'leading_bidder_id', 'leading_bidder_username', 'order_status', 'archived')
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_moment(value, end=False):
+    """A datetime from an ISO date or datetime; a bare date covers the whole day."""
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+        moment = (datetime.combine(day, datetime.max.time() if end else datetime.min.time()) if day
+                  else parse_datetime(value))
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ExportError(f'Invalid date: {value}')
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def resolve_filters(seller=None, category=None, product=None, since=None, until=None):
+    """Validate raw filter values (query parameters or command options) into a dict for `rows`."""
+    filters = {}
+    try:
+        if seller not in (None, ''):
+            filters['seller'] = int(seller)
+        if product not in (None, ''):
+            filters['product'] = int(product)
+    except (TypeError, ValueError):
+        raise ExportError('seller and product must be ids.')
+    if category not in (None, ''):
+        category_id = (int(category) if str(category).isdigit()
+                       else Category.objects.filter(slug=category).values_list('pk', flat=True).first())
+        if category_id is None:
+            raise ExportError(f'Unknown category: {category}')
+        filters['category'] = category_id
+    filters['since'] = parse_moment(since)
+    filters['until'] = parse_moment(until, end=True)
+    return filters
+
+
+def _bids(model, archived, filters):
+    queryset = model.objects.all()
+    if filters.get('seller') is not None:
+        queryset = queryset.filter(product__seller_id=filters['seller'])
+    if filters.get('category') is not None:
+        queryset = queryset.filter(product__category_id=filters['category'])
+    if filters.get('product') is not None:
+        queryset = queryset.filter(product_id=filters['product'])
+    if filters.get('since'):
+        queryset = queryset.filter(timestamp__gte=filters['since'])
+    if filters.get('until'):
+        queryset = queryset.filter(timestamp__lte=filters['until'])
+    return (queryset.annotate(is_leading=Case(When(product__leading_bid_id=F('id'), then=True), default=False,
+                                              output_field=BooleanField()), archived=Value(archived))
+            .order_by('id')
+            .values_list('id', 'product_id', 'product__title', 'product__seller_id', 'product__category_id',
+                         'bidder_id', 'bidder__username', 'amount', 'timestamp', 'is_leading', 'archived'))
+
+
+def _results(model, archived, filters):
+    queryset = model.objects.all()
+    if filters.get('seller') is not None:
+        queryset = queryset.filter(seller_id=filters['seller'])
+    if filters.get('category') is not None:
+        queryset = queryset.filter(category_id=filters['category'])
+    if filters.get('product') is not None:
+        queryset = queryset.filter(pk=filters['product'])
+    if filters.get('since'):
+        queryset = queryset.filter(end_time__gte=filters['since'])
+    if filters.get('until'):
+        queryset = queryset.filter(end_time__lte=filters['until'])
+    order_status = Subquery(Order.objects.filter(product_id=OuterRef('pk')).values('status')[:1])
+    if archived:
+        leading = ArchivedBid.objects.filter(pk=OuterRef('leading_bid_id'))
+        queryset = queryset.annotate(is_active=Value(False), leading_bidder_id=Subquery(leading.values('bidder_id')[:1]),
+                                     leading_bidder_username=Subquery(leading.values('bidder__username')[:1]))
+    else:
+        queryset = queryset.annotate(leading_bidder_id=F('leading_bid__bidder_id'),
+                                     leading_bidder_username=F('leading_bid__bidder__username'))
+    return (queryset.annotate(order_status=order_status, archived=Value(archived)).order_by('pk')
+            .values_list('pk', 'title', 'seller_id', 'seller__username', 'category_id', 'starting_price',
+                         'current_price', 'start_time', 'end_time', 'is_active', 'bid_count', 'unique_bidder_count',
+                         'leading_bid_id', 'leading_bidder_id', 'leading_bidder_username', 'order_status', 'archived'))
+
+
+def rows(kind, filters, using=None, chunk_size=2000):
+    """(columns, row iterator) for 'bids' or 'results'; live rows first, then archived ones."""
+    if kind == 'bids':
+        columns, build, sources = BID_COLUMNS, _bids, ((Bid, False), (ArchivedBid, True))
+    elif kind == 'results':
+        columns, build, sources = RESULT_COLUMNS, _results, ((Product, False), (ArchivedProduct, True))
+    else:
+        raise ExportError(f'Unknown export: {kind}')
+
+    def iterate():
+        for model, archived in sources:
+            queryset = build(model, archived, filters)
+            if using:
+                queryset = queryset.using(using)
+            yield from queryset.iterator(chunk_size=chunk_size)
+    return columns, iterate()
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class _Echo:
+    """File-like object for csv.writer that hands each line back instead of buffering it."""
+    def write(self, value):
+        return value
+
+
+def render(columns, rows, output, lines_per_chunk=1000):
+    """Yield the export as text chunks of about `lines_per_chunk` lines."""
+    if output not in FORMATS:
+        raise ExportError(f'Unknown format: {output}')
+    if output == 'csv':
+        writer = csv.writer(_Echo())
+        line = lambda row: writer.writerow([_plain(v) for v in row])
+        yield line(columns)
+    else:
+        line = lambda row: json.dumps(dict(zip(columns, map(_plain, row)))) + '\n'
+    chunk = []
+    for row in rows:
+        chunk.append(line(row))
+        if len(chunk) >= lines_per_chunk:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
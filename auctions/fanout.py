@@ -0,0 +1,92 @@
+"""Off-request "auction ended" notifications.
+
+close_auction only records a NotificationFanout row; a local worker pool then walks the bidders
+in id order, creating Notification rows and queueing their emails in the outbox (users/outbox.py)
+with bulk_create, chunk by chunk. The cursor is committed together with each chunk's notifications
+and emails, so a job resumed after a crash never notifies anyone twice.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from users.models import User, Notification
+from users import outbox, services as user_services
+from .models import NotificationFanout
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'AUCTIONS_FANOUT_WORKERS', 4), thread_name_prefix='fanout')
+    return _executor
+
+
+def enqueue(fanout):
+    """Schedule a job once the surrounding transaction has committed."""
+    transaction.on_commit(lambda: get_executor().submit(_run_in_worker, fanout.pk))
+
+
+def _run_in_worker(fanout_id):
+    try:
+        run(fanout_id)
+    except Exception:
+        logger.exception('notification fanout %s failed; it will be resumed by run_fanouts', fanout_id)
+    finally:
+        close_old_connections()
+
+
+def build_message(product, winning_bid, user_id):
+    if winning_bid and user_id == winning_bid.bidder_id:
+        title = f"You won the auction for '{product.title}'!"
+        message = f"Congratulations! You are the winner of the auction '{product.title}' with a bid of {winning_bid.amount}. Please follow up with the seller to complete the transaction."
+    else:
+        title = f"Auction ended: '{product.title}'"
+        winner_info = f"Winner: {winning_bid.bidder.username} with {winning_bid.amount}" if winning_bid else "No winner (no bids)"
+        message = f"The auction '{product.title}' has ended. {winner_info}. Thank you for participating."
+    return title, message
+
+
+def run(fanout_id, chunk_size=None):
+    chunk_size = chunk_size or getattr(settings, 'AUCTIONS_FANOUT_CHUNK_SIZE', 500)
+    fanout = NotificationFanout.objects.select_related('product', 'winning_bid__bidder').get(pk=fanout_id)
+    if fanout.completed_at:
+        return
+    product, winning_bid = fanout.product, fanout.winning_bid
+    while True:
+        with transaction.atomic():
+            # the row lock keeps two runners of the same job from processing the same chunk
+            cursor = (NotificationFanout.objects.select_for_update()
+                      .filter(pk=fanout_id).values_list('last_bidder_id', flat=True).get())
+            bidders = list(User.objects
+                           .filter(bids__product_id=product.pk, id__gt=cursor)
+                           .distinct().order_by('id').values_list('id', 'email')[:chunk_size])
+            if not bidders:
+                break
+            notifications, mails = [], []
+            for user_id, email in bidders:
+                title, message = build_message(product, winning_bid, user_id)
+                notifications.append(Notification(user_id=user_id, title=title, message=message))
+                mails.append((email, title, message))
+            user_services.notify_many(notifications)
+            outbox.enqueue_many(mails)
+            NotificationFanout.objects.filter(pk=fanout_id).update(
+                last_bidder_id=bidders[-1][0], notified_count=F('notified_count') + len(bidders))
+    NotificationFanout.objects.filter(pk=fanout_id).update(completed_at=timezone.now())
+
+
+def resume_pending():
+    """Run every job that has not completed yet (e.g. after a crash or restart). Returns the number run."""
+    pending = list(NotificationFanout.objects.filter(completed_at__isnull=True).values_list('pk', flat=True))
+    for fanout_id in pending:
+        run(fanout_id)
+    return len(pending)
@@ -0,0 +1,127 @@
+"""Read-only fast path for ProductListSerializer, ProductDetailSerializer and BidSerializer.
+
+Rows are read with `.values()` (seller/bidder joined in the same query) and turned into the same
+JSON shape the DRF serializers produce, using a converter table compiled once per serializer
+instead of per-field Field objects. Enabled with the AUCTIONS_FAST_SERIALIZERS setting;
+parity with the DRF serializers is tested in auctions/tests.py, `manage.py bench_serializers` reports rows/sec.
+"""
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+USER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'phone')
+
+
+def enabled():
+    return getattr(settings, 'AUCTIONS_FAST_SERIALIZERS', False)
+
+
+def as_decimal(value):
+    return None if value is None else format(value, '.2f')
+
+
+def as_datetime(value):
+    # same output as rest_framework.fields.DateTimeField with the default ISO format
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def compile_row(spec, nested=()):
+    """Build a function turning a `.values()` dict into an output dict.
+
+    `spec` is a sequence of (output key, values() key, converter or None); entries with a values() key
+    of None are embedded objects described by `nested` as (output key, values() prefix, field names).
+    """
+    plain = tuple((out, src) for out, src, conv in spec if src is not None and conv is None)
+    converted = tuple((out, src, conv) for out, src, conv in spec if src is not None and conv is not None)
+    embedded = tuple((out, tuple((f, f'{prefix}__{f}') for f in fields)) for out, prefix, fields in nested)
+    order = tuple(out for out, _, _ in spec)
+
+    def build(row, request=None):
+        data = {out: row[src] for out, src in plain}
+        for out, src, conv in converted:
+            data[out] = conv(row[src], request)
+        for out, pairs in embedded:
+            data[out] = {f: row[src] for f, src in pairs}
+        return {key: data[key] for key in order}
+    return build
+
+
+def _decimal(value, request):
+    return as_decimal(value)
+
+
+def _datetime(value, request):
+    return as_datetime(value)
+
+
+def _image(value, request):
+    if not value:
+        return None
+    url = default_storage.url(value)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def _variants(value, request):
+    from .images import variant_urls
+    return variant_urls(value, request)
+
+
+PRODUCT_SPEC = (
+    ('id', 'id', None),
+    ('title', 'title', None),
+    ('description', 'description', None),
+    ('category', 'category_id', None),
+    ('starting_price', 'starting_price', _decimal),
+    ('current_price', 'current_price', _decimal),
+    ('start_time', 'start_time', _datetime),
+    ('end_time', 'end_time', _datetime),
+    ('is_active', 'is_active', None),
+    ('seller', None, None),
+    ('image', 'image', _image),
+    ('images', 'image_asset__variants', _variants),
+    ('bid_count', 'bid_count', None),
+    ('unique_bidder_count', 'unique_bidder_count', None),
+    ('leading_bid', 'leading_bid_id', None),
+    ('last_bid_at', 'last_bid_at', _datetime),
+)
+BID_SPEC = (
+    ('id', 'id', None),
+    ('product', 'product_id', None),
+    ('bidder', None, None),
+    ('amount', 'amount', _decimal),
+    ('timestamp', 'timestamp', _datetime),
+)
+
+_product_row = compile_row(PRODUCT_SPEC, nested=(('seller', 'seller', USER_FIELDS),))
+_bid_row = compile_row(BID_SPEC, nested=(('bidder', 'bidder', USER_FIELDS),))
+
+# columns to pass to .values(); created_at is included for the default cursor ordering
+PRODUCT_VALUES = tuple({src for _, src, _ in PRODUCT_SPEC if src} | {f'seller__{f}' for f in USER_FIELDS} | {'created_at'})
+BID_VALUES = tuple({src for _, src, _ in BID_SPEC if src} | {f'bidder__{f}' for f in USER_FIELDS})
+
+
+def product_rows(rows, request=None):
+    return [_product_row(row, request) for row in rows]
+
+
+def bid_rows(rows, request=None):
+    return [_bid_row(row, request) for row in rows]
+
+
+def product_detail(product_qs, request=None):
+    """Detail payload for a single-product queryset, or None if it is empty."""
+    from .models import Bid
+    row = product_qs.values(*PRODUCT_VALUES).first()
+    if row is None:
+        return None
+    data = _product_row(row, request)
+    limit = getattr(settings, 'AUCTIONS_DETAIL_BID_LIMIT', 50)
+    data['bids'] = bid_rows(Bid.objects.filter(product_id=row['id']).values(*BID_VALUES)[:limit], request)
+    return data
@@ -0,0 +1,187 @@
+"""Product photo pipeline: uploads are stored as-is and resized off-request.
+
+`attach` hashes the upload chunk by chunk (large uploads stay in Django's temporary file) and stores the
+original once under its SHA-256, so the same photo uploaded for many lots is kept and processed once.
+A local worker pool then renders every size in AUCTIONS_IMAGE_VARIANTS as JPEG and WebP:
+
+- ProductImage rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED and leased by pushing
+  `available_at` out, like the email outbox, so several workers or processes can drain;
+- JPEG originals are decoded at a reduced scale (Image.draft) when the largest variant allows it;
+- failures are retried AUCTIONS_IMAGE_MAX_ATTEMPTS times; once ready the products' cached rows are bumped.
+
+Variant names contain the content hash, so they can be served with a far-future Cache-Control.
+`manage.py process_images --loop` drains on a timer; `--rebuild` renders everything again after the
+sizes change.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import Product, ProductImage
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+FORMATS = (('jpeg', 'JPEG', {'optimize': True, 'progressive': True}), ('webp', 'WEBP', {'method': 4}))
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def sizes():
+    return getattr(settings, 'AUCTIONS_IMAGE_VARIANTS', {'thumb': 320, 'medium': 960})
+
+
+def store(upload):
+    """Store an uploaded file once per content hash and return its ProductImage."""
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    content_hash = digest.hexdigest()
+    asset = ProductImage.objects.filter(content_hash=content_hash).first()
+    if asset is not None:
+        return asset
+    ext = os.path.splitext(upload.name or '')[1].lower()
+    name = f'products/originals/{content_hash[:2]}/{content_hash}{ext if ext in EXTENSIONS else ""}'
+    if not default_storage.exists(name):
+        upload.seek(0)
+        name = default_storage.save(name, upload)
+    asset, created = ProductImage.objects.get_or_create(content_hash=content_hash, defaults={'original': name})
+    if created:
+        transaction.on_commit(wake)
+    return asset
+
+
+def attach(product, upload):
+    """Set (or with upload=None, clear) a product's photo."""
+    asset = store(upload) if upload else None
+    product.image = asset.original.name if asset else None
+    product.image_asset = asset
+    Product.objects.filter(pk=product.pk).update(image=product.image, image_asset=asset)
+    caching.bump_products([product.pk])
+
+
+def variant_urls(variants, request=None):
+    """{size: {format: url}} for a ProductImage.variants value, or None until the variants exist."""
+    if not variants:
+        return None
+    build = request.build_absolute_uri if request is not None else (lambda url: url)
+    return {size: {fmt: build(default_storage.url(name)) for fmt, name in formats.items()}
+            for size, formats in variants.items()}
+
+
+def get_executor():
+    global _executor, _slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'AUCTIONS_IMAGE_WORKERS', 2)
+                _slots = threading.BoundedSemaphore(workers)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+    return _executor
+
+
+def wake():
+    """Start a drain unless every worker is already busy (a busy worker keeps going until nothing is left)."""
+    executor = get_executor()
+    if _slots.acquire(blocking=False):
+        executor.submit(_drain_in_worker)
+
+
+def _drain_in_worker():
+    try:
+        drain()
+    except Exception:
+        logger.exception('image processing failed; process_images will pick the images up')
+    finally:
+        _slots.release()
+        close_old_connections()
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'AUCTIONS_IMAGE_LEASE', 300))
+    with transaction.atomic():
+        rows = list(ProductImage.objects.select_for_update(skip_locked=True)
+                    .filter(status=ProductImage.PENDING, available_at__lte=now)
+                    .order_by('available_at', 'id')[:batch_size])
+        if rows:
+            ProductImage.objects.filter(pk__in=[row.pk for row in rows]).update(available_at=now + lease)
+    return rows
+
+
+def drain(batch_size=10):
+    """Render pending images until none are left. Returns {'ready': n, 'failed': n, 'retry': n}."""
+    counts = {'ready': 0, 'failed': 0, 'retry': 0}
+    while True:
+        rows = _claim(batch_size)
+        if not rows:
+            return counts
+        for row in rows:
+            counts[process(row)] += 1
+
+
+def process(asset):
+    now = timezone.now()
+    try:
+        width, height, variants = render(asset.content_hash, asset.original.name)
+    except Exception as e:
+        logger.warning('image %s could not be processed: %s', asset.pk, e)
+        attempts = asset.attempts + 1
+        if attempts >= getattr(settings, 'AUCTIONS_IMAGE_MAX_ATTEMPTS', 3):
+            outcome, fields = 'failed', {'status': ProductImage.FAILED}
+        else:
+            outcome, fields = 'retry', {'available_at': now + timedelta(seconds=30 * 2 ** attempts)}
+        ProductImage.objects.filter(pk=asset.pk).update(attempts=attempts, last_error=repr(e)[:2000], **fields)
+        return outcome
+    ProductImage.objects.filter(pk=asset.pk).update(status=ProductImage.READY, width=width, height=height, variants=variants,
+                                                   attempts=asset.attempts + 1, last_error='', processed_at=now)
+    caching.bump_products(list(Product.objects.filter(image_asset=asset.pk).values_list('pk', flat=True)))
+    return 'ready'
+
+
+def render(content_hash, original):
+    """Write every size/format of an original to storage. Returns (width, height, variants)."""
+    from PIL import Image, ImageOps
+    quality = getattr(settings, 'AUCTIONS_IMAGE_QUALITY', 80)
+    largest = max(sizes().values())
+    with default_storage.open(original, 'rb') as f, Image.open(f) as image:
+        width, height = image.size
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):  # EXIF orientation rotated by 90 degrees
+            width, height = height, width
+        image.draft('RGB', (largest, largest))  # JPEG: let the decoder downscale by up to 8x
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'PA', 'P') else 'RGB')
+        variants = {}
+        for size_name, size in sizes().items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+            variants[size_name] = {}
+            for ext, fmt, options in FORMATS:
+                out = resized
+                if fmt == 'JPEG' and out.mode == 'RGBA':
+                    out = Image.new('RGB', out.size, 'white')
+                    out.paste(resized, mask=resized.getchannel('A'))
+                buffer = io.BytesIO()
+                out.save(buffer, fmt, quality=quality, **options)
+                name = f'products/variants/{content_hash[:2]}/{content_hash}/{size_name}.{ext}'
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                variants[size_name][ext] = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return width, height, variants
+
+
+def rebuild():
+    """Queue every stored image for rendering again (e.g. after changing AUCTIONS_IMAGE_VARIANTS)."""
+    return ProductImage.objects.update(status=ProductImage.PENDING, attempts=0, available_at=timezone.now())
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from auctions import archive
+
+
+class Command(BaseCommand):
+    help = 'Move closed lots older than AUCTIONS_ARCHIVE_AFTER_DAYS and their bids to the archive tables, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Override AUCTIONS_ARCHIVE_AFTER_DAYS.')
+        parser.add_argument('--batch-size', type=int, default=200, help='Lots per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the lots that would be archived.')
+
+    def handle(self, *args, **opts):
+        ended_before = archive.cutoff(opts['days'])
+        if opts['dry_run']:
+            self.stdout.write(f'{archive.candidates(ended_before).count()} lot(s) ended before {ended_before:%Y-%m-%d} can be archived.')
+            return
+        started = time.perf_counter()
+        lots, bids = archive.archive(ended_before, batch_size=opts['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{lots} lot(s) and {bids} bid(s) archived in {time.perf_counter() - started:.1f} s.'))
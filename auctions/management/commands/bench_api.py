@@ -0,0 +1,305 @@
+"""Load-test the API in-process with a synthetic or recorded request mix.
+
+    python manage.py bench_api --seed-users 2000 --seed-products 20000 --bids-per-product 5
+    python manage.py bench_api --requests 5000 --output bench/baseline.json
+    python manage.py bench_api --requests 5000 --compare bench/baseline.json --threshold 20
+
+Requests go through the full middleware stack and URL router (django.test.Client with JWT headers),
+so the numbers include authentication, routing, caching and serialization. For every endpoint it
+reports throughput, p50/p95/p99 latency and SQL queries per request (counted with
+connection.execute_wrapper, which does not need DEBUG).
+
+The synthetic mix is set with --mix (name=weight pairs; endpoints: browse, detail, search,
+place_bid, close_auction, otp, notifications). --record writes the requests as they are issued
+(one JSON object per line: endpoint, method, path, data, user); --replay sends such a file again
+instead of generating traffic. OTP throttling is switched off for the run because every request
+comes from one client address.
+
+--output writes a JSON baseline; --compare checks the run against one and fails when an endpoint's
+p95 is more than --threshold percent slower. Background workers (fanout, outbox) run as usual,
+so use Postgres for realistic write mixes.
+"""
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from auctions.models import Bid, Category, Product
+from auctions.search import get_backend
+from users.models import User
+
+DEFAULT_MIX = 'browse=35,detail=25,search=5,place_bid=20,close_auction=2,otp=5,notifications=8'
+ORDERINGS = (None, None, '-bid_count', 'end_time', '-current_price')
+WORDS = 'vintage antique lamp oak table chair silver watch gold ring leather bag painting camera guitar vase rug clock'.split()
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, p):
+    return values[min(int(len(values) * p), len(values) - 1)] if values else None
+
+
+class Traffic:
+    """Builds the next request of a synthetic mix, tracking lot prices so bids are mostly valid."""
+
+    def __init__(self, rng, users, lots):
+        self.rng = rng
+        self.users = users  # [(id, email)]
+        self.lots = lots  # {product id: [current price, seller id]} for open auctions
+        self.product_ids = list(lots)
+
+    def build(self, endpoint):
+        rng = self.rng
+        user_id, email = rng.choice(self.users)
+        if endpoint == 'browse':
+            params = {'page_size': 12}
+            ordering = rng.choice(ORDERINGS)
+            if ordering:
+                params['ordering'] = ordering
+            return 'GET', '/api/products/', params, rng.choice((None, user_id))
+        if endpoint == 'search':
+            return 'GET', '/api/products/search/', {'q': rng.choice(WORDS), 'active': '1'}, None
+        if endpoint == 'notifications':
+            if rng.random() < 0.3:
+                return 'GET', '/api/auth/notifications/unread_count/', {}, user_id
+            return 'GET', '/api/auth/notifications/', {'page_size': 20}, user_id
+        if endpoint == 'otp':
+            return 'POST', '/api/auth/otp/request/', {'email': email}, None
+        if not self.lots:
+            return None
+        if endpoint == 'detail':
+            return 'GET', f'/api/products/{rng.choice(self.product_ids)}/', {}, rng.choice((None, user_id))
+        pk = rng.choice(list(self.lots)) if len(self.lots) < 1000 else self._open_lot()
+        price, seller_id = self.lots[pk]
+        if endpoint == 'close_auction':
+            return 'POST', f'/api/products/{pk}/close_auction/', {}, seller_id
+        if user_id == seller_id:
+            return None
+        return 'POST', f'/api/products/{pk}/place_bid/', {'amount': str(price + rng.randint(1, 5))}, user_id
+
+    def _open_lot(self):
+        while True:
+            pk = self.rng.choice(self.product_ids)
+            if pk in self.lots:
+                return pk
+
+    def observe(self, endpoint, path, response):
+        """Keep the local view of open lots in step with what the API answered."""
+        if endpoint not in ('place_bid', 'close_auction'):
+            return
+        pk = int(path.split('/')[3])
+        if pk not in self.lots:
+            return
+        if endpoint == 'close_auction' or response.status_code in (400, 404):
+            self.lots.pop(pk, None)
+        elif response.status_code in (201, 202, 409):
+            body = response.json()
+            self.lots[pk][0] = Decimal(body.get('amount') or body.get('current_price') or self.lots[pk][0])
+
+
+class Command(BaseCommand):
+    help = 'In-process API load test: seed data, replay a request mix, report latency/throughput/queries per endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-users', type=int, default=0)
+        parser.add_argument('--seed-categories', type=int, default=10)
+        parser.add_argument('--seed-products', type=int, default=0)
+        parser.add_argument('--bids-per-product', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--warmup', type=int, default=100)
+        parser.add_argument('--mix', default=DEFAULT_MIX)
+        parser.add_argument('--active-users', type=int, default=500, help='How many users the mix authenticates as.')
+        parser.add_argument('--record', help='Write the issued requests to this JSONL file.')
+        parser.add_argument('--replay', help='Send the requests recorded in this JSONL file instead of a synthetic mix.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='Compare against a JSON baseline written by --output.')
+        parser.add_argument('--threshold', type=float, default=20, help='Allowed p95 slowdown in percent for --compare.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts['seed'])
+        if opts['seed_users'] or opts['seed_products']:
+            self.seed(opts, rng)
+        users = list(User.objects.filter(username__startswith='bench-api-').exclude(email='')
+                     .order_by('?').values_list('id', 'email')[:opts['active_users']])
+        if not users:
+            raise CommandError('No benchmark users; seed some with --seed-users.')
+        tokens = {}
+        lots = {pk: [price, seller_id] for pk, price, seller_id in Product.objects
+                .filter(is_active=True, end_time__gt=timezone.now() + timedelta(minutes=10), title__startswith='bench-api')
+                .values_list('pk', 'current_price', 'seller_id')}
+        traffic = Traffic(rng, users, lots)
+        client = Client()
+        counter = QueryCounter()
+        recorder = open(opts['record'], 'w') if opts['record'] else None
+        results = defaultdict(lambda: {'latency': [], 'queries': [], 'status': defaultdict(int)})
+        plan = self.recorded(opts['replay']) if opts['replay'] else self.synthetic(traffic, rng, opts)
+        started = None
+        request_log = logging.getLogger('django.request')
+        log_level = request_log.level
+        request_log.setLevel(logging.ERROR)  # expected 4xx (lost bid races, closed lots) would flood the output
+        try:
+            with override_settings(OTP_THROTTLE={}), connection.execute_wrapper(counter):
+                for index, (endpoint, method, path, data, user_id) in enumerate(plan):
+                    if index == opts['warmup']:
+                        started = time.perf_counter()
+                    headers = {}
+                    if user_id is not None:
+                        if user_id not in tokens:
+                            tokens[user_id] = f'Bearer {AccessToken.for_user(User(pk=user_id))}'
+                        headers['HTTP_AUTHORIZATION'] = tokens[user_id]
+                    counter.count = 0
+                    t0 = time.perf_counter()
+                    if method == 'GET':
+                        response = client.get(path, data, **headers)
+                    else:
+                        response = client.generic(method, path, json.dumps(data), content_type='application/json', **headers)
+                    elapsed = (time.perf_counter() - t0) * 1000
+                    traffic.observe(endpoint, path, response)
+                    if recorder:
+                        recorder.write(json.dumps({'endpoint': endpoint, 'method': method, 'path': path,
+                                                   'data': data, 'user': user_id}) + '\n')
+                    if index >= opts['warmup']:
+                        stats = results[endpoint]
+                        stats['latency'].append(elapsed)
+                        stats['queries'].append(counter.count)
+                        stats['status'][response.status_code] += 1
+        finally:
+            request_log.setLevel(log_level)
+            if recorder:
+                recorder.close()
+        if started is None:
+            raise CommandError('Fewer requests than --warmup; nothing measured.')
+        report = self.report(results, time.perf_counter() - started)
+        if opts['output']:
+            with open(opts['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(f'Baseline written to {opts["output"]}')
+        if opts['compare']:
+            self.compare(report, opts['compare'], opts['threshold'])
+
+    def synthetic(self, traffic, rng, opts):
+        mix = [(name, float(weight)) for name, weight in (item.split('=') for item in opts['mix'].split(','))]
+        names, weights = zip(*mix)
+        produced = 0
+        while produced < opts['requests'] + opts['warmup']:
+            endpoint = rng.choices(names, weights)[0]
+            built = traffic.build(endpoint)
+            if built is None:
+                continue
+            produced += 1
+            yield (endpoint, *built)
+
+    def recorded(self, path):
+        with open(path) as f:
+            for line in f:
+                item = json.loads(line)
+                yield item['endpoint'], item['method'], item['path'], item['data'], item['user']
+
+    def report(self, results, duration):
+        endpoints = {}
+        total = 0
+        self.stdout.write(f'{"endpoint":<15}{"requests":>9}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}  statuses')
+        for name in sorted(results):
+            stats = results[name]
+            latency = sorted(stats['latency'])
+            total += len(latency)
+            endpoints[name] = {
+                'requests': len(latency),
+                'rps': round(len(latency) / duration, 1),
+                'p50_ms': round(percentile(latency, 0.5), 2),
+                'p95_ms': round(percentile(latency, 0.95), 2),
+                'p99_ms': round(percentile(latency, 0.99), 2),
+                'queries_per_request': round(sum(stats['queries']) / len(latency), 2),
+                'status': {str(code): n for code, n in sorted(stats['status'].items())},
+            }
+            e = endpoints[name]
+            self.stdout.write(f'{name:<15}{e["requests"]:>9}{e["rps"]:>9}{e["p50_ms"]:>9}{e["p95_ms"]:>9}{e["p99_ms"]:>9}'
+                              f'{e["queries_per_request"]:>9}  {e["status"]}')
+        self.stdout.write(f'{total} requests in {duration:.1f} s: {total / duration:.0f} req/s')
+        return {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'settings': {name: getattr(settings, name, None) for name in (
+                'AUCTIONS_FAST_SERIALIZERS', 'AUCTIONS_BID_BOOK', 'AUCTIONS_SEARCH_BACKEND')},
+            'duration_s': round(duration, 2),
+            'requests': total,
+            'rps': round(total / duration, 1),
+            'endpoints': endpoints,
+        }
+
+    def compare(self, report, path, threshold):
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, current in sorted(report['endpoints'].items()):
+            before = baseline['endpoints'].get(name)
+            if not before:
+                continue
+            change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            queries = current['queries_per_request'] - before['queries_per_request']
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions.append(name)
+            self.stdout.write(f'{name:<15} p95 {before["p95_ms"]} -> {current["p95_ms"]} ms ({change:+.0f}%), '
+                              f'queries {queries:+.2f}{flag}')
+        if regressions:
+            raise CommandError(f'p95 regressed by more than {threshold}% for: {", ".join(regressions)}')
+
+    def seed(self, opts, rng, batch_size=5000):
+        now = timezone.now()
+        password = make_password(None)
+        offset = User.objects.filter(username__startswith='bench-api-').count()
+        for start in range(0, opts['seed_users'], batch_size):
+            User.objects.bulk_create([
+                User(username=f'bench-api-{i}', email=f'bench-api-{i}@example.com', password=password)
+                for i in range(offset + start, offset + min(start + batch_size, opts['seed_users']))])
+        categories = [Category.objects.get_or_create(slug=f'bench-api-{i}', defaults={'name': f'Bench {i}'})[0]
+                      for i in range(opts['seed_categories'])]
+        user_ids = list(User.objects.filter(username__startswith='bench-api-').values_list('pk', flat=True))
+        created = []
+        for start in range(0, opts['seed_products'], batch_size):
+            batch = []
+            for _ in range(start, min(start + batch_size, opts['seed_products'])):
+                price = Decimal(rng.randint(1, 500))
+                batch.append(Product(
+                    seller_id=rng.choice(user_ids), category=rng.choice(categories),
+                    title=f'bench-api {" ".join(rng.sample(WORDS, 3))}', description=' '.join(rng.choices(WORDS, k=15)),
+                    starting_price=price, current_price=price, start_time=now - timedelta(days=1),
+                    end_time=now + timedelta(minutes=rng.randint(-1000, 20000))))
+            created.extend(Product.objects.bulk_create(batch))
+        per_product = opts['bids_per_product']
+        if per_product:
+            step = max(batch_size // per_product, 1)
+            for start in range(0, len(created), step):
+                chunk = created[start:start + step]
+                bids = []
+                for product in chunk:
+                    amount = product.current_price
+                    for _ in range(per_product):
+                        amount += rng.randint(1, 10)
+                        bids.append(Bid(product=product, bidder_id=rng.choice(user_ids), amount=amount))
+                    product.current_price = amount
+                Bid.objects.bulk_create(bids)
+                Product.objects.bulk_update(chunk, ['current_price'])
+            call_command('rebuild_bid_stats', stdout=self.stdout)
+        get_backend().reset()  # bulk_create sends no signals
+        self.stdout.write(f'Seeded {opts["seed_users"]} users, {len(categories)} categories, {len(created)} products.')
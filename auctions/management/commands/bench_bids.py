@@ -0,0 +1,85 @@
+"""Fire a burst of concurrent bids at one product and check they were serialized correctly.
+
+Run against Postgres (SQLite serializes writers with a file lock and will mostly time out):
+    python manage.py bench_bids --bids 5000 --workers 64
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from auctions.models import Product, Bid
+from auctions import services
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Concurrency benchmark for the bid placement service.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bids', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--bidders', type=int, default=50)
+        parser.add_argument('--batch', type=int, default=1, help='Bids per call; >1 goes through place_bids_bulk.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark product and users afterwards.')
+
+    def handle(self, *args, **opts):
+        stamp = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        seller = User.objects.create_user(username=f'bench-seller-{stamp}', password=None)
+        bidders = [User.objects.create_user(username=f'bench-bidder-{stamp}-{i}', password=None) for i in range(opts['bidders'])]
+        now = timezone.now()
+        product = Product.objects.create(
+            seller=seller, title=f'Bench lot {stamp}', starting_price=Decimal('1.00'), current_price=Decimal('1.00'),
+            start_time=now, end_time=now + timedelta(hours=1),
+        )
+        # shuffled amounts: many bids will lose the race and must be rejected, never applied
+        amounts = [Decimal(i) + Decimal('1.00') for i in range(1, opts['bids'] + 1)]
+        random.shuffle(amounts)
+
+        def fire(i):
+            try:
+                services.place_bid(product.pk, bidders[i % len(bidders)], amounts[i])
+                return 1
+            except services.BidRejected:
+                return 0
+            finally:
+                connection.close()
+
+        def fire_batch(start):
+            try:
+                items = [(product.pk, bidders[i % len(bidders)].pk, amounts[i]) for i in range(start, min(start + batch, len(amounts)))]
+                return sum(1 for r in services.place_bids_bulk(items) if not isinstance(r, services.BidRejected))
+            finally:
+                connection.close()
+
+        batch = opts['batch']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=opts['workers']) as pool:
+            if batch > 1:
+                results = list(pool.map(fire_batch, range(0, len(amounts), batch)))
+            else:
+                results = list(pool.map(fire, range(len(amounts))))
+        elapsed = time.perf_counter() - started
+
+        accepted = sum(results)
+        product.refresh_from_db()
+        stored = list(Bid.objects.filter(product=product).order_by('id').values_list('amount', flat=True))
+        errors = []
+        if len(stored) != accepted:
+            errors.append(f'{accepted} bids accepted but {len(stored)} rows stored')
+        if any(b <= a for a, b in zip(stored, stored[1:])):
+            errors.append('stored bids are not strictly increasing in insertion order')
+        if stored and product.current_price != stored[-1]:
+            errors.append(f'current_price {product.current_price} != last accepted bid {stored[-1]}')
+
+        self.stdout.write(f'{len(amounts)} bids in {elapsed:.2f}s -> {len(amounts) / elapsed:.0f} bids/sec '
+                          f'({accepted} accepted, {len(amounts) - accepted} rejected), final price {product.current_price}')
+        if not opts['keep']:
+            product.delete()
+            User.objects.filter(pk__in=[seller.pk] + [b.pk for b in bidders]).delete()
+        if errors:
+            raise CommandError('; '.join(errors))
+        self.stdout.write(self.style.SUCCESS('All bids serialized correctly.'))
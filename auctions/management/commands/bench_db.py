@@ -0,0 +1,41 @@
+"""Measure API request latency with per-request connections versus persistent connections.
+
+    python manage.py bench_db --requests 500
+
+Each request goes through the full middleware stack and is followed by the same connection
+housekeeping the request handler does (close_old_connections), so with CONN_MAX_AGE=0 every
+request pays for a new database connection, while with a positive CONN_MAX_AGE the connection is
+reused (after a health check). Run it against Postgres; with SQLite connecting is nearly free.
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.test import Client
+
+
+class Command(BaseCommand):
+    help = 'Benchmark request latency with and without persistent database connections.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--path', default='/api/products/?page_size=12')
+        parser.add_argument('--max-age', type=int, default=60, help='CONN_MAX_AGE used for the pooled run.')
+
+    def handle(self, *args, **opts):
+        client = Client()
+        for label, max_age in (('new connection per request', 0), (f'persistent (CONN_MAX_AGE={opts["max_age"]})', opts['max_age'])):
+            for alias in connections:
+                connections[alias].close()
+                connections[alias].settings_dict['CONN_MAX_AGE'] = max_age
+            timings = []
+            for _ in range(opts['requests']):
+                started = time.perf_counter()
+                response = client.get(opts['path'])
+                close_old_connections()
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    self.stderr.write(f'{opts["path"]} answered {response.status_code}')
+                    return
+            timings.sort()
+            pct = lambda p: timings[min(int(len(timings) * p), len(timings) - 1)]
+            self.stdout.write(f'{label}: p50 {pct(0.5):.2f} ms, p95 {pct(0.95):.2f} ms, p99 {pct(0.99):.2f} ms')
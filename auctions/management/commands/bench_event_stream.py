@@ -0,0 +1,65 @@
+"""Load test for the bid event hub: hold many subscribers on one lot in one process and time the fan-out.
+
+    python manage.py bench_event_stream --subscribers 10000 --events 200
+
+Subscribers are the same Subscription objects the SSE endpoint uses, each drained by its own task;
+events are published from a separate thread as bid placement does.
+"""
+import asyncio
+import resource
+import threading
+import time
+from django.core.management.base import BaseCommand
+from auctions import events
+
+
+class Command(BaseCommand):
+    help = 'Measure event fan-out latency and memory with many concurrent subscribers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=10000)
+        parser.add_argument('--events', type=int, default=100)
+        parser.add_argument('--product', type=int, default=0, help='Lot id to publish on (no database access needed).')
+
+    def handle(self, *args, **opts):
+        asyncio.run(self.run(opts['subscribers'], opts['events'], opts['product']))
+
+    async def run(self, n_subscribers, n_events, product_id):
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        subs = [events.hub.subscribe(product_id) for _ in range(n_subscribers)]
+        received = [0] * n_subscribers
+        done = asyncio.Event()
+        remaining = [n_subscribers]
+
+        async def consume(i, sub):
+            while received[i] < n_events:
+                frame = await sub.queue.get()
+                if frame is events.RESYNC:
+                    break
+                received[i] += 1
+            remaining[0] -= 1
+            if not remaining[0]:
+                done.set()
+
+        tasks = [asyncio.create_task(consume(i, sub)) for i, sub in enumerate(subs)]
+        await asyncio.sleep(0)
+        rss_held = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        def publisher():
+            for i in range(n_events):
+                events.publish(product_id, 'bid', {'id': i, 'product': product_id, 'amount': f'{i}.00'})
+
+        started = time.perf_counter()
+        threading.Thread(target=publisher).start()
+        await done.wait()
+        elapsed = time.perf_counter() - started
+        await asyncio.gather(*tasks)
+        for sub in subs:
+            events.hub.unsubscribe(sub)
+
+        delivered = sum(received)
+        resynced = sum(1 for r in received if r < n_events)
+        self.stdout.write(
+            f'{n_subscribers} subscribers x {n_events} events: {delivered} frames in {elapsed:.2f}s '
+            f'({delivered / elapsed:.0f} frames/sec), {resynced} subscribers resynced, '
+            f'max RSS grew {(rss_held - rss_before) / 1024:.1f} MB while holding subscribers')
@@ -0,0 +1,83 @@
+"""Measure the streaming bid export: throughput and resident memory while it runs.
+
+    python manage.py bench_export --bids 10000000
+
+Seeds a bench seller with lots and bids (topped up to --bids, reused between runs), then streams
+GET /api/exports/bids.<format>?seller=<bench seller> through ExportView into a byte counter, sampling
+the process RSS as it goes. Memory should stay flat however many rows are exported.
+"""
+import os
+import resource
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from auctions.models import Product, Bid
+from auctions.views import ExportView
+from users.models import User
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, on platforms without /proc
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the streaming CSV/JSONL bid export (rows/s and memory).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bids', type=int, default=1000000)
+        parser.add_argument('--lots', type=int, default=1000)
+        parser.add_argument('--bidders', type=int, default=500)
+        parser.add_argument('--format', dest='output', choices=('csv', 'jsonl'), default='csv')
+        parser.add_argument('--batch-size', type=int, default=20000)
+
+    def handle(self, *args, **opts):
+        seller, _ = User.objects.get_or_create(username='bench-export-seller', defaults={'is_staff': True})
+        self.seed(seller, opts)
+        total = Bid.objects.filter(product__seller=seller).count()
+        request = APIRequestFactory().get(f'/api/exports/bids.{opts["output"]}', {'seller': seller.pk})
+        force_authenticate(request, user=seller)
+        start_rss = peak_rss = rss_mb()
+        started = time.perf_counter()
+        response = ExportView.as_view()(request, kind='bids', output=opts['output'])
+        size = lines = 0
+        next_report = 1000000
+        for chunk in response.streaming_content:
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+            if lines >= next_report:
+                peak_rss = max(peak_rss, rss_mb())
+                self.stdout.write(f'  {lines:>10} lines, rss {rss_mb():.1f} MB')
+                next_report += 1000000
+        elapsed = time.perf_counter() - started
+        peak_rss = max(peak_rss, rss_mb())
+        self.stdout.write(f'{total} bids exported as {opts["output"]}: {size / 2 ** 20:.1f} MB in {elapsed:.1f} s '
+                          f'({total / elapsed:.0f} rows/s); rss {start_rss:.1f} MB at start, {peak_rss:.1f} MB peak')
+
+    def seed(self, seller, opts):
+        have = Bid.objects.filter(product__seller=seller).count()
+        if have >= opts['bids']:
+            return
+        now = timezone.now()
+        lots = list(Product.objects.filter(seller=seller).values_list('pk', flat=True))
+        if not lots:
+            Product.objects.bulk_create([
+                Product(seller=seller, title=f'bench-export-{i}', starting_price=1, current_price=1,
+                        start_time=now - timedelta(days=30), end_time=now - timedelta(days=1), is_active=False)
+                for i in range(opts['lots'])], batch_size=1000)
+            lots = list(Product.objects.filter(seller=seller).values_list('pk', flat=True))
+        User.objects.bulk_create([User(username=f'bench-export-bidder-{i}') for i in range(opts['bidders'])], ignore_conflicts=True)
+        bidders = list(User.objects.filter(username__startswith='bench-export-bidder-').values_list('pk', flat=True))
+        self.stdout.write(f'Seeding {opts["bids"] - have} bids...')
+        for start in range(have, opts['bids'], opts['batch_size']):
+            end = min(start + opts['batch_size'], opts['bids'])
+            Bid.objects.bulk_create([
+                Bid(product_id=lots[i % len(lots)], bidder_id=bidders[i % len(bidders)],
+                    amount=Decimal(1 + i // len(lots)) + Decimal('0.50'))
+                for i in range(start, end)])
@@ -0,0 +1,67 @@
+"""Compare page latency of keyset (cursor) and offset pagination on the product feed.
+
+    python manage.py bench_pagination --seed 2000000 --depths 1,10,100,1000,10000
+
+Cursor pages are reached by following `next` links; the latency of the page at each depth is
+reported next to a ?page=N offset query for the same depth.
+"""
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory
+from auctions.models import Product
+from auctions.views import ProductViewSet
+from users.models import User
+
+
+class OffsetProductViewSet(ProductViewSet):
+    pagination_class = PageNumberPagination
+
+
+class Command(BaseCommand):
+    help = 'Benchmark cursor vs offset pagination latency at increasing page depths.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many products before measuring.')
+        parser.add_argument('--depths', default='1,10,100,1000,10000')
+
+    def handle(self, *args, **opts):
+        if opts['seed']:
+            self.seed(opts['seed'])
+        depths = sorted(int(d) for d in opts['depths'].split(','))
+        factory = APIRequestFactory()
+        cursor_view = ProductViewSet.as_view({'get': 'list'})
+        offset_view = OffsetProductViewSet.as_view({'get': 'list'})
+
+        def timed(view, url):
+            started = time.perf_counter()
+            response = view(factory.get(url))
+            response.render()
+            return (time.perf_counter() - started) * 1000, response
+
+        self.stdout.write(f'{"page":>8} {"cursor ms":>10} {"offset ms":>10}')
+        url, page = '/api/products/', 1
+        for depth in depths:
+            while page < depth and url:
+                _, response = timed(cursor_view, url)
+                url, page = response.data['next'], page + 1
+            if not url:
+                self.stdout.write(f'{depth:>8} (past the last page)')
+                break
+            cursor_ms, response = timed(cursor_view, url)
+            offset_ms, _ = timed(offset_view, f'/api/products/?page={depth}')
+            self.stdout.write(f'{depth:>8} {cursor_ms:>10.2f} {offset_ms:>10.2f}')
+
+    def seed(self, count, batch_size=10000):
+        seller, _ = User.objects.get_or_create(username='bench-seller')
+        now = timezone.now()
+        for start in range(0, count, batch_size):
+            Product.objects.bulk_create([
+                Product(seller=seller, title=f'Bench product {i}', starting_price=Decimal('1.00'), current_price=Decimal('1.00'),
+                        start_time=now, end_time=now + timedelta(days=7))
+                for i in range(start, min(start + batch_size, count))
+            ])
+        self.stdout.write(f'Seeded {count} products.')
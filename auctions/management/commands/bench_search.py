@@ -0,0 +1,74 @@
+"""Measure product search latency (p50/p95/p99) with the configured search backend.
+
+    python manage.py bench_search --seed 1000000 --queries 500
+
+--seed inserts products with titles/descriptions drawn from a fixed vocabulary across a few
+categories, so queries have realistic selectivity. Queries mix one- and two-term searches with
+price, active and category filters.
+"""
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from auctions.models import Category, Product
+from auctions.search import get_backend
+from auctions.views import ProductViewSet
+from users.models import User
+
+WORDS = ('vintage antique brass lamp oak table chair silver watch gold ring leather bag canvas painting oil '
+         'print camera lens vinyl record guitar amplifier porcelain vase marble statue wool rug clock mirror '
+         'copper kettle glass bowl signed limited edition rare collector mint boxed restored original').split()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ranked product search latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--queries', type=int, default=200)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(42)
+        if opts['seed']:
+            self.seed(opts['seed'], rng)
+            get_backend().reset()
+        view = ProductViewSet.as_view({'get': 'search'})
+        factory = APIRequestFactory()
+        categories = list(Category.objects.values_list('pk', flat=True))
+        view(factory.get('/api/products/search/', {'q': 'warmup'}))  # builds the in-process index if used
+        timings = []
+        for _ in range(opts['queries']):
+            params = {'q': ' '.join(rng.sample(WORDS, rng.choice((1, 2))))}
+            if rng.random() < 0.3:
+                params['max_price'] = str(rng.randint(50, 500))
+            if rng.random() < 0.3:
+                params['active'] = '1'
+            if categories and rng.random() < 0.3:
+                params['category'] = rng.choice(categories)
+            started = time.perf_counter()
+            view(factory.get('/api/products/search/', params)).render()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        pct = lambda p: timings[min(int(len(timings) * p), len(timings) - 1)]
+        self.stdout.write(f'{len(timings)} queries over {Product.objects.count()} products: '
+                          f'p50 {pct(0.5):.1f} ms, p95 {pct(0.95):.1f} ms, p99 {pct(0.99):.1f} ms')
+
+    def seed(self, count, rng, batch_size=10000):
+        seller, _ = User.objects.get_or_create(username='bench-seller')
+        categories = [Category.objects.get_or_create(slug=f'bench-{name}', defaults={'name': name.title()})[0]
+                      for name in ('furniture', 'jewellery', 'art', 'music', 'home')]
+        now = timezone.now()
+        for start in range(0, count, batch_size):
+            batch = []
+            for _ in range(start, min(start + batch_size, count)):
+                price = Decimal(rng.randint(1, 1000))
+                batch.append(Product(
+                    seller=seller, category=rng.choice(categories), title=' '.join(rng.sample(WORDS, 4)),
+                    description=' '.join(rng.choices(WORDS, k=20)), starting_price=price, current_price=price,
+                    start_time=now, end_time=now + timedelta(minutes=rng.randint(-600, 10000)),
+                ))
+            Product.objects.bulk_create(batch)
+        self.stdout.write(f'Seeded {count} products.')
@@ -0,0 +1,51 @@
+"""Measure rows/sec of the fast read path against the DRF serializers.
+
+    python manage.py bench_serializers --rows 5000 --repeat 5
+
+Uses existing products/bids (seed some first, e.g. with bench_pagination --seed). Output parity is
+checked by auctions.tests.FastSerializerParityTests.
+"""
+import time
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+from auctions import fast_serializers
+from auctions.models import Product, Bid
+from auctions.serializers import ProductListSerializer, ProductDetailSerializer, BidSerializer
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark of the fast read serializers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **opts):
+        request = Request(APIRequestFactory().get('/api/products/'))
+        context = {'request': request}
+        products = Product.objects.select_related('seller', 'image_asset').order_by('-created_at')[:opts['rows']]
+        bids = Bid.objects.select_related('bidder')[:opts['rows']]
+        cases = [
+            ('product list', lambda: ProductListSerializer(list(products), many=True, context=context).data,
+             lambda: fast_serializers.product_rows(products.values(*fast_serializers.PRODUCT_VALUES), request)),
+            ('bid list', lambda: BidSerializer(list(bids), many=True, context=context).data,
+             lambda: fast_serializers.bid_rows(bids.values(*fast_serializers.BID_VALUES), request)),
+        ]
+        detail = Product.objects.order_by('-bid_count').first()
+        if detail:
+            one = Product.objects.filter(pk=detail.pk)
+            cases.append(('product detail', lambda: [ProductDetailSerializer(one.get(), context=context).data],
+                          lambda: [fast_serializers.product_detail(one, request)]))
+
+        for name, slow, fast in cases:
+            if not slow():
+                self.stdout.write(f'{name:>15}: n/a (no rows; seed some first)')
+                continue
+            rates = []
+            for build in (slow, fast):
+                started, n = time.perf_counter(), 0
+                for _ in range(opts['repeat']):
+                    n += len(build())
+                rates.append(n / (time.perf_counter() - started))
+            self.stdout.write(f'{name:>15}: DRF {rates[0]:>10.0f} rows/sec   fast {rates[1]:>10.0f} rows/sec   ({rates[1] / rates[0]:.1f}x)')
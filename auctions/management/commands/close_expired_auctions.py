@@ -0,0 +1,25 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from auctions.scheduler import AuctionScheduler
+
+
+class Command(BaseCommand):
+    help = 'Close auctions whose end_time has passed. Runs once, or as a long-lived worker with --loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and close lots as they expire.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--lookahead', type=int, default=300, help='Seconds of upcoming deadlines kept in memory.')
+        parser.add_argument('--refresh', type=int, default=30, help='Seconds between index scans for new deadlines.')
+
+    def handle(self, *args, **opts):
+        scheduler = AuctionScheduler(
+            lookahead=timedelta(seconds=opts['lookahead']),
+            refresh_every=timedelta(seconds=opts['refresh']),
+            batch_size=opts['batch_size'],
+        )
+        if opts['loop']:
+            self.stdout.write('Auto-close scheduler running...')
+            scheduler.run_forever()
+        closed = scheduler.tick()
+        self.stdout.write(self.style.SUCCESS(f'{closed} auction(s) closed.'))
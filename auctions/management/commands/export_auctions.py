@@ -0,0 +1,33 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from auctions import exports
+
+
+class Command(BaseCommand):
+    help = 'Write the bid history or auction results as CSV or JSON Lines, streaming (constant memory).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=('bids', 'results'))
+        parser.add_argument('--format', dest='output', choices=tuple(exports.FORMATS), default='csv')
+        parser.add_argument('--seller', help='Seller id.')
+        parser.add_argument('--category', help='Category id or slug.')
+        parser.add_argument('--product', help='Product id.')
+        parser.add_argument('--since', help='ISO date or datetime (bid time for bids, end time for results).')
+        parser.add_argument('--until', help='ISO date or datetime, inclusive.')
+        parser.add_argument('--output', '-o', dest='path', help='File to write (default: stdout).')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip.')
+
+    def handle(self, *args, **opts):
+        try:
+            filters = exports.resolve_filters(seller=opts['seller'], category=opts['category'], product=opts['product'],
+                                              since=opts['since'], until=opts['until'])
+        except exports.ExportError as e:
+            raise CommandError(e)
+        columns, rows = exports.rows(opts['kind'], filters, chunk_size=opts['chunk_size'])
+        out = open(opts['path'], 'w', newline='', encoding='utf-8') if opts['path'] else sys.stdout
+        try:
+            for chunk in exports.render(columns, rows, opts['output']):
+                out.write(chunk)
+        finally:
+            if opts['path']:
+                out.close()
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from auctions import images
+
+
+class Command(BaseCommand):
+    help = 'Render the resized variants of uploaded product photos. Runs once, or as a long-lived worker with --loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and pick up new uploads and retries.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between drains with --loop.')
+        parser.add_argument('--rebuild', action='store_true', help='Render every stored image again first (after changing AUCTIONS_IMAGE_VARIANTS).')
+
+    def handle(self, *args, **opts):
+        if opts['rebuild']:
+            self.stdout.write(f'{images.rebuild()} image(s) queued.')
+        if opts['loop']:
+            self.stdout.write('Image worker running...')
+            while True:
+                images.drain()
+                time.sleep(opts['interval'])
+        counts = images.drain()
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{n} {kind}' for kind, n in counts.items())))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from auctions.models import Product, Bid
+from auctions import caching
+
+
+class Command(BaseCommand):
+    help = 'Recompute bid_count, unique_bidder_count, leading_bid and last_bid_at on products from the Bid table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--product', type=int, action='append', help='Only rebuild these product ids.')
+
+    def handle(self, *args, **opts):
+        leading = Bid.objects.filter(product_id=OuterRef('pk')).order_by('-amount', 'timestamp').values('pk')[:1]
+        qs = Product.objects.order_by('pk')
+        if opts['product']:
+            qs = qs.filter(pk__in=opts['product'])
+        last_pk, total = 0, 0
+        while True:
+            with transaction.atomic():
+                # lock the batch first (FOR UPDATE cannot be combined with the aggregates) so live bids wait
+                ids = list(qs.filter(pk__gt=last_pk).select_for_update().values_list('pk', flat=True)[:opts['batch_size']])
+                batch = list(Product.objects.filter(pk__in=ids).order_by('pk')
+                             .annotate(n_bids=Count('bids'), n_bidders=Count('bids__bidder', distinct=True),
+                                       latest=Max('bids__timestamp'), leader=Subquery(leading)))
+                if not batch:
+                    break
+                for p in batch:
+                    p.bid_count, p.unique_bidder_count, p.last_bid_at, p.leading_bid_id = p.n_bids, p.n_bidders, p.latest, p.leader
+                Product.objects.bulk_update(batch, ['bid_count', 'unique_bidder_count', 'last_bid_at', 'leading_bid'])
+                caching.bump_products(ids)
+            last_pk = batch[-1].pk
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt bid statistics for {total} product(s).'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from auctions import fanout
+
+
+class Command(BaseCommand):
+    help = 'Resume auction-ended notification jobs that did not complete (e.g. after a crash).'
+
+    def handle(self, *args, **opts):
+        count = fanout.resume_pending()
+        self.stdout.write(self.style.SUCCESS(f'{count} notification job(s) processed.'))
@@ -1,11 +1,40 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 class Category(models.Model):
     name = models.CharField(max_length=120)
     slug = models.SlugField(unique=True)
     def __str__(self): return self.name
 
+class ProductImage(models.Model):
+    """An uploaded photo, stored once per content hash, and its resized variants (auctions/images.py).
+    `variants` maps a size name to {format: storage name}; it is filled in by the image workers.
+    """
+    PENDING, READY, FAILED = 'pending', 'ready', 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (READY, 'Ready'), (FAILED, 'Failed'))
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    original = models.FileField(max_length=255)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(auto_now_add=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the workers' claim query
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return self.content_hash
+
 class Product(models.Model):
     seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='products')
     title = models.CharField(max_length=255)
@@ -16,8 +45,28 @@ class Product(models.Model):
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
     is_active = models.BooleanField(default=True)
-    image = models.ImageField(upload_to='products/', null=True, blank=True)
+    image = models.ImageField(upload_to='products/', null=True, blank=True, max_length=255)
+    image_asset = models.ForeignKey(ProductImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
     created_at = models.DateTimeField(auto_now_add=True)
+    # bid statistics maintained with every accepted bid (rebuild with `manage.py rebuild_bid_stats`)
+    bid_count = models.PositiveIntegerField(default=0)
+    unique_bidder_count = models.PositiveIntegerField(default=0)
+    leading_bid = models.ForeignKey('Bid', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_bid_at = models.DateTimeField(null=True, blank=True)
+    # top two proxy maxima (see ProxyBid); cleared once a bid beats the top one
+    proxy_bidder = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    proxy_max = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    proxy_second_max = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # feeds the auto-close scheduler: active lots ordered by deadline
+            models.Index(fields=['is_active', 'end_time']),
+            # "hot auctions" ordering (?ordering=-bid_count)
+            models.Index(fields=['-bid_count']),
+            # keyset pagination of the product feed
+            models.Index(fields=['created_at', 'id']),
+        ]
 
     def __str__(self):
         return self.title
@@ -26,7 +75,81 @@ class Bid(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bids')
     bidder = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bids')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # when the bid was accepted, which for the bid book (auctions/orderbook.py) is before it is written
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        ordering = ('-timestamp',)
+        indexes = [
+            # per-lot bid history (keyset pagination) and highest-bid lookups
+            models.Index(fields=['product', 'timestamp']),
+            models.Index(fields=['product', 'amount']),
+        ]
+
+class ProxyBid(models.Model):
+    """A bidder's maximum for a lot; the engine bids on their behalf up to it (auctions.services.set_proxy_bid)."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='proxy_bids')
+    bidder = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='proxy_bids')
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'bidder'], name='unique_proxy_bid_per_bidder'),
+        ]
+
+    def __str__(self):
+        return f"Proxy {self.bidder_id} up to {self.max_amount} on {self.product_id}"
+
+class NotificationFanout(models.Model):
+    """Progress of the "auction ended" notification job for a closed product.
+    `last_bidder_id` is the resume cursor: bidders are processed in id order and everyone up to it is done.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='fanout')
+    winning_bid = models.ForeignKey(Bid, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_bidder_id = models.BigIntegerField(default=0)
+    notified_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Fanout for product {self.product_id}"
+
+class ArchivedProduct(models.Model):
+    """A closed lot moved out of Product by auctions.archive, under the same id.
+    The product detail endpoint falls back to it; bids are in ArchivedBid.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    starting_price = models.DecimalField(max_digits=10, decimal_places=2)
+    current_price = models.DecimalField(max_digits=10, decimal_places=2)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    image = models.ImageField(upload_to='products/', null=True, blank=True, max_length=255)
+    image_asset = models.ForeignKey(ProductImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField()
+    bid_count = models.PositiveIntegerField(default=0)
+    unique_bidder_count = models.PositiveIntegerField(default=0)
+    leading_bid_id = models.BigIntegerField(null=True, blank=True)  # an ArchivedBid id
+    last_bid_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.title
+
+class ArchivedBid(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(ArchivedProduct, on_delete=models.CASCADE, related_name='bids')
+    bidder = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    timestamp = models.DateTimeField()
 
     class Meta:
         ordering = ('-timestamp',)
+        indexes = [
+            models.Index(fields=['product', 'timestamp']),
+        ]
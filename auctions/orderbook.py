@@ -0,0 +1,216 @@
+"""Optional in-process bid book (enabled with the AUCTIONS_BID_BOOK setting).
+
+Keeps current price, top bidder and end time of each active lot in memory, sharded by product id
+with one lock per shard, so a bid is validated and accepted without touching the database.
+Accepted bids are queued and written to the Bid table in batches by a background flusher.
+
+The database stays the source of truth: lots are loaded lazily from Product/Bid, each flush
+re-checks pending bids against the locked product row, and any lot whose flush finds the
+database ahead of memory (e.g. another process took bids) is evicted and reloaded on next use.
+Code that writes a lot directly (closing it, proxy and bulk bids) does so inside `hold`, which writes
+the queued bids first and keeps new bids on those lots waiting until the change has committed. `hold`
+only covers this process: the scheduler closes lots from its own process, so a flush also writes bids
+placed before the end time of a lot that is already closed, and points its fanout job at the new
+winner. The scheduler waits AUCTIONS_CLOSE_GRACE seconds past the end time so that normally happens
+before the job has sent anything. After a restart the book starts empty and every lot is loaded again
+from the database; bids still queued when a process dies are lost.
+Only run this where one process serves the bids of a given lot (single worker or sticky routing).
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from .models import Product, Bid, NotificationFanout
+from .services import BidRejected, parse_amount
+from . import events, caching
+
+logger = logging.getLogger(__name__)
+
+
+class LotState:
+    __slots__ = ('current_price', 'top_bidder_id', 'end_time', 'is_active')
+
+    def __init__(self, current_price, top_bidder_id, end_time, is_active):
+        self.current_price = current_price
+        self.top_bidder_id = top_bidder_id
+        self.end_time = end_time
+        self.is_active = is_active
+
+
+class BidBook:
+    def __init__(self, shards=64, flush_size=500, flush_interval=0.05):
+        # re-entrant: `hold` keeps shards and the flush lock while flushing, which evicts lots
+        self.shards = [(threading.RLock(), {}) for _ in range(shards)]
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.RLock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+
+    def _shard(self, product_id):
+        return self.shards[int(product_id) % len(self.shards)]
+
+    def _load(self, product_id):
+        row = Product.objects.filter(pk=product_id).values('current_price', 'end_time', 'is_active', 'leading_bid__bidder_id').first()
+        if row is None:
+            raise BidRejected('Not found.', status_code=404)
+        return LotState(row['current_price'], row['leading_bid__bidder_id'], row['end_time'], row['is_active'])
+
+    def place_bid(self, product_id, bidder, amount):
+        """Validate and accept a bid in memory. Returns an unsaved Bid that will be written by the flusher."""
+        amount = parse_amount(amount)
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise BidRejected('Not found.', status_code=404)
+        now = timezone.now()
+        lock, lots = self._shard(product_id)
+        with lock:
+            state = lots.get(product_id)
+            if state is None:
+                state = lots[product_id] = self._load(product_id)
+            if not state.is_active or state.end_time <= now:
+                raise BidRejected('Auction is closed.', status_code=400)
+            if amount <= state.current_price:
+                raise BidRejected('Bid must be greater than current price.', status_code=409, current_price=state.current_price)
+            state.current_price = amount
+            state.top_bidder_id = bidder.pk
+            bid = Bid(product_id=product_id, bidder=bidder, amount=amount, timestamp=now)
+            with self._pending_lock:
+                self._pending.append(bid)
+                full = len(self._pending) >= self.flush_size
+        self._ensure_flusher()
+        if full:
+            self._wakeup.set()
+        events.publish(product_id, 'bid', events.bid_event(bid))
+        return bid
+
+    def evict(self, product_id):
+        lock, lots = self._shard(product_id)
+        with lock:
+            lots.pop(int(product_id), None)
+
+    @contextmanager
+    def hold(self, product_ids):
+        """Write out queued bids and keep bids on these lots waiting while the caller changes them in the database.
+
+        Commit inside the block: the lots are evicted when it exits, so their next bid reloads the committed row.
+        """
+        product_ids = {int(pk) for pk in product_ids}
+        shards = [self.shards[index] for index in sorted({pk % len(self.shards) for pk in product_ids})]
+        with self._flush_lock:
+            for lock, _ in shards:
+                lock.acquire()
+            try:
+                self.flush()
+                yield
+            finally:
+                for pk in product_ids:
+                    self._shard(pk)[1].pop(pk, None)
+                for lock, _ in reversed(shards):
+                    lock.release()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            by_product = defaultdict(list)
+            for bid in pending:
+                by_product[bid.product_id].append(bid)
+            try:
+                return self._write(by_product)
+            except Exception:
+                # keep the bids queued (ahead of anything accepted meanwhile) and retry on the next flush
+                with self._pending_lock:
+                    self._pending[:0] = pending
+                raise
+
+    def _write(self, by_product):
+        written = 0
+        with transaction.atomic():
+            for product_id, bids in by_product.items():
+                row = Product.objects.select_for_update().filter(pk=product_id).values('current_price', 'is_active', 'end_time').first()
+                if row is None:
+                    logger.warning('product %s no longer exists; dropped %d bids', product_id, len(bids))
+                    self.evict(product_id)
+                    continue
+                if not row['is_active']:
+                    # closed without going through `hold` (e.g. by the scheduler): keep what came in before the end
+                    self.evict(product_id)
+                    late = [b for b in bids if b.timestamp >= row['end_time']]
+                    if late:
+                        logger.warning('product %s is no longer open; dropped %d bids', product_id, len(late))
+                        bids = [b for b in bids if b.timestamp < row['end_time']]
+                # bids for a lot are queued in increasing order; keep only those still above the stored price
+                accepted = [b for b in bids if b.amount > row['current_price']]
+                if len(accepted) != len(bids):
+                    logger.warning('bid book for product %s was behind the database; dropped %d bids', product_id, len(bids) - len(accepted))
+                    self.evict(product_id)
+                if accepted:
+                    bidder_ids = {b.bidder_id for b in accepted}
+                    seen = set(Bid.objects.filter(product_id=product_id, bidder_id__in=bidder_ids).values_list('bidder_id', flat=True).distinct())
+                    created = Bid.objects.bulk_create(accepted)
+                    leading = created[-1]
+                    Product.objects.filter(pk=product_id).update(
+                        current_price=leading.amount, bid_count=F('bid_count') + len(created),
+                        unique_bidder_count=F('unique_bidder_count') + len(bidder_ids - seen),
+                        leading_bid_id=leading.pk, last_bid_at=leading.timestamp)
+                    if not row['is_active']:
+                        NotificationFanout.objects.filter(product_id=product_id).update(winning_bid_id=leading.pk)
+                        events.publish_on_commit(product_id, 'closed', {'product': product_id, 'winning_bid': leading.pk})
+                    written += len(created)
+            caching.bump_products(list(by_product))
+        return written
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='bid-book-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('bid book flush failed')
+                time.sleep(self.flush_interval)
+            finally:
+                close_old_connections()
+
+
+_book = None
+_book_lock = threading.Lock()
+
+
+def get_book():
+    global _book
+    if _book is None:
+        with _book_lock:
+            if _book is None:
+                _book = BidBook(
+                    shards=getattr(settings, 'AUCTIONS_BID_BOOK_SHARDS', 64),
+                    flush_size=getattr(settings, 'AUCTIONS_BID_BOOK_FLUSH_SIZE', 500),
+                    flush_interval=getattr(settings, 'AUCTIONS_BID_BOOK_FLUSH_INTERVAL', 0.05),
+                )
+                atexit.register(_book.flush)
+    return _book
+
+
+def enabled():
+    return getattr(settings, 'AUCTIONS_BID_BOOK', False)
@@ -0,0 +1,58 @@
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """?ordering= with an `id` tiebreaker, so rows with equal keys keep one order from page to page."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering = [*ordering, '-id' if ordering[0].startswith('-') else 'id']
+        return ordering
+
+
+class ProductCursorPagination(CursorPagination):
+    """Keyset pagination for the product feed: no COUNT(*) and no OFFSET, so deep pages cost the same as page 1.
+    The default uses the (created_at, id) index.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ProductPageNumberPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ProductPagination(BasePagination):
+    """Cursor pages for orderings on created_at, page numbers for every other ?ordering=.
+
+    A cursor encodes the last row's ordering key, so the key must never be NULL (last_bid_at of a lot
+    without bids breaks the cursor) and never change (bid_count, current_price and end_time move while
+    the lot is listed, skipping or repeating rows between pages).
+    """
+    cursor_fields = ('created_at',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = queryset.query.order_by
+        keyed = not ordering or ordering[0].lstrip('-') in self.cursor_fields
+        self.paginator = ProductCursorPagination() if keyed else ProductPageNumberPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    def get_results(self, data):
+        return data['results']
+
+
+class BidCursorPagination(CursorPagination):
+    """Keyset pagination for bid history, served by the (product, timestamp) index when filtered by ?product=."""
+    ordering = ('-timestamp', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,86 @@
+"""Auto-close scheduler: closes lots when their end_time passes.
+
+Upcoming deadlines are kept in a min-heap fed by a range scan on the (is_active, end_time) index,
+limited to a look-ahead window, so each refresh reads only lots ending soon instead of the whole
+table. Each tick pops every due lot and closes them in batches via services.close_expired_auctions,
+which re-checks the deadline in the database (lots extended since they were queued are skipped).
+A lot whose end_time is moved earlier is queued again at the next refresh, so it closes at most
+`refresh_every` late.
+A lot is closed `grace` after its end_time, leaving web processes running the bid book time to write
+the bids they accepted just before the end (see auctions/orderbook.py).
+"""
+import heapq
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import Product
+from . import services
+
+logger = logging.getLogger(__name__)
+
+
+class AuctionScheduler:
+    def __init__(self, lookahead=timedelta(minutes=5), refresh_every=timedelta(seconds=30), batch_size=500, max_queued=100000, grace=None):
+        self.lookahead = lookahead
+        self.grace = grace if grace is not None else timedelta(seconds=getattr(settings, 'AUCTIONS_CLOSE_GRACE', 2))
+        self.refresh_every = refresh_every
+        self.batch_size = batch_size
+        self.max_queued = max_queued
+        self.heap = []
+        self.queued = {}  # pk -> end_time of its live heap entry
+        self.next_refresh = None
+
+    def refresh(self, now):
+        horizon = now + self.lookahead
+        upcoming = (Product.objects.filter(is_active=True, end_time__lte=horizon)
+                    .order_by('end_time').values_list('end_time', 'pk')[:self.max_queued])
+        for end_time, pk in upcoming:
+            # a lot whose end_time moved since it was queued gets a new entry; the old one is skipped when popped
+            if self.queued.get(pk) != end_time:
+                heapq.heappush(self.heap, (end_time, pk))
+                self.queued[pk] = end_time
+        self.next_refresh = now + self.refresh_every
+
+    def due(self, now):
+        ids = []
+        while self.heap and self.heap[0][0] <= now:
+            end_time, pk = heapq.heappop(self.heap)
+            if self.queued.get(pk) == end_time:
+                del self.queued[pk]
+                ids.append(pk)
+        return ids
+
+    def tick(self, now=None):
+        """Close every lot that is due. Returns the number of lots closed."""
+        now = now or timezone.now()
+        if self.next_refresh is None or now >= self.next_refresh:
+            self.refresh(now)
+        ids = self.due(now - self.grace)
+        closed = 0
+        for i in range(0, len(ids), self.batch_size):
+            closed += len(services.close_expired_auctions(ids[i:i + self.batch_size], now=now - self.grace))
+        return closed
+
+    def seconds_until_next(self, now):
+        wake = self.next_refresh
+        if self.heap and self.heap[0][0] + self.grace < wake:
+            wake = self.heap[0][0] + self.grace
+        return max((wake - now).total_seconds(), 0)
+
+    def run_forever(self, max_sleep=1.0):
+        while True:
+            try:
+                closed = self.tick()
+                if closed:
+                    logger.info('auto-closed %d auctions', closed)
+            except Exception:
+                logger.exception('auto-close tick failed')
+                # the heap may be out of step with the database after a failure; rebuild it
+                self.heap, self.queued, self.next_refresh = [], {}, None
+            finally:
+                close_old_connections()
+            delay = self.seconds_until_next(timezone.now()) if self.next_refresh else max_sleep
+            time.sleep(min(delay, max_sleep))
@@ -0,0 +1,205 @@
+"""Ranked product search over title and description; the category name raises the rank of a match.
+
+A category name alone never matches: the Postgres GIN index is an expression index on Product's own
+columns and cannot cover the joined category name, so the memory backend matches the same fields.
+
+Two backends, picked by the AUCTIONS_SEARCH_BACKEND setting ('auto' chooses by database vendor):
+
+- PostgresSearchBackend: websearch-style tsquery against a GIN expression index on
+  (title, description), ranked with a weighted vector. Postgres keeps the index up to date on
+  every write. The index is created after `migrate` on Postgres only (`create_search_index`), so
+  Product's declared schema is the same on every database.
+- MemorySearchBackend: a process-local inverted index for SQLite and tests, built lazily and
+  kept up to date from Product/Category save and delete signals (see auctions/signals.py).
+
+Both return a SearchResult wrapping the queryset of matching products, so price/active/
+ending-soon filters, counts and category facets run in the database the same way for either
+backend; only ordering a page by relevance is backend specific.
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, connections, router
+
+TOKEN_RE = re.compile(r'\w\w+', re.UNICODE)
+FIELD_WEIGHTS = {'title': 3.0, 'category': 2.0, 'description': 1.0}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+SEARCH_INDEX = 'product_search_idx'
+
+
+def search_config():
+    return getattr(settings, 'AUCTIONS_SEARCH_CONFIG', 'english')
+
+
+def search_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+    return GinIndex(SearchVector('title', 'description', config=search_config()), name=SEARCH_INDEX)
+
+
+def create_search_index(using='default', **kwargs):
+    """post_migrate hook: add the GIN index used by PostgresSearchBackend on Postgres databases that lack it."""
+    from .models import Product
+    conn = connections[using]
+    if conn.vendor != 'postgresql' or not router.allow_migrate_model(using, Product):
+        return
+    table = Product._meta.db_table
+    with conn.cursor() as cursor:
+        if table not in conn.introspection.table_names(cursor) or SEARCH_INDEX in conn.introspection.get_constraints(cursor, table):
+            return
+    with conn.schema_editor() as editor:
+        editor.add_index(Product, search_index())
+
+
+class SearchResult:
+    def __init__(self, queryset, rank_page):
+        self.queryset = queryset
+        self._rank_page = rank_page
+
+    def filter(self, **kwargs):
+        return SearchResult(self.queryset.filter(**kwargs), self._rank_page)
+
+    def page_ids(self, offset, limit):
+        """Product ids of one page, most relevant first."""
+        return self._rank_page(self.queryset, offset, limit)
+
+
+class PostgresSearchBackend:
+    def search(self, queryset, text):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+        config = search_config()
+        query = SearchQuery(text, search_type='websearch', config=config)
+        # must match the expression of search_index() for the match to use the index
+        document = SearchVector('title', 'description', config=config)
+        weighted = (SearchVector('title', weight='A', config=config) + SearchVector('category__name', weight='B', config=config)
+                    + SearchVector('description', weight='C', config=config))
+
+        def rank_page(matches, offset, limit):
+            ranked = matches.annotate(rank=SearchRank(weighted, query)).order_by('-rank', '-id')
+            return list(ranked.values_list('pk', flat=True)[offset:offset + limit])
+        return SearchResult(queryset.annotate(document=document).filter(document=query), rank_page)
+
+    def index_products(self, product_ids):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def reset(self):
+        pass
+
+
+class MemorySearchBackend:
+    """Inverted index: token -> {product id: weighted term frequency}. Queries match all terms (AND)."""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.doc_tokens = {}
+        self.lock = threading.RLock()
+        self.built = False
+
+    def _ensure_built(self):
+        if self.built:
+            return
+        from .models import Product
+        with self.lock:
+            if self.built:
+                return
+            rows = Product.objects.values_list('id', 'title', 'description', 'category__name').iterator(chunk_size=2000)
+            for row in rows:
+                self._add(*row)
+            self.built = True
+
+    def _add(self, pk, title, description, category_name):
+        weights = defaultdict(float)
+        for field, text in (('title', title), ('description', description)):
+            for token in tokenize(text):
+                weights[token] += FIELD_WEIGHTS[field]
+        for token in tokenize(category_name):
+            if token in weights:  # ranks a match, as on Postgres, but does not match on its own
+                weights[token] += FIELD_WEIGHTS['category']
+        self._remove(pk)
+        for token, weight in weights.items():
+            self.postings[token][pk] = weight
+        self.doc_tokens[pk] = tuple(weights)
+
+    def _remove(self, pk):
+        for token in self.doc_tokens.pop(pk, ()):
+            docs = self.postings.get(token)
+            if docs is not None:
+                docs.pop(pk, None)
+                if not docs:
+                    del self.postings[token]
+
+    def index_products(self, product_ids):
+        if not self.built:
+            return  # picked up when the index is first built
+        from .models import Product
+        rows = list(Product.objects.filter(pk__in=product_ids).values_list('id', 'title', 'description', 'category__name'))
+        with self.lock:
+            for row in rows:
+                self._add(*row)
+
+    def remove_products(self, product_ids):
+        with self.lock:
+            for pk in product_ids:
+                self._remove(pk)
+
+    def reset(self):
+        """Drop the index so it is rebuilt on the next query (e.g. after bulk_create, which sends no signals)."""
+        with self.lock:
+            self.postings.clear()
+            self.doc_tokens.clear()
+            self.built = False
+
+    def scores(self, text):
+        self._ensure_built()
+        terms = set(tokenize(text))
+        if not terms:
+            return {}
+        with self.lock:
+            postings = [self.postings.get(term, {}) for term in terms]
+            n_docs = max(len(self.doc_tokens), 1)
+        postings.sort(key=len)
+        if not postings[0]:
+            return {}
+        candidates = set(postings[0]).intersection(*postings[1:])
+        result = {}
+        for docs in postings:
+            idf = math.log(1 + n_docs / len(docs))
+            for pk in candidates:
+                result[pk] = result.get(pk, 0.0) + docs[pk] * idf
+        return result
+
+    def search(self, queryset, text):
+        # every match goes to the database, so filters, counts and facets see all of them
+        scores = self.scores(text)
+
+        def rank_page(matches, offset, limit):
+            remaining = matches.values_list('pk', flat=True)
+            ranked = sorted(remaining, key=lambda pk: (-scores[pk], -pk))
+            return ranked[offset:offset + limit]
+        return SearchResult(queryset.filter(pk__in=list(scores)), rank_page)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'AUCTIONS_SEARCH_BACKEND', 'auto')
+                if name == 'auto':
+                    name = 'postgres' if connection.vendor == 'postgresql' else 'memory'
+                _backend = PostgresSearchBackend() if name == 'postgres' else MemorySearchBackend()
+    return _backend
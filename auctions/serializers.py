@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Category, Product, Bid
+from django.conf import settings
+from .models import Category, Product, Bid, ArchivedProduct, ArchivedBid
+from . import images
 from users.serializers import UserSerializer
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -9,17 +11,51 @@ class CategorySerializer(serializers.ModelSerializer):
 
 class ProductListSerializer(serializers.ModelSerializer):
     seller = UserSerializer(read_only=True)
+    # resized JPEG/WebP URLs by size (AUCTIONS_IMAGE_VARIANTS); null until the image workers have run
+    images = serializers.SerializerMethodField()
     class Meta:
         model = Product
-        fields = ('id','title','description','category','starting_price','current_price','start_time','end_time','is_active','seller','image')
+        fields = ('id','title','description','category','starting_price','current_price','start_time','end_time','is_active','seller','image',
+                  'images','bid_count','unique_bidder_count','leading_bid','last_bid_at')
+        read_only_fields = ('bid_count','unique_bidder_count','leading_bid','last_bid_at')
+    def get_images(self, obj):
+        return images.variant_urls(obj.image_asset.variants if obj.image_asset_id else None, self.context.get('request'))
 
 class ProductDetailSerializer(ProductListSerializer):
+    # only the most recent bids are embedded; the full history is paginated at /api/bids/?product=<id>
     bids = serializers.SerializerMethodField()
+    class Meta(ProductListSerializer.Meta):
+        fields = ProductListSerializer.Meta.fields + ('bids',)
     def get_bids(self, obj):
-        return BidSerializer(obj.bids.all(), many=True).data
+        limit = getattr(settings, 'AUCTIONS_DETAIL_BID_LIMIT', 50)
+        return BidSerializer(obj.bids.select_related('bidder')[:limit], many=True).data
 
 class BidSerializer(serializers.ModelSerializer):
     bidder = UserSerializer(read_only=True)
     class Meta:
         model = Bid
         fields = ('id','product','bidder','amount','timestamp')
+
+class ArchivedBidSerializer(serializers.ModelSerializer):
+    bidder = UserSerializer(read_only=True)
+    class Meta:
+        model = ArchivedBid
+        fields = BidSerializer.Meta.fields
+
+class ArchivedProductSerializer(serializers.ModelSerializer):
+    """Renders an archived lot exactly like ProductDetailSerializer renders a live one."""
+    seller = UserSerializer(read_only=True)
+    is_active = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
+    leading_bid = serializers.IntegerField(source='leading_bid_id', read_only=True)
+    bids = serializers.SerializerMethodField()
+    class Meta:
+        model = ArchivedProduct
+        fields = ProductDetailSerializer.Meta.fields
+    def get_is_active(self, obj):
+        return False
+    def get_images(self, obj):
+        return images.variant_urls(obj.image_asset.variants if obj.image_asset_id else None, self.context.get('request'))
+    def get_bids(self, obj):
+        limit = getattr(settings, 'AUCTIONS_DETAIL_BID_LIMIT', 50)
+        return ArchivedBidSerializer(obj.bids.select_related('bidder')[:limit], many=True).data
@@ -0,0 +1,294 @@
+# Bidding business logic kept out of the views so it can run inside a single transaction
+from contextlib import nullcontext
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, When
+from django.utils import timezone
+from django.conf import settings
+from .models import Product, Bid, ProxyBid, NotificationFanout
+from . import events, caching
+
+CENT = Decimal('0.01')
+MAX_AMOUNT = Decimal('1e8')  # Product/Bid amounts are DecimalField(max_digits=10, decimal_places=2)
+
+
+class BidRejected(Exception):
+    """Raised when a bid cannot be accepted. `status_code` is what the API should answer with."""
+    def __init__(self, detail, status_code=409, current_price=None):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.current_price = current_price
+
+
+def parse_amount(amount):
+    try:
+        amount = Decimal(str(amount))
+        if not amount.is_finite() or amount <= 0 or amount >= MAX_AMOUNT:
+            raise ValueError
+        return amount.quantize(CENT)
+    except (InvalidOperation, TypeError, ValueError):
+        raise BidRejected('Invalid amount.', status_code=400)
+
+
+def place_bid(product_id, bidder, amount):
+    """Accept a bid with a single conditional UPDATE so concurrent bids are serialized by the row lock.
+
+    The UPDATE only matches while the auction is open and the new amount beats the stored price,
+    so a lower bid that lost a race can never overwrite a higher one. The Bid row is inserted in
+    the same transaction, while the product row is still locked.
+    """
+    amount = parse_amount(amount)
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        raise BidRejected('Not found.', status_code=404)
+    now = timezone.now()
+    first_bid_by_bidder = ~Exists(Bid.objects.filter(product_id=OuterRef('pk'), bidder_id=bidder.pk))
+    with transaction.atomic():
+        updated = (Product.objects
+                   .filter(pk=product_id, is_active=True, end_time__gt=now, current_price__lt=amount)
+                   .update(current_price=amount, bid_count=F('bid_count') + 1,
+                           unique_bidder_count=F('unique_bidder_count') + Case(When(first_bid_by_bidder, then=1), default=0)))
+        if updated:
+            bid = Bid.objects.create(product_id=product_id, bidder=bidder, amount=amount)
+            Product.objects.filter(pk=product_id).update(leading_bid=bid, last_bid_at=bid.timestamp)
+            events.publish_on_commit(product_id, 'bid', events.bid_event(bid))
+            caching.bump_products([product_id])
+            _answer_with_proxy(product_id, bidder.pk, amount)
+            return bid
+
+    # nothing matched: work out why (read-only, outside the transaction)
+    row = Product.objects.filter(pk=product_id).values('is_active', 'end_time', 'current_price').first()
+    if row is None:
+        raise BidRejected('Not found.', status_code=404)
+    if not row['is_active'] or row['end_time'] <= now:
+        raise BidRejected('Auction is closed.', status_code=400)
+    raise BidRejected('Bid must be greater than current price.', status_code=409, current_price=row['current_price'])
+
+
+def bid_increment():
+    return Decimal(str(getattr(settings, 'AUCTIONS_BID_INCREMENT', '1.00')))
+
+
+def _record_bids(product_id, bids, **fields):
+    """Insert strictly increasing (bidder_id, amount) bids on a lot whose row is locked, updating its statistics."""
+    bidder_ids = {bidder_id for bidder_id, _ in bids}
+    seen = set(Bid.objects.filter(product_id=product_id, bidder_id__in=bidder_ids).values_list('bidder_id', flat=True).distinct())
+    created = Bid.objects.bulk_create([Bid(product_id=product_id, bidder_id=bidder_id, amount=amount) for bidder_id, amount in bids])
+    leading = created[-1]
+    Product.objects.filter(pk=product_id).update(
+        current_price=leading.amount, bid_count=F('bid_count') + len(created),
+        unique_bidder_count=F('unique_bidder_count') + len(bidder_ids - seen),
+        leading_bid_id=leading.pk, last_bid_at=leading.timestamp, **fields)
+    for bid in created:
+        events.publish_on_commit(product_id, 'bid', events.bid_event(bid))
+    caching.bump_products([product_id])
+    return created
+
+
+def _proxy_answer(top, top_max, bidder_id, amount):
+    """How the top proxy answers a manual bid: (its bid amount or None, whether every proxy is now exhausted)."""
+    if top is None or top == bidder_id:
+        return None, False
+    if top_max > amount:
+        return min(top_max, amount + bid_increment()), False
+    # the second maximum is never above the first, so no proxy can answer any more
+    return None, True
+
+
+def _answer_with_proxy(product_id, bidder_id, amount):
+    """After a manual bid: the top proxy answers if its maximum allows, otherwise every proxy is exhausted."""
+    lot = Product.objects.filter(pk=product_id).values('proxy_bidder_id', 'proxy_max').get()
+    answer, exhausted = _proxy_answer(lot['proxy_bidder_id'], lot['proxy_max'], bidder_id, amount)
+    if answer is not None:
+        _record_bids(product_id, [(lot['proxy_bidder_id'], answer)])
+    elif exhausted:
+        Product.objects.filter(pk=product_id).update(proxy_bidder=None, proxy_max=None, proxy_second_max=None)
+
+
+def set_proxy_bid(product_id, bidder, max_amount):
+    """Register or raise `bidder`'s maximum on a lot and resolve it against the current top proxy.
+
+    Only the lot's two highest maxima are consulted (kept on Product), so resolution is constant time
+    however many proxies exist. The outcome is written as ordinary bids in one transaction: the losing
+    side bids up to its maximum and the winner one increment above it (capped at its own maximum);
+    on equal maxima the earlier proxy wins. Returns the bids created (possibly none).
+    """
+    max_amount = parse_amount(max_amount)
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        raise BidRejected('Not found.', status_code=404)
+    now = timezone.now()
+    with _bid_book_held([product_id]), transaction.atomic():
+        lot = (Product.objects.select_for_update().filter(pk=product_id)
+               .values('is_active', 'end_time', 'current_price', 'leading_bid__bidder_id', 'proxy_bidder_id', 'proxy_max', 'proxy_second_max')
+               .first())
+        if lot is None:
+            raise BidRejected('Not found.', status_code=404)
+        if not lot['is_active'] or lot['end_time'] <= now:
+            raise BidRejected('Auction is closed.', status_code=400)
+        existing = ProxyBid.objects.filter(product_id=product_id, bidder=bidder).values_list('max_amount', flat=True).first()
+        if existing is not None and max_amount < existing:
+            raise BidRejected('A maximum bid can only be raised.', status_code=400)
+        price, leader = lot['current_price'], lot['leading_bid__bidder_id']
+        if max_amount <= price and leader != bidder.pk:
+            raise BidRejected('Maximum must be greater than current price.', status_code=409, current_price=price)
+        ProxyBid.objects.update_or_create(product_id=product_id, bidder=bidder, defaults={'max_amount': max_amount})
+
+        top, top_max, second = lot['proxy_bidder_id'], lot['proxy_max'], lot['proxy_second_max']
+        increment = bid_increment()
+        bids = []
+        if top is None or top == bidder.pk:
+            top, top_max = bidder.pk, max_amount
+            if leader != bidder.pk:
+                bids.append((bidder.pk, min(max_amount, price + increment)))
+        elif max_amount > top_max:
+            # the current top proxy bids its maximum and is overtaken
+            if top_max > price:
+                bids.append((top, top_max))
+                price = top_max
+            bids.append((bidder.pk, min(max_amount, price + increment)))
+            top, top_max, second = bidder.pk, max_amount, top_max
+        else:
+            second = max(second or max_amount, max_amount)
+            if max_amount < top_max:
+                bids.append((bidder.pk, max_amount))
+                bids.append((top, min(top_max, max_amount + increment)))
+            elif top_max > price:
+                bids.append((top, top_max))
+
+        proxy = {'proxy_bidder_id': top, 'proxy_max': top_max, 'proxy_second_max': second}
+        if bids:
+            return _record_bids(product_id, bids, **proxy)
+        Product.objects.filter(pk=product_id).update(**proxy)
+        return []
+
+
+def place_bids_bulk(items):
+    """Validate and insert many bids across many lots in one transaction.
+
+    `items` is a sequence of (product_id, bidder_id, amount). Bids are grouped by lot; all lots are
+    locked once (in id order, so concurrent batches cannot deadlock) and each group is checked
+    against its current price in submission order. After each accepted bid the lot's top proxy answers
+    as it does for place_bid, so later bids in the group must beat that answer. Accepted and proxy bids
+    go in with one bulk_create and the lots' prices/statistics/proxy state with one bulk_update.
+    Returns one Bid or BidRejected per item, in order.
+    """
+    results = [None] * len(items)
+    by_product = {}
+    for index, (product_id, bidder_id, amount) in enumerate(items):
+        try:
+            amount = parse_amount(amount)
+            product_id = int(product_id)
+        except BidRejected as e:
+            results[index] = e
+            continue
+        except (TypeError, ValueError):
+            results[index] = BidRejected('Not found.', status_code=404)
+            continue
+        by_product.setdefault(product_id, []).append((index, bidder_id, amount))
+    if not by_product:
+        return results
+
+    now = timezone.now()
+    with _bid_book_held(by_product), transaction.atomic():
+        lots = {row['pk']: row for row in Product.objects.select_for_update().filter(pk__in=list(by_product)).order_by('pk')
+                .values('pk', 'is_active', 'end_time', 'current_price', 'bid_count', 'unique_bidder_count',
+                        'proxy_bidder_id', 'proxy_max', 'proxy_second_max')}
+        pending = []  # (input index, or None for a proxy's answer, Bid)
+        for product_id, group in by_product.items():
+            lot = lots.get(product_id)
+            for index, bidder_id, amount in group:
+                if lot is None:
+                    results[index] = BidRejected('Not found.', status_code=404)
+                elif not lot['is_active'] or lot['end_time'] <= now:
+                    results[index] = BidRejected('Auction is closed.', status_code=400)
+                elif amount <= lot['current_price']:
+                    results[index] = BidRejected('Bid must be greater than current price.', status_code=409, current_price=lot['current_price'])
+                else:
+                    lot['current_price'] = amount
+                    pending.append((index, Bid(product_id=product_id, bidder_id=bidder_id, amount=amount)))
+                    answer, exhausted = _proxy_answer(lot['proxy_bidder_id'], lot['proxy_max'], bidder_id, amount)
+                    if answer is not None:
+                        lot['current_price'] = answer
+                        pending.append((None, Bid(product_id=product_id, bidder_id=lot['proxy_bidder_id'], amount=answer)))
+                    elif exhausted:
+                        lot['proxy_bidder_id'] = lot['proxy_max'] = lot['proxy_second_max'] = None
+        if not pending:
+            return results
+
+        product_ids = {bid.product_id for _, bid in pending}
+        seen = set(Bid.objects.filter(product_id__in=product_ids, bidder_id__in={bid.bidder_id for _, bid in pending})
+                   .values_list('product_id', 'bidder_id').distinct())
+        created = Bid.objects.bulk_create([bid for _, bid in pending])
+        updates = {}
+        for (index, _), bid in zip(pending, created):
+            if index is not None:
+                results[index] = bid
+            lot = lots[bid.product_id]
+            lot['bid_count'] += 1
+            if (bid.product_id, bid.bidder_id) not in seen:
+                seen.add((bid.product_id, bid.bidder_id))
+                lot['unique_bidder_count'] += 1
+            updates[bid.product_id] = Product(
+                pk=bid.product_id, current_price=bid.amount, bid_count=lot['bid_count'],
+                unique_bidder_count=lot['unique_bidder_count'], leading_bid_id=bid.pk, last_bid_at=bid.timestamp,
+                proxy_bidder_id=lot['proxy_bidder_id'], proxy_max=lot['proxy_max'], proxy_second_max=lot['proxy_second_max'])
+            events.publish_on_commit(bid.product_id, 'bid', events.bid_event(bid))
+        Product.objects.bulk_update(list(updates.values()), ['current_price', 'bid_count', 'unique_bidder_count', 'leading_bid', 'last_bid_at',
+                                                             'proxy_bidder', 'proxy_max', 'proxy_second_max'])
+        caching.bump_products(list(updates))
+    return results
+
+
+def close_auction(product):
+    """Close a lot, record its winning bid and schedule the bidder notifications off the request path.
+
+    Returns the NotificationFanout job, or None if the lot was already closed.
+    """
+    from . import fanout
+    with _bid_book_held([product.pk]), transaction.atomic():
+        closed = Product.objects.filter(pk=product.pk, is_active=True).update(is_active=False, end_time=timezone.now())
+        if not closed:
+            return None
+        winning_bid_id = Product.objects.filter(pk=product.pk).values_list('leading_bid_id', flat=True).get()
+        job = NotificationFanout.objects.create(product_id=product.pk, winning_bid_id=winning_bid_id)
+        fanout.enqueue(job)
+        events.publish_on_commit(product.pk, 'closed', {'product': product.pk, 'winning_bid': winning_bid_id})
+        # end_time moves to now, which can reorder end_time-sorted list pages
+        caching.bump_products([product.pk], membership=True)
+    return job
+
+
+def close_expired_auctions(product_ids, now=None):
+    """Batch counterpart of close_auction for lots whose end_time has passed (used by the scheduler).
+
+    Lots that were extended, already closed, or are being closed by another worker are skipped.
+    Winners are read from leading_bid in the same query that locks the batch. Returns the fanout jobs created.
+    """
+    from . import fanout
+    now = now or timezone.now()
+    with _bid_book_held(product_ids), transaction.atomic():
+        rows = list(Product.objects.select_for_update(skip_locked=True)
+                    .filter(pk__in=product_ids, is_active=True, end_time__lte=now)
+                    .values_list('pk', 'leading_bid_id'))
+        if not rows:
+            return []
+        Product.objects.filter(pk__in=[pk for pk, _ in rows]).update(is_active=False)
+        jobs = NotificationFanout.objects.bulk_create(
+            [NotificationFanout(product_id=pk, winning_bid_id=bid_id) for pk, bid_id in rows])
+        for job in jobs:
+            fanout.enqueue(job)
+            events.publish_on_commit(job.product_id, 'closed', {'product': job.product_id, 'winning_bid': job.winning_bid_id})
+        caching.bump_products([job.product_id for job in jobs])
+    return jobs
+
+
+def _bid_book_held(product_ids):
+    """Lots written directly must not have bids queued in the bid book, nor take new ones until the write commits."""
+    from . import orderbook
+    if orderbook.enabled():
+        return orderbook.get_book().hold(product_ids)
+    return nullcontext()
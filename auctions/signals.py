@@ -0,0 +1,33 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Category, Product
+from . import caching, search
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    caching.bump_products([instance.pk], membership=True)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    search.get_backend().index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.get_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    caching.bump('category-list')
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    # the category name is part of each product's search document
+    product_ids = list(Product.objects.filter(category_id=instance.pk).values_list('pk', flat=True))
+    search.get_backend().index_products(product_ids)
@@ -0,0 +1,934 @@
+import csv
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+from django.db import connection, close_old_connections
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from auctioncraft_api import instrumentation
+from auctioncraft_api.db_routing import ReplicaRouter
+from users import authentication
+from payments.models import Order
+from users.models import User, Notification, OutboundEmail
+from .models import Category, Product, ProductImage, Bid, NotificationFanout, ArchivedProduct, ArchivedBid
+from .serializers import ProductListSerializer, ProductDetailSerializer, BidSerializer
+from .scheduler import AuctionScheduler
+from . import services, orderbook, fanout, search, events, fast_serializers, caching, archive, images, exports
+
+
+def make_product(seller, price='10.00', **fields):
+    now = timezone.now()
+    fields.setdefault('start_time', now - timedelta(hours=1))
+    fields.setdefault('end_time', now + timedelta(hours=1))
+    return Product.objects.create(seller=seller, title=fields.pop('title', 'Lamp'), starting_price=Decimal(price),
+                                  current_price=Decimal(price), **fields)
+
+
+class PlaceBidTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller')
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.product = make_product(self.seller)
+
+    def test_accepted_bid_updates_price_and_statistics(self):
+        services.place_bid(self.product.pk, self.alice, '11')
+        bid = services.place_bid(self.product.pk, self.bob, '12.50')
+        services.place_bid(self.product.pk, self.alice, '13')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.current_price, Decimal('13.00'))
+        self.assertEqual((self.product.bid_count, self.product.unique_bidder_count), (3, 2))
+        self.assertEqual(Bid.objects.get(pk=self.product.leading_bid_id).bidder, self.alice)
+        self.assertEqual(bid.amount, Decimal('12.50'))
+
+    def test_lower_or_equal_bid_is_rejected_with_current_price(self):
+        services.place_bid(self.product.pk, self.alice, '20')
+        for amount in ('20', '15'):
+            with self.assertRaises(services.BidRejected) as rejected:
+                services.place_bid(self.product.pk, self.bob, amount)
+            self.assertEqual(rejected.exception.status_code, 409)
+            self.assertEqual(rejected.exception.current_price, Decimal('20.00'))
+        self.assertEqual(Bid.objects.filter(product=self.product).count(), 1)
+
+    def test_closed_missing_and_invalid(self):
+        closed = make_product(self.seller, end_time=timezone.now() - timedelta(seconds=1))
+        cases = [(closed.pk, '50', 400), (0, '50', 404), ('abc', '50', 404), (self.product.pk, 'x', 400), (self.product.pk, '-1', 400)]
+        for product_id, amount, status_code in cases:
+            with self.assertRaises(services.BidRejected) as rejected:
+                services.place_bid(product_id, self.alice, amount)
+            self.assertEqual(rejected.exception.status_code, status_code)
+
+
+@override_settings(AUCTIONS_BID_BOOK=True)
+class BidBookTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller')
+        self.alice = User.objects.create_user('alice')
+        self.product = make_product(self.seller)
+        # flushed explicitly by the tests instead of the background thread
+        self.book = orderbook.BidBook(shards=4)
+        patches = [mock.patch.object(orderbook, '_book', self.book), mock.patch.object(orderbook.BidBook, '_ensure_flusher')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_invalid_product_id_is_not_found(self):
+        for product_id in ('abc', None, 0):
+            with self.assertRaises(services.BidRejected) as rejected:
+                self.book.place_bid(product_id, self.alice, '11')
+            self.assertEqual(rejected.exception.status_code, 404)
+
+    def test_flushed_bid_keeps_its_acceptance_time(self):
+        accepted_at = self.book.place_bid(self.product.pk, self.alice, '11').timestamp
+        with mock.patch('django.utils.timezone.now', return_value=accepted_at + timedelta(minutes=5)):
+            self.assertEqual(self.book.flush(), 1)
+        bid = Bid.objects.get(product=self.product)
+        self.product.refresh_from_db()
+        self.assertEqual(bid.timestamp, accepted_at)
+        self.assertEqual(self.product.last_bid_at, accepted_at)
+
+    def test_close_writes_queued_bids_first(self):
+        self.book.place_bid(self.product.pk, self.alice, '11')
+        job = services.close_auction(self.product)
+        winner = Bid.objects.get(product=self.product)
+        self.assertEqual((winner.bidder, winner.amount), (self.alice, Decimal('11.00')))
+        self.assertEqual(job.winning_bid_id, winner.pk)
+        with self.assertRaises(services.BidRejected) as rejected:
+            self.book.place_bid(self.product.pk, self.alice, '12')
+        self.assertEqual(rejected.exception.status_code, 400)
+
+    def test_bids_on_a_held_lot_wait_for_the_write(self):
+        self.book.place_bid(self.product.pk, self.alice, '11')
+        rejected = []
+
+        def bid():
+            try:
+                self.book.place_bid(self.product.pk, self.alice, '12')
+            except services.BidRejected as e:
+                rejected.append(e.status_code)
+
+        # the test transaction is not visible to other threads, so the reload after the hold is stubbed
+        closed = orderbook.LotState(Decimal('11.00'), self.alice.pk, self.product.end_time, False)
+        with mock.patch.object(self.book, '_load', return_value=closed):
+            with self.book.hold([self.product.pk]):
+                self.assertEqual(Bid.objects.filter(product=self.product).count(), 1)
+                thread = threading.Thread(target=bid)
+                thread.start()
+                thread.join(0.2)
+                self.assertTrue(thread.is_alive())
+            thread.join(5)
+        self.assertEqual(rejected, [400])
+
+    def test_scheduler_close_in_this_process_writes_queued_bids_first(self):
+        self.book.place_bid(self.product.pk, self.alice, '11')
+        Product.objects.filter(pk=self.product.pk).update(end_time=timezone.now() - timedelta(seconds=1))
+        services.close_expired_auctions([self.product.pk])
+        winner = Bid.objects.get(product=self.product)
+        self.assertEqual(NotificationFanout.objects.get(product=self.product).winning_bid_id, winner.pk)
+        self.assertEqual(self.book.flush(), 0)
+
+    def test_close_from_another_process_keeps_bids_placed_before_the_end(self):
+        bob = User.objects.create_user('bob')
+        accepted = self.book.place_bid(self.product.pk, self.alice, '11')
+        # the scheduler process closes the lot without seeing this process's queue
+        end_time = accepted.timestamp + timedelta(milliseconds=1)
+        Product.objects.filter(pk=self.product.pk).update(end_time=end_time, is_active=False)
+        NotificationFanout.objects.create(product=self.product)
+        late = Bid(product_id=self.product.pk, bidder=bob, amount=Decimal('12.00'), timestamp=end_time)
+        self.book._pending.append(late)
+        with self.assertLogs('auctions.orderbook', 'WARNING'):
+            self.assertEqual(self.book.flush(), 1)
+        winner = Bid.objects.get(product=self.product)
+        self.product.refresh_from_db()
+        self.assertEqual((winner.bidder, self.product.leading_bid_id, self.product.current_price), (self.alice, winner.pk, Decimal('11.00')))
+        self.assertEqual(NotificationFanout.objects.get(product=self.product).winning_bid_id, winner.pk)
+
+    def test_scheduler_waits_out_the_grace_period(self):
+        now = timezone.now()
+        Product.objects.filter(pk=self.product.pk).update(end_time=now)
+        scheduler = AuctionScheduler(grace=timedelta(seconds=2))
+        self.assertEqual(scheduler.tick(now + timedelta(seconds=1)), 0)
+        self.assertEqual(scheduler.seconds_until_next(now + timedelta(seconds=1)), 1)
+        self.assertEqual(scheduler.tick(now + timedelta(seconds=2)), 1)
+
+
+class SchedulerTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        seller = User.objects.create_user('seller')
+        self.products = [make_product(seller, end_time=self.now + timedelta(seconds=s)) for s in (30, 10, 20)]
+        self.scheduler = AuctionScheduler(refresh_every=timedelta(seconds=5), grace=timedelta(0))
+
+    def at(self, seconds):
+        return self.now + timedelta(seconds=seconds)
+
+    def active(self):
+        return set(Product.objects.filter(is_active=True).values_list('pk', flat=True))
+
+    def test_lots_close_in_end_time_order(self):
+        third, first, second = self.products
+        self.scheduler.refresh(self.now)
+        self.assertEqual(self.scheduler.seconds_until_next(self.at(4)), 1)
+        self.assertEqual(self.scheduler.due(self.at(25)), [first.pk, second.pk])
+        self.assertEqual(self.scheduler.due(self.at(25)), [])
+        self.assertEqual(self.scheduler.due(self.at(30)), [third.pk])
+
+    def test_tick_closes_only_due_lots(self):
+        self.assertEqual(self.scheduler.tick(self.at(25)), 2)
+        self.assertEqual(self.active(), {self.products[0].pk})
+        self.assertEqual(self.scheduler.tick(self.at(30)), 1)
+        self.assertEqual(self.active(), set())
+
+    def test_lot_moved_earlier_closes_at_the_next_refresh(self):
+        lot = self.products[0]
+        self.assertEqual(self.scheduler.tick(self.at(1)), 0)
+        Product.objects.filter(pk=lot.pk).update(end_time=self.at(3))
+        self.assertEqual(self.scheduler.tick(self.at(6)), 1)
+        self.assertNotIn(lot.pk, self.active())
+        # its old entry is skipped when it comes up
+        self.assertEqual(self.scheduler.tick(self.at(31)), 2)
+
+    def test_extended_lot_is_skipped_and_closed_later(self):
+        lot = self.products[1]
+        self.scheduler.refresh(self.now)
+        Product.objects.filter(pk=lot.pk).update(end_time=self.at(40))
+        self.assertEqual(self.scheduler.tick(self.at(15)), 0)
+        self.assertIn(lot.pk, self.active())
+        self.assertEqual(self.scheduler.tick(self.at(40)), 3)
+        self.assertEqual(self.active(), set())
+
+
+class ProxyBidTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.carol = User.objects.create_user('carol')
+        self.product = make_product(User.objects.create_user('seller'))
+
+    def state(self):
+        self.product.refresh_from_db()
+        leader = Bid.objects.get(pk=self.product.leading_bid_id).bidder
+        return self.product.current_price, leader, self.product.proxy_bidder, self.product.proxy_max
+
+    def test_competing_maxima(self):
+        services.set_proxy_bid(self.product.pk, self.carol, '50')
+        self.assertEqual(self.state(), (Decimal('11.00'), self.carol, self.carol, Decimal('50.00')))
+        services.set_proxy_bid(self.product.pk, self.bob, '40')
+        self.assertEqual(self.state(), (Decimal('41.00'), self.carol, self.carol, Decimal('50.00')))
+        services.set_proxy_bid(self.product.pk, self.bob, '50')  # a tie goes to the earlier maximum
+        self.assertEqual(self.state()[:2], (Decimal('50.00'), self.carol))
+
+    def test_manual_bid_is_answered(self):
+        services.set_proxy_bid(self.product.pk, self.carol, '50')
+        services.place_bid(self.product.pk, self.alice, '30')
+        self.assertEqual(self.state(), (Decimal('31.00'), self.carol, self.carol, Decimal('50.00')))
+        services.place_bid(self.product.pk, self.alice, '60')
+        self.assertEqual(self.state(), (Decimal('60.00'), self.alice, None, None))
+
+    def test_bulk_bids_are_answered_like_single_bids(self):
+        services.set_proxy_bid(self.product.pk, self.carol, '50')
+        results = services.place_bids_bulk([(self.product.pk, self.alice.pk, '30'), (self.product.pk, self.bob.pk, '31')])
+        self.assertIsInstance(results[0], Bid)
+        self.assertEqual((results[1].status_code, results[1].current_price), (409, Decimal('31.00')))
+        self.assertEqual(self.state(), (Decimal('31.00'), self.carol, self.carol, Decimal('50.00')))
+        self.assertEqual(self.product.bid_count, Bid.objects.filter(product=self.product).count())
+        results = services.place_bids_bulk([(self.product.pk, self.bob.pk, '60')])
+        self.assertEqual(self.state(), (Decimal('60.00'), self.bob, None, None))
+
+
+class FanoutTests(TestCase):
+    def setUp(self):
+        seller = User.objects.create_user('seller')
+        self.bidders = [User.objects.create_user(f'bidder{i}', email=f'bidder{i}@example.com') for i in range(5)]
+        self.product = make_product(seller)
+        for i, bidder in enumerate(self.bidders + self.bidders[:2]):
+            services.place_bid(self.product.pk, bidder, str(11 + i))
+        self.job = services.close_auction(self.product)
+
+    def test_every_bidder_is_notified_once(self):
+        fanout.run(self.job.pk, chunk_size=2)
+        fanout.run(self.job.pk, chunk_size=2)
+        self.assertEqual(sorted(Notification.objects.values_list('user_id', flat=True)), sorted(u.pk for u in self.bidders))
+        self.assertEqual(OutboundEmail.objects.count(), 5)
+        winner = Notification.objects.get(user=self.bidders[1])
+        self.assertIn('You won', winner.title)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.notified_count, 5)
+        self.assertIsNotNone(self.job.completed_at)
+
+    def test_resumes_after_a_failed_chunk(self):
+        real = fanout.outbox.enqueue_many
+        calls = []
+
+        def flaky(messages):
+            calls.append(len(messages))
+            if len(calls) == 2:
+                raise RuntimeError('mail queue down')
+            return real(messages)
+
+        with mock.patch.object(fanout.outbox, 'enqueue_many', flaky), self.assertRaises(RuntimeError):
+            fanout.run(self.job.pk, chunk_size=2)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(fanout.resume_pending(), 1)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(OutboundEmail.objects.values('to_email').distinct().count(), 5)
+
+
+class BidEndpointTests(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.product = make_product(User.objects.create_user('seller'))
+        self.client.force_authenticate(self.alice)
+
+    def test_bid_list_create_goes_through_bid_placement(self):
+        response = self.client.post('/api/bids/', {'product': self.product.pk, 'amount': '12'})
+        self.assertEqual(response.status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.current_price, self.product.bid_count), (Decimal('12.00'), 1))
+        self.assertEqual(self.product.leading_bid_id, response.data['id'])
+        response = self.client.post('/api/bids/', {'product': self.product.pk, 'amount': '11'})
+        self.assertEqual((response.status_code, response.data['current_price']), (409, '12.00'))
+        self.assertEqual(self.client.post('/api/bids/', {'product': 'x', 'amount': '20'}).status_code, 404)
+
+    def test_bulk_bidder_is_validated(self):
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_authenticate(staff)
+        item = {'product': self.product.pk, 'amount': '12'}
+        response = self.client.post('/api/bids/bulk/', {'bids': [{**item, 'bidder': str(self.alice.pk)}]}, format='json')
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual(Bid.objects.get(product=self.product).bidder, self.alice)
+        for bidder in ('abc', [1], 10 ** 6):
+            response = self.client.post('/api/bids/bulk/', {'bids': [{**item, 'amount': '13', 'bidder': bidder}]}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_bids_cannot_be_edited_or_deleted(self):
+        bid = services.place_bid(self.product.pk, self.alice, '12')
+        self.assertEqual(self.client.patch(f'/api/bids/{bid.pk}/', {'amount': '99'}).status_code, 405)
+        self.assertEqual(self.client.delete(f'/api/bids/{bid.pk}/').status_code, 405)
+
+
+class ProductEventsTests(TestCase):
+    def setUp(self):
+        self.product = make_product(User.objects.create_user('seller'))
+
+    def test_not_served_over_wsgi(self):
+        self.assertEqual(self.client.get(f'/api/products/{self.product.pk}/events/').status_code, 501)
+
+    async def test_stream_ends_with_the_closed_event(self):
+        response = await self.async_client.get(f'/api/products/{self.product.pk}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        events.publish(self.product.pk, 'bid', {'amount': '11.00'})
+        events.publish(self.product.pk, 'closed', {'product': self.product.pk, 'winning_bid': None})
+        frames = [frame async for frame in stream]
+        self.assertEqual([frame.split(b'\n')[0] for frame in frames], [b'event: bid', b'event: closed'])
+        self.assertEqual(events.hub.subscriber_count(self.product.pk), 0)
+
+
+class EventBrokerTests(TestCase):
+    def test_auto_picks_the_cross_process_broker_on_postgres(self):
+        self.assertEqual(events.broker_path(), 'auctions.events.LocalBroker')  # the test database is SQLite
+        with mock.patch.object(events.connection, 'vendor', 'postgresql'):
+            self.assertEqual(events.broker_path(), 'auctions.events.PostgresBroker')
+        with self.settings(AUCTIONS_EVENT_BROKER='auctions.events.LocalBroker'), \
+                mock.patch.object(events.connection, 'vendor', 'postgresql'):
+            self.assertEqual(events.broker_path(), 'auctions.events.LocalBroker')
+
+    def test_notification_payload_reaches_local_subscribers(self):
+        cursor = mock.MagicMock()
+        with mock.patch.object(events, 'connections', {'default': mock.Mock(cursor=lambda: cursor)}):
+            events.PostgresBroker().publish(7, events.sse_frame('bid', {'amount': '11.00'}))
+        (sql, (channel, payload)), _ = cursor.__enter__.return_value.execute.call_args
+        self.assertEqual((sql, channel), ('SELECT pg_notify(%s, %s)', events.CHANNEL))
+        with mock.patch.object(events.hub, 'dispatch') as dispatch:
+            events.receive(payload)
+        dispatch.assert_called_once_with(7, 'event: bid\ndata: {"amount":"11.00"}\n\n')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs LISTEN/NOTIFY')
+class PostgresBrokerTests(TransactionTestCase):
+    def test_event_published_anywhere_reaches_the_listener(self):
+        broker = events.PostgresBroker()
+        received = threading.Event()
+        with mock.patch.object(events.hub, 'dispatch', side_effect=lambda *args: received.set()) as dispatch:
+            broker.listen()
+            time.sleep(0.5)  # let the listener connect
+            broker.publish(7, events.sse_frame('closed', {'product': 7}))
+            self.assertTrue(received.wait(10))
+        self.assertEqual(dispatch.call_args.args[0], 7)
+
+
+class ProductPaginationTests(APITestCase):
+    def setUp(self):
+        seller = User.objects.create_user('seller')
+        self.products = [make_product(seller, title=f'Lot {i}') for i in range(5)]
+        for product in self.products[:2]:
+            services.place_bid(product.pk, User.objects.create_user(f'bidder{product.pk}'), '20')
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_default_feed_uses_cursors(self):
+        response = self.client.get('/api/products/?page_size=2')
+        self.assertIn('cursor=', response.data['next'])
+        self.assertEqual(sorted(self.walk('/api/products/?page_size=2')), sorted(p.pk for p in self.products))
+
+    def test_nullable_ordering_returns_every_lot(self):
+        for ordering in ('last_bid_at', '-last_bid_at'):
+            with self.subTest(ordering=ordering):
+                ids = self.walk(f'/api/products/?ordering={ordering}&page_size=2')
+                self.assertEqual(sorted(ids), sorted(p.pk for p in self.products))
+
+    def test_mutable_orderings_use_page_numbers_with_an_id_tiebreaker(self):
+        for ordering in ('bid_count', '-current_price', 'end_time'):
+            with self.subTest(ordering=ordering):
+                response = self.client.get(f'/api/products/?ordering={ordering}&page_size=2')
+                self.assertIn('page=2', response.data['next'])
+                ids = self.walk(f'/api/products/?ordering={ordering}&page_size=2')
+                self.assertEqual(sorted(ids), sorted(p.pk for p in self.products))
+        # three lots tie on bid_count=0: they come in id order
+        ids = self.walk('/api/products/?ordering=bid_count&page_size=2')
+        self.assertEqual(ids[:3], [p.pk for p in self.products[2:]])
+
+
+class ArchiveTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller')
+        self.bidders = [User.objects.create_user(f'bidder{i}') for i in range(3)]
+        self.cutoff = timezone.now() - timedelta(days=30)
+
+    def lot(self, ended_days_ago, bids=3, closed=True):
+        product = make_product(self.seller)
+        for i in range(bids):
+            services.place_bid(product.pk, self.bidders[i % 3], str(11 + i))
+        end = timezone.now() - timedelta(days=ended_days_ago)
+        Product.objects.filter(pk=product.pk).update(end_time=end, start_time=end - timedelta(days=1), is_active=not closed)
+        product.refresh_from_db()
+        return product
+
+    def test_only_settled_lots_past_the_cutoff_move(self):
+        moved = [self.lot(60), self.lot(60, bids=0)]
+        NotificationFanout.objects.create(product=moved[0], completed_at=timezone.now())
+        Order.objects.create(product=moved[1], winning_bid_id=0, buyer=self.seller, amount=1, status=Order.PAID)
+        kept = [self.lot(60, closed=False), self.lot(10)]
+        kept.append(self.lot(60))
+        NotificationFanout.objects.create(product=kept[-1])  # still notifying bidders
+        kept.append(self.lot(60))
+        Order.objects.create(product=kept[-1], winning_bid_id=kept[-1].leading_bid_id, buyer=self.bidders[2], amount=13)
+        self.assertEqual(archive.archive(self.cutoff), (2, 3))
+        self.assertEqual(sorted(ArchivedProduct.objects.values_list('pk', flat=True)), sorted(p.pk for p in moved))
+        self.assertEqual(sorted(Product.objects.values_list('pk', flat=True)), sorted(p.pk for p in kept))
+
+    def test_bids_are_copied_before_the_lot_is_deleted(self):
+        product = self.lot(60, bids=5)
+        bids = list(Bid.objects.filter(product=product).order_by('id').values_list('id', 'bidder_id', 'amount', 'timestamp'))
+        self.assertEqual(archive.archive_batch(self.cutoff, bid_chunk_size=2), (1, 5))
+        self.assertFalse(Bid.objects.filter(product_id=product.pk).exists())
+        self.assertEqual(list(ArchivedBid.objects.filter(product_id=product.pk).order_by('id')
+                              .values_list('id', 'bidder_id', 'amount', 'timestamp')), bids)
+        archived = ArchivedProduct.objects.get(pk=product.pk)
+        self.assertEqual((archived.current_price, archived.bid_count, archived.leading_bid_id),
+                         (product.current_price, 5, product.leading_bid_id))
+
+    def test_detail_falls_back_to_the_archive(self):
+        product = self.lot(60)
+        archive.archive(self.cutoff)
+        response = self.client.get(f'/api/products/{product.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['id'], response.data['current_price']), (product.pk, '13.00'))
+        self.assertEqual(self.client.get('/api/products/999999/').status_code, 404)
+
+    def test_batches_and_reruns_neither_duplicate_nor_lose_rows(self):
+        lots = [self.lot(60 + i) for i in range(3)]
+        self.assertEqual(archive.archive_batch(self.cutoff, batch_size=2), (2, 6))
+        self.assertEqual(archive.archive(self.cutoff, batch_size=2), (1, 3))
+        self.assertEqual(archive.archive(self.cutoff), (0, 0))
+        self.assertEqual(ArchivedProduct.objects.count(), 3)
+        self.assertEqual(ArchivedBid.objects.count(), 9)
+        self.assertFalse(Product.objects.filter(pk__in=[p.pk for p in lots]).exists())
+
+    def test_interrupted_batch_leaves_the_lots_live(self):
+        product = self.lot(60, bids=5)
+        real, calls = ArchivedBid.objects.bulk_create, []
+
+        def fail_second_chunk(objs, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 2:
+                raise RuntimeError('connection lost')
+            return real(objs, **kwargs)
+        with mock.patch.object(ArchivedBid.objects, 'bulk_create', fail_second_chunk), self.assertRaises(RuntimeError):
+            archive.archive_batch(self.cutoff, bid_chunk_size=2)
+        self.assertEqual(Bid.objects.filter(product=product).count(), 5)
+        self.assertFalse(ArchivedProduct.objects.exists() or ArchivedBid.objects.exists())
+        product.refresh_from_db()
+        self.assertIsNotNone(product.leading_bid_id)
+        self.assertEqual(archive.archive(self.cutoff), (1, 5))
+
+
+@override_settings(AUCTIONS_IMAGE_VARIANTS={'thumb': 320, 'medium': 960}, AUCTIONS_IMAGE_MAX_ATTEMPTS=2)
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        seller = User.objects.create_user('seller')
+        self.lamp, self.vase = make_product(seller, title='Lamp'), make_product(seller, title='Vase')
+
+    def photo(self, name='photo.png', size=(1200, 600)):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGBA', size, (200, 40, 40, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_same_photo_is_stored_and_processed_once(self):
+        data = self.photo().read()
+        with mock.patch.object(images, 'wake') as wake, self.captureOnCommitCallbacks(execute=True):
+            images.attach(self.lamp, SimpleUploadedFile('a.png', data))
+            images.attach(self.vase, SimpleUploadedFile('b.PNG', data))
+        asset = ProductImage.objects.get()
+        wake.assert_called_once_with()
+        self.assertEqual(set(Product.objects.values_list('image_asset', flat=True)), {asset.pk})
+        self.assertEqual(asset.original.name, f'products/originals/{asset.content_hash[:2]}/{asset.content_hash}.png')
+        self.assertEqual(default_storage.listdir(f'products/originals/{asset.content_hash[:2]}')[1], [f'{asset.content_hash}.png'])
+        images.attach(self.vase, None)
+        self.assertIsNone(Product.objects.get(pk=self.vase.pk).image_asset)
+
+    def test_drain_renders_every_size_and_format(self):
+        from PIL import Image
+        images.attach(self.lamp, self.photo())
+        self.assertEqual(images.drain(), {'ready': 1, 'failed': 0, 'retry': 0})
+        asset = ProductImage.objects.get()
+        self.assertEqual((asset.status, asset.width, asset.height), (ProductImage.READY, 1200, 600))
+        self.assertEqual({size: set(formats) for size, formats in asset.variants.items()},
+                         {'thumb': {'jpeg', 'webp'}, 'medium': {'jpeg', 'webp'}})
+        for size_name, width in (('thumb', 320), ('medium', 960)):
+            with default_storage.open(asset.variants[size_name]['jpeg']) as f, Image.open(f) as rendered:
+                self.assertEqual((rendered.format, rendered.size), ('JPEG', (width, width // 2)))
+        urls = images.variant_urls(asset.variants)
+        self.assertTrue(urls['thumb']['webp'].endswith(f'{asset.content_hash}/thumb.webp'))
+        self.assertEqual(images.drain(), {'ready': 0, 'failed': 0, 'retry': 0})
+
+    def test_unreadable_upload_is_retried_then_failed(self):
+        images.attach(self.lamp, SimpleUploadedFile('broken.jpg', b'not an image'))
+        with self.assertLogs('auctions.images', 'WARNING'):
+            self.assertEqual(images.drain()['retry'], 1)
+            asset = ProductImage.objects.get()
+            self.assertGreater(asset.available_at, timezone.now())
+            ProductImage.objects.update(available_at=timezone.now())
+            self.assertEqual(images.drain()['failed'], 1)
+        asset.refresh_from_db()
+        self.assertEqual((asset.status, asset.attempts, asset.variants), (ProductImage.FAILED, 2, {}))
+        self.assertEqual(images.rebuild(), 1)
+        self.assertEqual(ProductImage.objects.get().status, ProductImage.PENDING)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller')
+        self.alice, self.bob = User.objects.create_user('alice'), User.objects.create_user('bob')
+        self.lamp = make_product(self.seller, title='Lamp')
+        services.place_bid(self.lamp.pk, self.alice, '11')
+        services.place_bid(self.lamp.pk, self.bob, '12.50')
+        old = make_product(self.seller, title='Old vase')
+        services.place_bid(old.pk, self.alice, '20')
+        ended = timezone.now() - timedelta(days=60)
+        Product.objects.filter(pk=old.pk).update(is_active=False, end_time=ended, start_time=ended - timedelta(days=1))
+        archive.archive(timezone.now() - timedelta(days=30))
+        self.old = old
+        make_product(User.objects.create_user('other'), title='Not mine')
+
+    def export(self, path, user=None, **params):
+        self.client.force_authenticate(user or self.seller)
+        response = self.client.get(f'/api/exports/{path}', params)
+        body = b''.join(response.streaming_content).decode() if response.status_code == 200 else None
+        return response, body
+
+    def test_bids_as_csv(self):
+        response, body = self.export('bids.csv')
+        self.assertEqual((response['Content-Type'], response['Cache-Control']), ('text/csv', 'no-store'))
+        header, *lines = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(tuple(header), exports.BID_COLUMNS)
+        self.assertEqual([(line[1], line[6], line[7], line[9], line[10]) for line in lines],
+                         [(str(self.lamp.pk), 'alice', '11.00', 'False', 'False'),
+                          (str(self.lamp.pk), 'bob', '12.50', 'True', 'False'),
+                          (str(self.old.pk), 'alice', '20.00', 'True', 'True')])
+
+    def test_results_as_jsonl(self):
+        response, body = self.export('results.jsonl', user=User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        results = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([(r['title'], r['final_price'], r['leading_bidder_username'], r['archived']) for r in results],
+                         [('Lamp', '12.50', 'bob', False), ('Not mine', '10.00', None, False), ('Old vase', '20.00', 'alice', True)])
+        self.assertEqual(set(results[0]), set(exports.RESULT_COLUMNS))
+
+    def test_filters_and_access(self):
+        _, body = self.export('bids.jsonl', product=self.lamp.pk, since=timezone.now().date().isoformat())
+        self.assertEqual(len(body.splitlines()), 2)
+        self.assertEqual(self.export('bids.csv', user=self.alice, seller=self.seller.pk)[0].status_code, 403)
+        self.assertEqual(self.export('bids.csv', since='yesterday')[0].status_code, 400)
+        self.assertEqual(self.export('bids.xml')[0].status_code, 404)
+
+    def test_rows_are_read_and_rendered_a_batch_at_a_time(self):
+        with self.assertNumQueries(0):
+            columns, rows = exports.rows('bids', {})
+        read = []
+
+        def counted():
+            for row in rows:
+                read.append(row)
+                yield row
+        chunks = exports.render(columns, counted(), 'jsonl', lines_per_chunk=2)
+        with self.assertNumQueries(1):
+            first = next(chunks)
+        self.assertEqual((len(first.splitlines()), len(read)), (2, 2))
+        self.assertEqual(len(next(chunks).splitlines()), 1)
+        self.assertEqual(len(read), 3)
+
+    def test_query_reads_rows_in_chunks(self):
+        with mock.patch('django.db.models.query.QuerySet.iterator', autospec=True, return_value=iter([])) as iterator:
+            list(exports.rows('results', {}, chunk_size=50)[1])
+        self.assertEqual([c.kwargs['chunk_size'] for c in iterator.call_args_list], [50, 50])
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.product = make_product(User.objects.create_user('seller'))
+        self.url = f'/api/products/{self.product.pk}/'
+
+    def test_not_used_with_a_per_process_cache(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('ETag', response)
+        # e.g. a bid taken by another worker, which cannot reach this process's cache
+        Product.objects.filter(pk=self.product.pk).update(current_price=Decimal('99.00'))
+        self.assertEqual(self.client.get(self.url).data['current_price'], '99.00')
+
+    @override_settings(CACHE_SHARED=True)
+    def test_etag_changes_with_each_bid(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.place_bid(self.product.pk, self.alice, '12')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data['current_price']), (200, '12.00'))
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(CACHE_SHARED=True, AUCTIONS_FAST_SERIALIZERS=True)
+    def test_bid_committed_while_rows_load_is_not_cached_as_current(self):
+        render, amounts = fast_serializers.product_rows, iter(['12', '13'])
+
+        def rows_then_bid(queryset, request):
+            rows = render(queryset, request)  # the query has run: this bid lands after it
+            with self.captureOnCommitCallbacks(execute=True):
+                services.place_bid(self.product.pk, self.alice, next(amounts))
+            return rows
+
+        def current_price():
+            return self.client.get('/api/products/').data['results'][0]['current_price']
+
+        # the page miss, then (rows evicted by a bump) the hit that loads the page's rows
+        for step, price in enumerate(('12.00', '13.00')):
+            if step:
+                with self.captureOnCommitCallbacks(execute=True):
+                    caching.bump_products([self.product.pk])
+            with mock.patch.object(fast_serializers, 'product_rows', rows_then_bid):
+                self.client.get('/api/products/')
+            self.assertEqual(current_price(), price)
+
+
+class FastSerializerParityTests(TestCase):
+    """fast_serializers must render exactly what the DRF serializers render."""
+
+    def setUp(self):
+        seller = User.objects.create_user('seller', email='seller@example.com', first_name='Sam', phone='555-0100')
+        bidder = User.objects.create_user('bidder')
+        category = Category.objects.create(name='Lighting', slug='lighting')
+        ready = ProductImage.objects.create(content_hash='a' * 64, original='products/originals/aa/lamp.jpg', status=ProductImage.READY,
+                                            variants={'thumb': {'jpeg': 'products/variants/thumb.jpeg', 'webp': 'products/variants/thumb.webp'}})
+        pending = ProductImage.objects.create(content_hash='b' * 64, original='products/originals/bb/vase.png')
+        make_product(seller, title='No image', description='plain')
+        make_product(seller, title='Ready image', category=category, image=ready.original.name, image_asset=ready)
+        make_product(seller, title='Pending image', image=pending.original.name, image_asset=pending)
+        make_product(seller, title='Legacy image', image='products/old.jpg')
+        for product in Product.objects.all():
+            services.place_bid(product.pk, bidder, '11.25')
+        services.place_bid(product.pk, seller, '12')
+        self.request = Request(APIRequestFactory().get('/api/products/'))
+        self.products = Product.objects.select_related('seller', 'image_asset').order_by('pk')
+
+    def assertSameJSON(self, drf, fast):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast).decode(), renderer.render(drf).decode())
+
+    def test_product_list(self):
+        drf = ProductListSerializer(self.products, many=True, context={'request': self.request}).data
+        fast = fast_serializers.product_rows(self.products.values(*fast_serializers.PRODUCT_VALUES), self.request)
+        self.assertSameJSON(drf, fast)
+        self.assertEqual([row['images'] is None for row in fast], [True, False, True, True])
+
+    def test_product_detail(self):
+        for product in self.products:
+            with self.subTest(product=product.title):
+                drf = ProductDetailSerializer(product, context={'request': self.request}).data
+                self.assertSameJSON(drf, fast_serializers.product_detail(Product.objects.filter(pk=product.pk), self.request))
+
+    def test_bid_list(self):
+        bids = Bid.objects.select_related('bidder')
+        drf = BidSerializer(bids, many=True, context={'request': self.request}).data
+        self.assertSameJSON(drf, fast_serializers.bid_rows(bids.values(*fast_serializers.BID_VALUES), self.request))
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        search.get_backend().reset()
+        seller = User.objects.create_user('seller')
+        self.lighting = Category.objects.create(name='Lighting', slug='lighting')
+        self.antiques = Category.objects.create(name='Antiques', slug='antiques')
+        now = timezone.now()
+        Product.objects.bulk_create([
+            Product(seller=seller, title=f'Lamp {i}', category=self.lighting if i % 2 else self.antiques,
+                    starting_price=i + 1, current_price=i + 1, start_time=now, end_time=now + timedelta(days=1))
+            for i in range(1500)])
+        search.get_backend().reset()  # bulk_create sends no signals
+
+    def test_filters_counts_and_facets_cover_every_match(self):
+        response = self.client.get('/api/products/search/', {'q': 'lamp'})
+        self.assertEqual(response.data['count'], 1500)
+        self.assertEqual(sorted(f['count'] for f in response.data['facets']['category']), [750, 750])
+        response = self.client.get('/api/products/search/', {'q': 'lamp', 'category': self.antiques.pk, 'limit': 100})
+        self.assertEqual((response.data['count'], len(response.data['results'])), (750, 100))
+        response = self.client.get('/api/products/search/', {'q': 'lamp', 'min_price': '1300'})
+        self.assertEqual(response.data['count'], 201)
+        self.assertTrue(all(Decimal(row['current_price']) >= 1300 for row in response.data['results']))
+
+    def test_results_are_ranked(self):
+        Product.objects.filter(title='Lamp 7').update(description='lamp lamp')
+        search.get_backend().reset()
+        response = self.client.get('/api/products/search/', {'q': 'lamp', 'offset': 0, 'limit': 3})
+        self.assertEqual(response.data['results'][0]['title'], 'Lamp 7')
+
+    def test_category_name_ranks_but_does_not_match(self):
+        # the Postgres index covers title and description only; both backends match the same fields
+        self.assertEqual(self.client.get('/api/products/search/', {'q': 'antiques'}).data['count'], 0)
+        seller = User.objects.get(username='seller')
+        Product.objects.create(seller=seller, title='Antiques catalogue', category=self.antiques, starting_price=1,
+                               current_price=1, start_time=timezone.now(), end_time=timezone.now() + timedelta(days=1))
+        Product.objects.create(seller=seller, title='Antiques catalogue', category=self.lighting, starting_price=1,
+                               current_price=1, start_time=timezone.now(), end_time=timezone.now() + timedelta(days=1))
+        response = self.client.get('/api/products/search/', {'q': 'antiques'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(Product.objects.get(pk=response.data['results'][0]['id']).category, self.antiques)
+
+    def test_non_finite_prices_are_rejected(self):
+        for value in ('nan', 'NaN', 'Infinity', '-inf', 'sNaN', 'abc'):
+            for name in ('min_price', 'max_price'):
+                with self.subTest(**{name: value}):
+                    response = self.client.get('/api/products/search/', {'q': 'lamp', name: value})
+                    self.assertEqual(response.status_code, 400)
+
+
+class QueryBudgetTests(APITestCase):
+    """Each endpoint runs a fixed number of queries however many products, sellers and bids it renders."""
+
+    def setUp(self):
+        cache.clear()
+        search.get_backend().reset()
+        category = Category.objects.create(name='Lighting', slug='lighting')
+        for i in range(15):
+            product = make_product(User.objects.create_user(f'seller{i}'), title=f'Lamp {i}', category=category)
+            for j in range(3):
+                services.place_bid(product.pk, User.objects.create_user(f'bidder{i}-{j}'), str(11 + j))
+        self.product = product
+        self.client.force_authenticate(User.objects.create_user('viewer'))
+        search.get_backend().search(Product.objects.all(), 'lamp')  # build the in-process index up front
+
+    def assertBudget(self, queries, method, url, **data):
+        for fast in (False, True):
+            cache.clear()
+            with self.subTest(url=url, fast_serializers=fast), self.settings(AUCTIONS_FAST_SERIALIZERS=fast):
+                with self.assertNumQueries(queries):
+                    response = getattr(self.client, method)(url, data)
+                self.assertLess(response.status_code, 300)
+        return response
+
+    def test_product_list(self):
+        response = self.assertBudget(1, 'get', '/api/products/')
+        self.assertEqual(len(response.data['results']), 12)
+        self.assertBudget(2, 'get', '/api/products/', ordering='-bid_count')  # page numbers: COUNT + page
+
+    def test_product_detail(self):
+        response = self.assertBudget(2, 'get', f'/api/products/{self.product.pk}/')
+        self.assertEqual(len(response.data['bids']), 3)
+
+    def test_search(self):
+        response = self.assertBudget(4, 'get', '/api/products/search/', q='lamp')
+        self.assertEqual(response.data['count'], 15)
+
+    def test_bid_list(self):
+        self.assertBudget(1, 'get', '/api/bids/')
+        self.assertBudget(1, 'get', '/api/bids/', product=self.product.pk)
+
+    def test_place_bid(self):
+        # savepoint, conditional UPDATE, INSERT, leading bid, proxy check, release
+        with self.assertNumQueries(6):
+            response = self.client.post(f'/api/products/{self.product.pk}/place_bid/', {'amount': '50'})
+        self.assertEqual(response.status_code, 201)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], CACHE_SHARED=True)
+class ReplicaRoutingTests(APITestCase):
+    """Records where the router would send each read; the queries themselves still run on 'default'."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.product = make_product(User.objects.create_user('seller'))
+        self.reads = []
+        route = ReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            self.reads.append((model, route(router, model, **hints)))
+            return 'default'
+        for patcher in (mock.patch.object(ReplicaRouter, 'db_for_read', db_for_read),
+                        mock.patch('auctioncraft_api.db_routing.random.choice', return_value='replica1')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def aliases(self, model):
+        return {alias for read, alias in self.reads if read is model}
+
+    def test_safe_reads_use_a_replica(self):
+        self.assertEqual(self.client.get('/api/bids/').status_code, 200)
+        self.assertEqual(self.aliases(Bid), {'replica1'})
+
+    def test_authentication_reads_from_the_primary_without_touching_the_session(self):
+        # a stale token is authenticated with a user query, and a session cookie is sent as well
+        self.client.force_login(self.alice)
+        access = authentication.tokens_for(self.alice)['access']
+        authentication.invalidate(self.alice.pk)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/auth/notifications/').status_code, 200)
+        self.assertEqual(self.aliases(User), {'default'})
+        self.assertEqual(self.aliases(Notification), {'replica1'})
+
+    def test_writer_is_pinned_to_the_primary(self):
+        self.client.force_authenticate(self.alice)
+        response = self.client.post('/api/bids/', {'product': self.product.pk, 'amount': '12'})
+        self.assertIn(response.status_code, (201, 202))
+        self.reads.clear()
+        self.client.get('/api/auth/notifications/')
+        self.assertEqual(self.aliases(Notification), {'default'})
+
+    @override_settings(CACHE_SHARED=False)
+    def test_replicas_require_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ReplicaRouter()
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_METRICS_TOKEN='', INSTRUMENTATION_SLOW_MS=60000)
+class InstrumentationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product(User.objects.create_user('seller'))
+        self.registry = instrumentation.Registry()
+        patcher = mock.patch.object(instrumentation, 'registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(CACHE_SHARED=True)
+    def test_request_is_recorded_under_its_route(self):
+        url = f'/api/products/{self.product.pk}/'
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.client.get('/api/products/0/')
+        entry = self.registry.routes[('product-detail', 'GET')]
+        self.assertEqual((entry['count'], entry['status']), (4, {'2xx': 2, '3xx': 1, '4xx': 1}))
+        # the unknown id is a miss as well
+        self.assertEqual((entry['cache_misses'], entry['cache_hits'], entry['cache_not_modified']), (2, 1, 1))
+        self.assertGreater(entry['queries'], 0)
+        self.assertGreater(entry['sql'], 0)
+        self.assertGreater(entry['serializer'], 0)
+        self.assertEqual(sum(entry['buckets']), 4)
+
+    def test_metrics_are_rendered_for_prometheus(self):
+        self.client.get('/api/products/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('auctioncraft_request_duration_seconds_count{view="product-list",method="GET"} 1', body)
+        self.assertIn('auctioncraft_responses_total{view="product-list",method="GET",status="2xx"} 1', body)
+        self.assertIn('# TYPE auctioncraft_queries_total counter', body)
+        self.assertIn('view="background",method="-"', body)
+
+    @override_settings(INSTRUMENTATION_METRICS_TOKEN='secret')
+    def test_metrics_need_the_token_when_one_is_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_metrics_answer_only_local_addresses_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+    @override_settings(INSTRUMENTATION_SLOW_MS=0, INSTRUMENTATION_SLOW_SAMPLE_RATE=1.0)
+    def test_slow_requests_are_logged_with_their_breakdown(self):
+        with self.assertLogs('auctioncraft.slow_requests', 'WARNING') as logs:
+            self.client.get('/api/products/')
+        self.assertRegex(logs.output[0], r'GET /api/products/ -> 200 in \d+ ms: sql \d+ ms \(\d+ queries\)')
+
+    @override_settings(INSTRUMENTATION_ENABLED=False)
+    def test_disabled_middleware_steps_aside(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            instrumentation.InstrumentationMiddleware(lambda request: None)
+        self.client.get('/api/products/')
+        self.assertEqual(self.registry.routes, {})
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent writers')
+class ConcurrentBidTests(TransactionTestCase):
+    def test_concurrent_bids_keep_the_highest(self):
+        seller = User.objects.create_user('seller')
+        bidders = [User.objects.create_user(f'bidder{i}') for i in range(8)]
+        product = make_product(seller)
+        barrier = threading.Barrier(len(bidders))
+
+        def bid(user, amount):
+            try:
+                barrier.wait()
+                services.place_bid(product.pk, user, amount)
+            except services.BidRejected:
+                pass
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=bid, args=(user, str(20 + i))) for i, user in enumerate(bidders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        product.refresh_from_db()
+        top = Bid.objects.filter(product=product).order_by('-amount').first()
+        self.assertEqual(product.current_price, Decimal('27.00'))
+        self.assertEqual(product.leading_bid_id, top.pk)
+        self.assertEqual(product.bid_count, Bid.objects.filter(product=product).count())
@@ -2,109 +2,371 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from .models import Category, Product, Bid
 from .serializers import CategorySerializer, ProductListSerializer, ProductDetailSerializer, BidSerializer
-from rest_framework.decorators import action
+from .pagination import ProductOrderingFilter, ProductPagination, BidCursorPagination
+from . import services, orderbook, events, caching, fast_serializers, images, archive, exports
+from . import search as product_search
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from decimal import Decimal
-from django.core.mail import send_mail
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.conf import settings
-from users.models import Notification
+from django.db import router
+import asyncio
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Count
+from django.utils import timezone
+from users.models import User
+from auctioncraft_api.db_routing import ReplicaReadsMixin
+
+def rejected_response(e):
+    data = {'detail': e.detail}
+    if e.current_price is not None:
+        data['current_price'] = str(e.current_price)
+    return Response(data, status=e.status_code)
+
+def place_bid_response(product_id, user, amount):
+    """Place a bid through the bid book or services.place_bid, which keep the product's price and statistics."""
+    try:
+        if orderbook.enabled():
+            # accepted in memory; the Bid row is written by the bid book flusher
+            bid = orderbook.get_book().place_bid(product_id, user, amount)
+            return Response(BidSerializer(bid).data, status=status.HTTP_202_ACCEPTED)
+        bid = services.place_bid(product_id, user, amount)
+    except services.BidRejected as e:
+        return rejected_response(e)
+    return Response(BidSerializer(bid).data, status=status.HTTP_201_CREATED)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+def finite_decimal(value):
+    """Decimal(value), rejecting NaN and Infinity, which the ORM cannot compare a price with."""
+    number = Decimal(value)
+    if not number.is_finite():
+        raise ValueError(f'Not a finite number: {value}')
+    return number
+
+class CategoryViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all().order_by('-created_at')
+    def list(self, request, *args, **kwargs):
+        if not caching.enabled():
+            return super().list(request, *args, **kwargs)
+        cache, key = caching.get_cache(), caching.category_list_key(request)
+        data = cache.get(key)
+        if data is None:
+            caching.record('misses')
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, caching.timeout())
+        else:
+            caching.record('hits')
+        return Response(data)
+
+class ProductViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.select_related('seller', 'image_asset').order_by('-created_at')
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = ProductPagination
+    filter_backends = [ProductOrderingFilter]
+    ordering_fields = ('created_at', 'end_time', 'current_price', 'bid_count', 'last_bid_at')
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ProductDetailSerializer
         return ProductListSerializer
 
+    def list(self, request, *args, **kwargs):
+        """Pages are cached as product ids; rows come from the per-product cache (see auctions/caching.py)."""
+        if not caching.list_cacheable(request):
+            return self._list(request, *args, **kwargs)
+        cache, key = caching.get_cache(), caching.list_key(request)
+        page = cache.get(key)
+        if page is None:
+            caching.record('misses')
+            response = self._list(request, *args, **kwargs)
+            results = response.data['results']
+            links = {name: value for name, value in response.data.items() if name != 'results'}
+            cache.set(key, {**links, 'ids': [row['id'] for row in results]}, caching.timeout())
+            return response
+        vers = caching.row_versions(page['ids'])
+        rows = caching.get_rows(page['ids'], vers)
+        missing = [pk for pk in page['ids'] if pk not in rows]
+        caching.record('hits', len(page['ids']) - len(missing))
+        if missing:
+            caching.record('misses', len(missing))
+            queryset = self.get_queryset().filter(pk__in=missing)
+            if fast_serializers.enabled():
+                fresh = fast_serializers.product_rows(queryset.values(*fast_serializers.PRODUCT_VALUES), request)
+            else:
+                fresh = self.get_serializer(queryset, many=True).data
+            fresh = {row['id']: row for row in fresh}
+            caching.set_rows(fresh, vers)
+            rows.update(fresh)
+        links = {name: value for name, value in page.items() if name != 'ids'}
+        return Response({**links, 'results': [rows[pk] for pk in page['ids'] if pk in rows]})
+
+    def _list(self, request, *args, **kwargs):
+        if not fast_serializers.enabled():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).values(*fast_serializers.PRODUCT_VALUES)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(fast_serializers.product_rows(page, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get('pk')
+        if not str(pk).isdigit():
+            raise Http404
+        if not caching.enabled():
+            return Response(self._detail(request, *args, **kwargs))
+        etag = caching.detail_etag(pk)
+        if etag in request.headers.get('If-None-Match', ''):
+            caching.record('not_modified')
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        cache, key = caching.get_cache(), f'products:detail:{etag}'
+        data = cache.get(key)
+        if data is None:
+            caching.record('misses')
+            data = self._detail(request, *args, **kwargs)
+            cache.set(key, data, caching.timeout())
+        else:
+            caching.record('hits')
+        return Response(data, headers={'ETag': etag})
+
+    def _detail(self, request, *args, **kwargs):
+        pk = kwargs['pk']
+        try:
+            if fast_serializers.enabled():
+                data = fast_serializers.product_detail(self.get_queryset().filter(pk=pk), request)
+                if data is None:
+                    raise Http404
+                return data
+            return super().retrieve(request, *args, **kwargs).data
+        except Http404:
+            # lots closed long ago live in the archive tables (auctions/archive.py)
+            data = archive.product_detail(pk, request)
+            if data is None:
+                raise
+            return data
+
     def perform_create(self, serializer):
-        serializer.save(seller=self.request.user, current_price=serializer.validated_data.get('starting_price'))
+        upload = serializer.validated_data.pop('image', None)
+        product = serializer.save(seller=self.request.user, current_price=serializer.validated_data.get('starting_price'))
+        if upload:
+            images.attach(product, upload)
+
+    def perform_update(self, serializer):
+        # the photo is stored by content hash and resized by the image workers (auctions/images.py)
+        changed = 'image' in serializer.validated_data
+        upload = serializer.validated_data.pop('image', None)
+        product = serializer.save()
+        if changed:
+            images.attach(product, upload)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Ranked search: ?q=<text>[&category=&min_price=&max_price=&active=1&ending_within=<seconds>&limit=&offset=].
+        Returns the ranked page plus per-category facet counts (computed before the category filter).
+        """
+        params = request.query_params
+        text = params.get('q', '').strip()
+        if not text:
+            return Response({'detail': 'Missing q.'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.get_queryset()
+        try:
+            if params.get('min_price'):
+                queryset = queryset.filter(current_price__gte=finite_decimal(params['min_price']))
+            if params.get('max_price'):
+                queryset = queryset.filter(current_price__lte=finite_decimal(params['max_price']))
+            if params.get('active') in ('1', 'true'):
+                queryset = queryset.filter(is_active=True, end_time__gt=timezone.now())
+            if params.get('ending_within'):
+                now = timezone.now()
+                queryset = queryset.filter(is_active=True, end_time__gt=now, end_time__lte=now + timedelta(seconds=int(params['ending_within'])))
+            limit = min(int(params.get('limit', 12)), 100)
+            offset = max(int(params.get('offset', 0)), 0)
+            category = int(params['category']) if params.get('category') else None
+        except (ArithmeticError, ValueError):
+            return Response({'detail': 'Invalid filter.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = product_search.get_backend().search(queryset, text)
+        facets = (result.queryset.order_by().values('category_id', 'category__name')
+                  .annotate(count=Count('id')).order_by('-count'))
+        if category is not None:
+            result = result.filter(category_id=category)
+        ids = result.page_ids(offset, limit)
+        page = self.get_queryset().filter(pk__in=ids)
+        if fast_serializers.enabled():
+            rows = fast_serializers.product_rows(page.values(*fast_serializers.PRODUCT_VALUES), request)
+        else:
+            rows = ProductListSerializer(page, many=True, context=self.get_serializer_context()).data
+        by_id = {row['id']: row for row in rows}
+        return Response({
+            'count': result.queryset.count(),
+            'results': [by_id[pk] for pk in ids if pk in by_id],
+            'facets': {'category': [{'id': f['category_id'], 'name': f['category__name'], 'count': f['count']} for f in facets]},
+        })
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def place_bid(self, request, pk=None):
-        product = get_object_or_404(Product, pk=pk)
-        if not product.is_active or product.end_time <= timezone.now():
-            return Response({'detail': 'Auction is closed.'}, status=status.HTTP_400_BAD_REQUEST)
-        amount = request.data.get('amount')
+        return place_bid_response(pk, request.user, request.data.get('amount'))
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def proxy_bid(self, request, pk=None):
+        """Set or raise a maximum bid; the server bids on the user's behalf up to it."""
         try:
-            amount = Decimal(amount)
-        except Exception:
-            return Response({'detail':'Invalid amount.'}, status=status.HTTP_400_BAD_REQUEST)
-        # basic business rule: bid must be higher than current_price
-        if amount <= product.current_price:
-            return Response({'detail':'Bid must be greater than current price.'}, status=status.HTTP_400_BAD_REQUEST)
-        bid = Bid.objects.create(product=product, bidder=request.user, amount=amount)
-        product.current_price = amount
-        product.save()
-        serializer = BidSerializer(bid)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+            bids = services.set_proxy_bid(pk, request.user, request.data.get('max_amount'))
+        except services.BidRejected as e:
+            return rejected_response(e)
+        price = Product.objects.filter(pk=pk).values_list('current_price', 'leading_bid__bidder_id').first()
+        return Response({'current_price': str(price[0]), 'leading': price[1] == request.user.pk,
+                         'bids': BidSerializer(bids, many=True).data})
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def close_auction(self, request, pk=None):
-        """Close auction manually (seller or admin). 
-        When auction is closed, determine the winner (highest bid) and notify all bidders by email and Notification records.
+        """Close auction manually (seller or admin).
+        The winner (highest bid) is determined here; all bidders are notified by email and Notification records
+        by a background job (see auctions/fanout.py), so this returns in constant time.
         """
         product = get_object_or_404(Product, pk=pk)
         # only seller or staff can close
-        if request.user != product.seller and not request.user.is_staff:
+        if request.user.pk != product.seller_id and not request.user.is_staff:
             return Response({'detail':'Not authorized to close this auction.'}, status=status.HTTP_403_FORBIDDEN)
         if not product.is_active:
             return Response({'detail':'Auction already closed.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # close auction
-        product.is_active = False
-        product.end_time = timezone.now()
-        product.save()
-
-        # determine winner: highest bid (bids ordered by -timestamp but not by amount necessarily)
-        highest_bid = product.bids.order_by('-amount', 'timestamp').first()
-        winner = highest_bid.bidder if highest_bid else None
-        winner_amount = highest_bid.amount if highest_bid else None
-
-        # notify all unique bidders
-        bidders = User = None  # hint for linters
-        bidder_qs = product.bids.values_list('bidder__email', 'bidder__id').distinct()
-        notified_user_ids = set()
-        for email, user_id in bidder_qs:
-            # avoid duplicates
-            if user_id in notified_user_ids:
-                continue
-            notified_user_ids.add(user_id)
-            # prepare message
-            if winner and user_id == winner.id:
-                title = f"You won the auction for '{product.title}'!"
-                message = f"Congratulations! You are the winner of the auction '{product.title}' with a bid of {winner_amount}. Please follow up with the seller to complete the transaction."
-            else:
-                title = f"Auction ended: '{product.title}'"
-                winner_info = f"Winner: {winner.username} with {winner_amount}" if winner else "No winner (no bids)"
-                message = f"The auction '{product.title}' has ended. {winner_info}. Thank you for participating."
-
-            # create Notification record (if user exists)
-            try:
-                from users.models import User as UModel
-                recipient = UModel.objects.filter(id=user_id).first()
-                if recipient:
-                    Notification.objects.create(user=recipient, title=title, message=message)
-                    # send email (best-effort)
-                    try:
-                        send_mail(title, message, getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@auctioncraft.local'), [email])
-                    except Exception as e:
-                        print('Failed to send auction email to', email, e)
-            except Exception as e:
-                print('Error notifying user id', user_id, e)
-
-        return Response({'detail':'Auction closed and bidders notified.'}, status=status.HTTP_200_OK)
-
-class BidViewSet(viewsets.ModelViewSet):
-    queryset = Bid.objects.all()
+        if services.close_auction(product) is None:
+            return Response({'detail':'Auction already closed.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail':'Auction closed; bidders are being notified.'}, status=status.HTTP_200_OK)
+
+class BidViewSet(ReplicaReadsMixin, viewsets.ModelViewSet):
+    queryset = Bid.objects.select_related('bidder')
     serializer_class = BidSerializer
+    # bids are never edited or deleted: that would leave the product's price and bid statistics behind
+    http_method_names = ['get', 'post', 'head', 'options']
+    pagination_class = BidCursorPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    def perform_create(self, serializer):
-        serializer.save(bidder=self.request.user)
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        product = self.request.query_params.get('product')
+        if product and product.isdigit():
+            qs = qs.filter(product_id=product)
+        return qs
+
+    def list(self, request, *args, **kwargs):
+        if not fast_serializers.enabled():
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()).values(*fast_serializers.BID_VALUES))
+        return self.get_paginated_response(fast_serializers.bid_rows(page, request))
+
+    def create(self, request, *args, **kwargs):
+        """POST /api/bids/ {"product": <id>, "amount": ...}: same as POST /api/products/<id>/place_bid/."""
+        return place_bid_response(request.data.get('product'), request.user, request.data.get('amount'))
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def bulk(self, request):
+        """Place many bids in one request: {"bids": [{"product": 1, "amount": "12.00"}, ...]}.
+        Staff may set "bidder" on an item (imports). Returns a per-bid accepted/rejected result in input order.
+        """
+        items = request.data.get('bids')
+        max_items = getattr(settings, 'AUCTIONS_BULK_BID_LIMIT', 1000)
+        if not isinstance(items, list) or not items:
+            return Response({'detail': 'Expected a non-empty "bids" list.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > max_items:
+            return Response({'detail': f'At most {max_items} bids per request.'}, status=status.HTTP_400_BAD_REQUEST)
+        parsed = []
+        for item in items:
+            item = item if isinstance(item, dict) else {}
+            bidder_id = request.user.pk
+            if request.user.is_staff and item.get('bidder') not in (None, ''):
+                try:
+                    bidder_id = int(item['bidder'])
+                except (TypeError, ValueError):
+                    return Response({'detail': 'Invalid bidder.'}, status=status.HTTP_400_BAD_REQUEST)
+            parsed.append((item.get('product'), bidder_id, item.get('amount')))
+        bidder_ids = {bidder_id for _, bidder_id, _ in parsed}
+        if bidder_ids != {request.user.pk} and User.objects.filter(pk__in=bidder_ids).count() != len(bidder_ids):
+            return Response({'detail': 'Unknown bidder.'}, status=status.HTTP_400_BAD_REQUEST)
+        results = []
+        for index, result in enumerate(services.place_bids_bulk(parsed)):
+            if isinstance(result, services.BidRejected):
+                entry = {'index': index, 'status': 'rejected', 'code': result.status_code, 'detail': result.detail}
+                if result.current_price is not None:
+                    entry['current_price'] = str(result.current_price)
+            else:
+                entry = {'index': index, 'status': 'accepted', 'id': result.pk, 'product': result.product_id,
+                         'amount': str(result.amount), 'timestamp': result.timestamp}
+            results.append(entry)
+        accepted = sum(1 for r in results if r['status'] == 'accepted')
+        return Response({'accepted': accepted, 'rejected': len(results) - accepted, 'results': results})
+
+
+async def product_events(request, pk):
+    """Server-sent events for one lot: `bid` deltas and a final `closed` event.
+    Only served over ASGI (DJANGO_ASGI=1 in docker-entrypoint.sh). A WSGI worker cannot flush an async
+    stream: it would hold the worker until the client goes away, so WSGI requests get 501.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'Event streams need the ASGI server.'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    if not await Product.objects.filter(pk=pk).aexists():
+        raise Http404
+    events.get_broker().listen()
+    sub = events.hub.subscribe(pk)
+    heartbeat = getattr(settings, 'AUCTIONS_EVENT_HEARTBEAT', 15)
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield frame
+                if frame.startswith('event: closed'):
+                    break
+        finally:
+            events.hub.unsubscribe(sub)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    """Hit/miss counters of the product/category response cache for this process."""
+    return Response(caching.stats())
+
+
+class ExportView(ReplicaReadsMixin, APIView):
+    """GET /api/exports/<bids|results>.<csv|jsonl>?seller=&category=&product=&since=&until=
+
+    Streams every matching row (auctions/exports.py). Sellers export their own auctions; staff may pick
+    any seller or export everything.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, kind, output):
+        if kind not in ('bids', 'results') or output not in exports.FORMATS:
+            raise Http404
+        params = request.query_params
+        seller = params.get('seller')
+        if not request.user.is_staff:
+            if seller not in (None, '', str(request.user.pk)):
+                return Response({'detail': 'You can only export your own auctions.'}, status=status.HTTP_403_FORBIDDEN)
+            seller = request.user.pk
+        try:
+            filters = exports.resolve_filters(seller=seller, category=params.get('category'), product=params.get('product'),
+                                              since=params.get('since'), until=params.get('until'))
+        except exports.ExportError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # rows are read while the response streams, after the replica routing of this request has ended
+        columns, rows = exports.rows(kind, filters, using=router.db_for_read(Bid))
+        response = StreamingHttpResponse(exports.render(columns, rows, output), content_type=exports.FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="{kind}-{timezone.now():%Y%m%d-%H%M%S}.{output}"'
+        response['Cache-Control'] = 'no-store'
+        return response
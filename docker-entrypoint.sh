@@ -48,6 +48,23 @@ else:
 PY
 fi
 
+# Serve over ASGI with Uvicorn when DJANGO_ASGI=1: needed for the bid event streams
+# (GET /api/products/<id>/events/), which answer 501 under WSGI
+if [ "$DJANGO_ASGI" = "1" ]; then
+  # streams only see events published in their own process unless the broker fans out across processes
+  if [ "${GUNICORN_WORKERS:-3}" != "1" ] && \
+     [ "$(DJANGO_SETTINGS_MODULE=${DJANGO_SETTINGS_MODULE:-auctioncraft_api.settings} python -c \
+          'import django; django.setup(); from auctions import events; print(events.broker_path())')" = "auctions.events.LocalBroker" ]; then
+    echo "AUCTIONS_EVENT_BROKER is LocalBroker, which only reaches one process: use Postgres (AUCTIONS_EVENT_BROKER=auto) or GUNICORN_WORKERS=1" >&2
+    exit 1
+  fi
+  echo "Starting Uvicorn..."
+  exec uvicorn auctioncraft_api.asgi:application \
+      --host 0.0.0.0 --port 8000 \
+      --workers ${GUNICORN_WORKERS:-3} \
+      --log-level ${GUNICORN_LOGLEVEL:-info}
+fi
+
 # Start Gunicorn
 echo "Starting Gunicorn..."
 exec gunicorn auctioncraft_api.wsgi:application \
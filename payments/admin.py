@@ -0,0 +1,6 @@
+from django.contrib import admin
+from .models import Order, Payment, WebhookEvent
+
+admin.site.register(Order)
+admin.site.register(Payment)
+admin.site.register(WebhookEvent)
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from payments import webhooks
+
+
+class Command(BaseCommand):
+    help = 'Process stored Stripe webhook events. Runs once, or as a long-lived worker with --loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true')
+        parser.add_argument('--interval', type=float, default=2)
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **opts):
+        if opts['loop']:
+            self.stdout.write('Stripe webhook worker running...')
+            while True:
+                webhooks.drain(opts['batch_size'])
+                time.sleep(opts['interval'])
+        count = webhooks.drain(opts['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{count} webhook event(s) processed.'))
@@ -0,0 +1,132 @@
+"""Replay a recorded stream of Stripe events through the webhook endpoint and check the outcome.
+
+    python manage.py replay_webhooks --events 100000
+
+A local stand-in plays Stripe: it creates closed auctions with pending orders and payment intents,
+then records an event stream for them the way Stripe delivers it (some intents fail before they
+succeed, about 10% of deliveries are duplicates, a few events are for unrelated intents and types
+we ignore), signs each delivery with STRIPE_WEBHOOK_SECRET and POSTs it to the webhook view.
+Afterwards the stored events are processed in batches and every order must be paid exactly once.
+
+By default the workers are kept idle during intake so intake and batch processing are timed
+separately; --concurrent lets the endpoint wake them as in production (use Postgres for that,
+SQLite serializes the writers). All rows it creates are deleted at the end.
+"""
+import hashlib
+import hmac
+import json
+import random
+import time
+from contextlib import nullcontext
+from unittest import mock
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils import timezone
+from auctions.models import Bid, Product
+from payments import webhooks
+from payments.models import Order, Payment, WebhookEvent
+from payments.views import stripe_webhook
+from users.models import User
+
+
+class StripeStandIn:
+    """Records events for a set of payment intents and signs them like Stripe does."""
+
+    def __init__(self, secret, rng):
+        self.secret = secret
+        self.rng = rng
+        self.sequence = 0
+
+    def event(self, type_, intent_id, amount):
+        self.sequence += 1
+        return {'id': f'evt_replay_{self.sequence}', 'object': 'event', 'type': type_,
+                'data': {'object': {'id': intent_id, 'object': 'payment_intent', 'amount': amount, 'amount_received': amount}}}
+
+    def record(self, payments, total):
+        events = []
+        while len(events) < total:
+            intent_id, amount = self.rng.choice(payments)
+            roll = self.rng.random()
+            if roll < 0.1 and events:
+                events.append(self.rng.choice(events))  # redelivery of an earlier event
+            elif roll < 0.15:
+                events.append(self.event('charge.updated', intent_id, amount))
+            elif roll < 0.2:
+                events.append(self.event(webhooks.SUCCEEDED, f'pi_foreign_{self.sequence}', amount))
+            elif roll < 0.35:
+                events.append(self.event(webhooks.FAILED, intent_id, amount))
+            else:
+                events.append(self.event(webhooks.SUCCEEDED, intent_id, amount))
+        # make sure every intent eventually succeeds
+        events.extend(self.event(webhooks.SUCCEEDED, intent_id, amount) for intent_id, amount in payments)
+        return events
+
+    def signature(self, payload):
+        timestamp = int(time.time())
+        digest = hmac.new(self.secret.encode(), f'{timestamp}.'.encode() + payload, hashlib.sha256).hexdigest()
+        return f't={timestamp},v1={digest}'
+
+
+class Command(BaseCommand):
+    help = 'Replay recorded Stripe events through the webhook endpoint and verify orders end up paid exactly once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100000)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--concurrent', action='store_true', help='Process events while they are being received.')
+
+    def handle(self, *args, **opts):
+        rng = random.Random(11)
+        stand_in = StripeStandIn(settings.STRIPE_WEBHOOK_SECRET, rng)
+        payments = self.seed(opts['orders'])
+        events = stand_in.record(payments, opts['events'])
+        factory = RequestFactory()
+        try:
+            started = time.perf_counter()
+            with nullcontext() if opts['concurrent'] else mock.patch.object(webhooks, 'wake'):
+                for event in events:
+                    payload = json.dumps(event).encode()
+                    request = factory.post('/api/stripe/webhook/', payload, content_type='application/json',
+                                           HTTP_STRIPE_SIGNATURE=stand_in.signature(payload))
+                    if stripe_webhook(request).status_code != 200:
+                        raise CommandError(f'webhook rejected {event["id"]}')
+            intake = time.perf_counter() - started
+            started = time.perf_counter()
+            webhooks.drain()
+            processing = time.perf_counter() - started
+            unique = len({event['id'] for event in events})
+            stored = WebhookEvent.objects.filter(event_id__startswith='evt_replay_')
+            if stored.count() != unique or stored.filter(processed_at__isnull=True).exists():
+                raise CommandError('events were lost or left unprocessed')
+            paid = Order.objects.filter(product__title__startswith='replay-', status=Order.PAID).count()
+            self.stdout.write(f'{len(events)} deliveries ({unique} unique) accepted in {intake:.1f} s '
+                              f'({len(events) / intake:.0f}/s); remaining events processed in {processing:.1f} s')
+            if paid != len(payments):
+                raise CommandError(f'{paid} of {len(payments)} orders paid')
+            self.stdout.write(self.style.SUCCESS(f'all {paid} orders paid exactly once'))
+        finally:
+            self.cleanup(events)
+
+    def seed(self, count):
+        now = timezone.now()
+        seller, _ = User.objects.get_or_create(username='replay-seller')
+        buyer, _ = User.objects.get_or_create(username='replay-buyer')
+        products = Product.objects.bulk_create([
+            Product(seller=seller, title=f'replay-{i}', starting_price=10, current_price=10 + i % 500,
+                    start_time=now - timedelta(days=2), end_time=now - timedelta(days=1), is_active=False)
+            for i in range(count)])
+        bids = Bid.objects.bulk_create([Bid(product=p, bidder=buyer, amount=p.current_price) for p in products])
+        orders = Order.objects.bulk_create([Order(product=p, winning_bid=b, buyer=buyer, amount=p.current_price)
+                                            for p, b in zip(products, bids)])
+        rows = Payment.objects.bulk_create([Payment(order=o, stripe_payment_intent_id=f'pi_replay_{o.pk}',
+                                                    amount_cents=int(o.amount * 100)) for o in orders])
+        return [(p.stripe_payment_intent_id, p.amount_cents) for p in rows]
+
+    def cleanup(self, events):
+        WebhookEvent.objects.filter(event_id__startswith='evt_replay_').delete()
+        Payment.objects.filter(stripe_payment_intent_id__startswith='pi_replay_').delete()
+        Order.objects.filter(product__title__startswith='replay-').delete()
+        Bid.objects.filter(product__title__startswith='replay-').delete()
+        Product.objects.filter(title__startswith='replay-').delete()
@@ -0,0 +1,55 @@
+from django.db import models
+from django.db.models import Q
+from django.conf import settings
+
+
+class Order(models.Model):
+    """The winner's obligation to pay for a closed auction; one per product."""
+    PENDING, PAID, CANCELLED = 'pending', 'paid', 'cancelled'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (PAID, 'Paid'), (CANCELLED, 'Cancelled')]
+
+    # unconstrained: once settled, the lot and its bids may move to the archive tables under the same ids
+    product = models.OneToOneField('auctions.Product', on_delete=models.DO_NOTHING, db_constraint=False, related_name='order')
+    winning_bid = models.OneToOneField('auctions.Bid', on_delete=models.DO_NOTHING, db_constraint=False, related_name='order')
+    buyer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name='orders')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Order {self.pk} for product {self.product_id} ({self.status})"
+
+
+class Payment(models.Model):
+    """One Stripe PaymentIntent created for an order."""
+    REQUIRES_PAYMENT, SUCCEEDED, FAILED = 'requires_payment', 'succeeded', 'failed'
+    STATUS_CHOICES = [(REQUIRES_PAYMENT, 'Requires payment'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payments')
+    stripe_payment_intent_id = models.CharField(max_length=255, unique=True)
+    amount_cents = models.PositiveIntegerField()
+    currency = models.CharField(max_length=3, default='usd')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=REQUIRES_PAYMENT)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Payment {self.stripe_payment_intent_id} ({self.status})"
+
+
+class WebhookEvent(models.Model):
+    """A verified Stripe event, stored once per event id and processed by payments/webhooks.py."""
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], name='webhookevent_pending_idx', condition=Q(processed_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
@@ -1,10 +1,60 @@
 # Business logic for payments separated into a service to follow Single Responsibility (S of SOLID)
+from decimal import Decimal, ROUND_HALF_UP
 import stripe
 from django.conf import settings
+from django.db import transaction
+from .models import Order, Payment
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
-def create_intent_amount(amount_decimal):
+
+class PaymentError(Exception):
+    """Raised when an order cannot be paid for. `status_code` is what the API should answer with."""
+    def __init__(self, detail, status_code=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def to_cents(amount_decimal):
+    # exact: Decimal arithmetic, never float (float(19.99) * 100 == 1998.9999999999998)
+    return int((Decimal(str(amount_decimal)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def create_intent_amount(amount_decimal, **kwargs):
     # Convert decimal to cents and create PaymentIntent - isolated for easier testing
-    cents = int(float(amount_decimal) * 100)
-    return stripe.PaymentIntent.create(amount=cents, currency='usd', automatic_payment_methods={'enabled': True})
+    cents = to_cents(amount_decimal)
+    return stripe.PaymentIntent.create(amount=cents, currency=getattr(settings, 'PAYMENTS_CURRENCY', 'usd'),
+                                       automatic_payment_methods={'enabled': True}, **kwargs)
+
+
+def order_for_won_auction(product_id, user):
+    """The order for a closed auction `user` won, created on first use from the winning bid."""
+    from auctions.models import Product
+    product = Product.objects.select_related('leading_bid').filter(pk=product_id).first()
+    if product is None:
+        raise PaymentError('Not found.', status_code=404)
+    if product.is_active:
+        raise PaymentError('Auction has not closed yet.')
+    if product.leading_bid is None or product.leading_bid.bidder_id != user.pk:
+        raise PaymentError('Only the winning bidder can pay for this auction.', status_code=403)
+    order, _ = Order.objects.get_or_create(product=product, defaults={
+        'winning_bid': product.leading_bid, 'buyer': user, 'amount': product.current_price})
+    return order
+
+
+def payment_intent_for_order(order):
+    """Client secret of the order's open PaymentIntent, creating one for the order amount if needed."""
+    if order.status != Order.PENDING:
+        raise PaymentError(f'Order is {order.status}.', status_code=409)
+    with transaction.atomic():
+        # serializes concurrent checkouts of the same order so only one intent is created
+        Order.objects.select_for_update().filter(pk=order.pk).values_list('pk', flat=True).get()
+        payment = order.payments.filter(status=Payment.REQUIRES_PAYMENT).order_by('-created_at').first()
+        if payment is not None:
+            return stripe.PaymentIntent.retrieve(payment.stripe_payment_intent_id).client_secret
+        intent = create_intent_amount(order.amount, metadata={'order_id': order.pk},
+                                      idempotency_key=f'order-{order.pk}-{order.payments.count()}')
+        Payment.objects.create(order=order, stripe_payment_intent_id=intent.id, amount_cents=intent.amount,
+                               currency=intent.currency)
+    return intent.client_secret
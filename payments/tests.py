@@ -0,0 +1,150 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+from auctions import services as auction_services
+from auctions.models import Product
+from users.models import User
+from .models import Order, Payment, WebhookEvent
+from . import services, webhooks
+
+
+def event(event_id, type_, intent_id, amount=1250, currency='usd'):
+    return {'id': event_id, 'type': type_,
+            'data': {'object': {'id': intent_id, 'amount': amount, 'amount_received': amount, 'currency': currency}}}
+
+
+class StripeStubMixin:
+    """Replaces the Stripe client: intents are numbered pi_1, pi_2, ... and never leave the process."""
+
+    def setUp(self):
+        super().setUp()
+        self.intents = {}
+
+        def create(amount, currency, **kwargs):
+            intent = SimpleNamespace(id=f'pi_{len(self.intents) + 1}', amount=amount, currency=currency,
+                                     client_secret=f'secret_{len(self.intents) + 1}')
+            self.intents[intent.id] = intent
+            return intent
+        patcher = mock.patch.object(services, 'stripe')
+        self.stripe = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.stripe.PaymentIntent.create.side_effect = create
+        self.stripe.PaymentIntent.retrieve.side_effect = lambda intent_id: self.intents[intent_id]
+
+    def won_auction(self, price='12.50'):
+        now = timezone.now()
+        seller, winner = User.objects.create_user('seller'), User.objects.create_user('winner')
+        product = Product.objects.create(seller=seller, title='Lamp', starting_price=Decimal('10.00'),
+                                         current_price=Decimal('10.00'), start_time=now - timedelta(hours=1),
+                                         end_time=now + timedelta(hours=1))
+        auction_services.place_bid(product.pk, winner, price)
+        Product.objects.filter(pk=product.pk).update(is_active=False)
+        return product, winner
+
+
+class CheckoutTests(StripeStubMixin, TestCase):
+    def test_to_cents_is_exact(self):
+        for amount, cents in (('19.99', 1999), (Decimal('0.29'), 29), (10, 1000), ('0.005', 1), ('1234567.89', 123456789)):
+            self.assertEqual(services.to_cents(amount), cents)
+
+    def test_only_the_winner_of_a_closed_auction_gets_an_order(self):
+        product, winner = self.won_auction()
+        with self.assertRaises(services.PaymentError) as denied:
+            services.order_for_won_auction(product.pk, User.objects.create_user('loser'))
+        self.assertEqual(denied.exception.status_code, 403)
+        with self.assertRaises(services.PaymentError) as missing:
+            services.order_for_won_auction(0, winner)
+        self.assertEqual(missing.exception.status_code, 404)
+        order = services.order_for_won_auction(product.pk, winner)
+        self.assertEqual((order.amount, order.buyer, order.status), (Decimal('12.50'), winner, Order.PENDING))
+        self.assertEqual(services.order_for_won_auction(product.pk, winner), order)
+
+    def test_open_auction_cannot_be_paid(self):
+        product, winner = self.won_auction()
+        Product.objects.filter(pk=product.pk).update(is_active=True)
+        with self.assertRaises(services.PaymentError) as rejected:
+            services.order_for_won_auction(product.pk, winner)
+        self.assertEqual(rejected.exception.status_code, 400)
+
+    def test_checkout_reuses_the_open_intent(self):
+        product, winner = self.won_auction()
+        order = services.order_for_won_auction(product.pk, winner)
+        self.assertEqual(services.payment_intent_for_order(order), 'secret_1')
+        self.assertEqual(services.payment_intent_for_order(order), 'secret_1')
+        self.assertEqual(self.stripe.PaymentIntent.create.call_count, 1)
+        self.assertEqual(self.stripe.PaymentIntent.create.call_args.kwargs['amount'], 1250)
+        payment = order.payments.get()
+        self.assertEqual((payment.stripe_payment_intent_id, payment.amount_cents, payment.currency), ('pi_1', 1250, 'usd'))
+
+
+class WebhookTests(StripeStubMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        product, winner = self.won_auction()
+        self.order = services.order_for_won_auction(product.pk, winner)
+        services.payment_intent_for_order(self.order)
+        self.payment = self.order.payments.get()
+
+    def post(self, body):
+        with mock.patch('payments.views.stripe.Webhook.construct_event'):
+            return self.client.post('/api/stripe/webhook/', json.dumps(body), content_type='application/json',
+                                    HTTP_STRIPE_SIGNATURE='t=1,v1=stub')
+
+    def deliver(self, *events, batch_size=500):
+        webhooks.receive([(e['id'], e['type'], e) for e in events])
+        return webhooks.drain(batch_size)
+
+    def state(self):
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        return self.payment.status, self.order.status
+
+    def test_duplicate_deliveries_are_stored_once(self):
+        body = event('evt_1', webhooks.SUCCEEDED, 'pi_1')
+        self.assertEqual([self.post(body).status_code for _ in range(2)], [200, 200])
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(webhooks.drain(), 1)
+        self.assertEqual(self.state(), (Payment.SUCCEEDED, Order.PAID))
+
+    def test_bad_signature_is_rejected(self):
+        with mock.patch('payments.views.stripe.Webhook.construct_event', side_effect=ValueError('bad signature')):
+            response = self.client.post('/api/stripe/webhook/', '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_success_is_final(self):
+        # in one batch, and a failure arriving in a later batch
+        self.deliver(event('evt_1', webhooks.SUCCEEDED, 'pi_1'), event('evt_2', webhooks.FAILED, 'pi_1'))
+        self.assertEqual(self.state(), (Payment.SUCCEEDED, Order.PAID))
+        self.deliver(event('evt_3', webhooks.FAILED, 'pi_1'))
+        self.assertEqual(self.state(), (Payment.SUCCEEDED, Order.PAID))
+
+    def test_failure_then_success(self):
+        self.deliver(event('evt_1', webhooks.FAILED, 'pi_1'))
+        self.assertEqual(self.state(), (Payment.FAILED, Order.PENDING))
+        self.deliver(event('evt_2', webhooks.SUCCEEDED, 'pi_1'))
+        self.assertEqual(self.state(), (Payment.SUCCEEDED, Order.PAID))
+
+    def test_mismatched_amount_or_currency_leaves_the_order_unpaid(self):
+        for i, (amount, currency) in enumerate(((1249, 'usd'), (1250, 'eur'))):
+            with self.subTest(amount=amount, currency=currency), self.assertLogs('payments.webhooks', 'WARNING'):
+                self.deliver(event(f'evt_{i}', webhooks.SUCCEEDED, 'pi_1', amount, currency))
+            self.assertEqual(self.state(), (Payment.REQUIRES_PAYMENT, Order.PENDING))
+
+    def test_order_is_paid_once(self):
+        self.deliver(event('evt_1', webhooks.SUCCEEDED, 'pi_1'), batch_size=1)
+        self.state()
+        paid_at = self.order.paid_at
+        self.deliver(event('evt_2', webhooks.SUCCEEDED, 'pi_1'), event('evt_3', webhooks.SUCCEEDED, 'pi_1'), batch_size=1)
+        self.assertEqual(self.state(), (Payment.SUCCEEDED, Order.PAID))
+        self.assertEqual(self.order.paid_at, paid_at)
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_unknown_intents_and_other_events_are_consumed(self):
+        self.assertEqual(self.deliver(event('evt_1', webhooks.SUCCEEDED, 'pi_other'),
+                                      {'id': 'evt_2', 'type': 'charge.refunded', 'data': {'object': {}}}), 2)
+        self.assertEqual(self.state(), (Payment.REQUIRES_PAYMENT, Order.PENDING))
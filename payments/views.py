@@ -1,49 +1,60 @@
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse
 import stripe, json
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from .models import Order
+from . import services, webhooks
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 @api_view(['POST'])
-@permission_classes([AllowAny])
+@permission_classes([IsAuthenticated])
 def create_payment_intent(request):
-    """Create Stripe PaymentIntent for a given amount (in decimal format).
-    Frontend should call this endpoint with amount (in decimal string).
+    """Create (or reuse) the Stripe PaymentIntent for an auction the user won.
+    Frontend should call this endpoint with the product id; the amount is the auction's final price.
     """
-    data = request.data
-    amount = data.get('amount')
-    if amount is None:
-        return Response({'detail':'Missing amount'}, status=status.HTTP_400_BAD_REQUEST)
+    product_id = request.data.get('product_id')
+    if product_id is None:
+        return Response({'detail':'Missing product_id'}, status=status.HTTP_400_BAD_REQUEST)
     try:
-        cents = int(float(amount) * 100)
-        intent = stripe.PaymentIntent.create(amount=cents, currency='usd', automatic_payment_methods={'enabled': True})
-        return Response({'client_secret': intent.client_secret})
-    except Exception as e:
+        order = services.order_for_won_auction(product_id, request.user)
+        client_secret = services.payment_intent_for_order(order)
+    except services.PaymentError as e:
+        return Response({'detail': e.detail}, status=e.status_code)
+    except (TypeError, ValueError):
+        return Response({'detail':'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    except stripe.error.StripeError as e:
         return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'client_secret': client_secret, 'order': order.pk, 'amount': str(order.amount)})
 
 @csrf_exempt
 def stripe_webhook(request):
+    """Verify and store the event, then acknowledge; processing happens in payments.webhooks workers."""
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
     endpoint_secret = settings.STRIPE_WEBHOOK_SECRET
     try:
-        event = stripe.Webhook.construct_event(payload, sig_header, endpoint_secret) if sig_header else json.loads(payload)
-    except Exception as e:
+        stripe.Webhook.construct_event(payload, sig_header, endpoint_secret)
+        event = json.loads(payload)
+    except Exception:
         return HttpResponse(status=400)
-    if event and event.get('type') == 'payment_intent.succeeded':
-        intent = event['data']['object']
-        # TODO: mark order as paid, fulfill it, send emails, etc.
+    webhooks.receive([(event['id'], event['type'], event)])
     return HttpResponse(status=200)
 
-from rest_framework.decorators import api_view, permission_classes
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def confirm_order(request):
-    """Simple endpoint to be called after payment succeeds to create an Order record.
-    For demo, it just returns success. Implement order logic as needed."""
-    return Response({'detail':'order recorded (demo)'}, status=status.HTTP_201_CREATED)
+    """Status of the user's order for a won auction (called after the payment form completes).
+    The order is marked paid by the payment_intent.succeeded webhook, so clients may poll until it is."""
+    try:
+        order = Order.objects.filter(product_id=int(request.data.get('product_id')), buyer=request.user).first()
+    except (TypeError, ValueError):
+        order = None
+    if order is None:
+        return Response({'detail':'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'order': order.pk, 'product': order.product_id, 'amount': str(order.amount),
+                     'status': order.status, 'paid_at': order.paid_at})
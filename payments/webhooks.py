@@ -0,0 +1,121 @@
+"""Stripe webhook intake and batch processing.
+
+The endpoint only verifies the signature and stores the event (INSERT ... ON CONFLICT DO NOTHING on the
+event id, so Stripe's retries and duplicate deliveries are dropped) before answering 200. A local
+worker pool then processes stored events in id order, a batch per transaction:
+
+- events are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several workers or processes can drain;
+- payment intents of the whole batch are loaded with one query and updated with one UPDATE per outcome;
+- an intent that already succeeded is never moved back to failed, and an order is marked paid once;
+- a success for another amount or currency than the intent was created with leaves the order unpaid.
+
+`manage.py process_webhooks --loop` drains on a timer and picks up anything a crashed process left.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import Order, Payment, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+SUCCEEDED = 'payment_intent.succeeded'
+FAILED = 'payment_intent.payment_failed'
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def receive(events):
+    """Store verified events given as (event id, type, payload) tuples, ignoring ids already stored."""
+    WebhookEvent.objects.bulk_create([WebhookEvent(event_id=event_id, type=type_, payload=payload)
+                                      for event_id, type_, payload in events], ignore_conflicts=True)
+    transaction.on_commit(wake)
+
+
+def get_executor():
+    global _executor, _slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'PAYMENTS_WEBHOOK_WORKERS', 2)
+                _slots = threading.BoundedSemaphore(workers)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhooks')
+    return _executor
+
+
+def wake():
+    """Start draining unless every worker is already busy (a busy worker keeps going until nothing is left)."""
+    executor = get_executor()
+    if _slots.acquire(blocking=False):
+        executor.submit(_drain_in_worker)
+
+
+def _drain_in_worker():
+    try:
+        drain()
+    except Exception:
+        logger.exception('stripe webhook processing failed; process_webhooks will pick the events up')
+    finally:
+        _slots.release()
+        close_old_connections()
+
+
+def drain(batch_size=None):
+    """Process stored events until none are left. Returns the number processed."""
+    batch_size = batch_size or getattr(settings, 'PAYMENTS_WEBHOOK_BATCH_SIZE', 500)
+    total = 0
+    while True:
+        processed = process_batch(batch_size)
+        if not processed:
+            return total
+        total += processed
+
+
+def process_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(WebhookEvent.objects.select_for_update(skip_locked=True)
+                      .filter(processed_at__isnull=True).order_by('id')
+                      .values_list('pk', 'type', 'payload')[:batch_size])
+        if not events:
+            return 0
+        # last event per intent wins within the batch, except that success is final
+        outcome = {}
+        for _, type_, payload in events:
+            if type_ not in (SUCCEEDED, FAILED):
+                continue
+            intent = payload['data']['object']
+            if outcome.get(intent['id'], (None,))[0] != SUCCEEDED:
+                amount = intent.get('amount_received', intent.get('amount'))
+                outcome[intent['id']] = (type_, amount, intent.get('currency'))
+        if outcome:
+            _apply(outcome, now)
+        WebhookEvent.objects.filter(pk__in=[pk for pk, _, _ in events]).update(processed_at=now)
+    return len(events)
+
+
+def _apply(outcome, now):
+    payments = {p['stripe_payment_intent_id']: p for p in Payment.objects
+                .filter(stripe_payment_intent_id__in=list(outcome))
+                .values('pk', 'stripe_payment_intent_id', 'order_id', 'amount_cents', 'currency', 'status')}
+    succeeded, failed = [], []
+    for intent_id, (type_, amount, currency) in outcome.items():
+        payment = payments.get(intent_id)
+        if payment is None:
+            continue  # not created by us (e.g. another integration on the same Stripe account)
+        if type_ == FAILED:
+            failed.append(payment['pk'])
+        elif amount != payment['amount_cents'] or (currency or '').lower() != payment['currency']:
+            logger.warning('payment intent %s succeeded with %s %s, expected %s %s; order %s left unpaid',
+                           intent_id, amount, currency, payment['amount_cents'], payment['currency'], payment['order_id'])
+        else:
+            succeeded.append(payment)
+    if failed:
+        Payment.objects.filter(pk__in=failed, status=Payment.REQUIRES_PAYMENT).update(status=Payment.FAILED, updated_at=now)
+    if succeeded:
+        Payment.objects.filter(pk__in=[p['pk'] for p in succeeded]).update(status=Payment.SUCCEEDED, updated_at=now)
+        Order.objects.filter(pk__in={p['order_id'] for p in succeeded}, status=Order.PENDING).update(status=Order.PAID, paid_at=now)
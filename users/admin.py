@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User
+from .models import User, OutboundEmail
+from . import outbox
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -8,3 +9,14 @@ class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
         ('Extra', {'fields': ('phone',)}),
     )
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'available_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to_email',)
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected dead emails')
+    def requeue(self, request, queryset):
+        self.message_user(request, f'{outbox.requeue_dead(queryset)} email(s) requeued.')
@@ -0,0 +1,134 @@
+"""JWT authentication that trusts the signed user claims instead of loading the user on every request.
+
+Access tokens carry the fields in User.TOKEN_CLAIMS, stamped when they are issued (VerifyOTPView,
+token/ and token/refresh/). With a shared cache, ClaimsJWTAuthentication rebuilds request.user from
+them as a ClaimsUser: views that only use the id, username or staff flag (placing bids, notifications,
+/me/) run without the user query. Any other field is loaded on first access, in one query.
+
+Per user, the cache holds when earlier tokens became stale and when they were revoked:
+
+- a saved change to a claimed field or to is_active makes earlier tokens stale: they are
+  authenticated with the database lookup (which rejects inactive users) until the client refreshes;
+- `revoke` (e.g. "sign out everywhere", or a deleted user) rejects earlier access and refresh tokens.
+
+Lookups are memoized in-process for AUTH_CLAIMS_LOCAL_TTL seconds, so a change made in another process
+takes effect within that time. The markers are only seen by every process in a shared cache
+(auctioncraft_api/shared_cache.py); without one the claims are never trusted and every request loads
+the user from the database, as JWTAuthentication does.
+`manage.py bench_auth` compares the per-request cost with simplejwt's JWTAuthentication.
+"""
+import time
+from django.core.cache import cache
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from auctioncraft_api import shared_cache
+from .models import User, ClaimsUser
+
+_local = {}  # user id -> (expires, (stale_before, revoked_before))
+
+
+def _key(user_id):
+    return f'auth:tokens:{user_id}'
+
+
+def _user_id(value):
+    return User._meta.pk.to_python(value)  # newer simplejwt versions put the id in the token as a string
+
+
+def _lifetime():
+    return int(max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds())
+
+
+def token_state(user_id):
+    """(stale_before, revoked_before) timestamps for a user's tokens; either may be None."""
+    user_id = _user_id(user_id)
+    now = time.monotonic()
+    entry = _local.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    state = cache.get(_key(user_id)) or (None, None)
+    if len(_local) >= getattr(settings, 'AUTH_CLAIMS_LOCAL_SIZE', 10000):
+        _local.clear()
+    _local[user_id] = (now + getattr(settings, 'AUTH_CLAIMS_LOCAL_TTL', 5), state)
+    return state
+
+
+def _mark(user_id, stale=False, revoked=False):
+    user_id = _user_id(user_id)
+    stale_before, revoked_before = cache.get(_key(user_id)) or (None, None)
+    now = time.time()
+    state = (now if stale or revoked else stale_before, now if revoked else revoked_before)
+    cache.set(_key(user_id), state, _lifetime())
+    _local.pop(user_id, None)
+
+
+def invalidate(user_id):
+    """Stop trusting the claims of the user's existing tokens (they are checked against the database)."""
+    _mark(user_id, stale=True)
+
+
+def revoke(user_id):
+    """Reject every access and refresh token issued to the user until now."""
+    _mark(user_id, revoked=True)
+
+
+def _issued_before(token, moment):
+    return moment is not None and token.get('iat', 0) <= moment
+
+
+def add_claims(token, user):
+    for field in User.TOKEN_CLAIMS:
+        token[field] = getattr(user, field)
+    return token
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry the user's current claims (read from the database on refresh)."""
+
+    def verify(self):
+        super().verify()
+        if _issued_before(self, token_state(self[api_settings.USER_ID_CLAIM])[1]):
+            raise TokenError('Token has been revoked')
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token._user = user
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        user = getattr(self, '_user', None)
+        if user is None:
+            user = User.objects.filter(**{api_settings.USER_ID_FIELD: self[api_settings.USER_ID_CLAIM]}).first()
+            if user is None or not user.is_active:
+                raise TokenError('User not found or inactive')
+        return add_claims(access, user)
+
+
+def tokens_for(user):
+    """{'access': ..., 'refresh': ...} for a user who has just signed in."""
+    refresh = ClaimsRefreshToken.for_user(user)
+    return {'access': str(refresh.access_token), 'refresh': str(refresh)}
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None or any(field not in validated_token for field in User.TOKEN_CLAIMS):
+            return super().get_user(validated_token)  # issued before claims were added
+        stale_before, revoked_before = token_state(user_id)
+        if _issued_before(validated_token, revoked_before):
+            raise AuthenticationFailed('Token has been revoked.', code='token_revoked')
+        if _issued_before(validated_token, stale_before) or not shared_cache.is_shared():
+            # a process-local cache misses changes (e.g. a deactivation) made by the other workers
+            return super().get_user(validated_token)
+        values = {'id': _user_id(user_id), 'is_active': True, **{field: validated_token[field] for field in User.TOKEN_CLAIMS}}
+        # from_db takes the values in model field order
+        fields = [f.attname for f in ClaimsUser._meta.concrete_fields if f.attname in values]
+        return ClaimsUser.from_db(None, fields, [values[name] for name in fields])
@@ -0,0 +1,50 @@
+"""Measure authentication overhead per request: simplejwt's JWTAuthentication against ClaimsJWTAuthentication.
+
+    python manage.py bench_auth --requests 5000
+
+Both authenticate the same bearer token (issued with claims) on a prepared request. Reported are
+queries per request and latency, with and without touching a field that is not in the token
+(the claims user then loads it with one query). The claims are trusted as they would be with a shared
+cache (CACHE_SHARED), since the benchmark runs in one process.
+"""
+import time
+from django.db import connection
+from django.core.management.base import BaseCommand
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from users.authentication import ClaimsJWTAuthentication, tokens_for
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-request JWT authentication cost (database user lookup vs signed claims).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+
+    @override_settings(CACHE_SHARED=True)
+    def handle(self, *args, **opts):
+        user, _ = User.objects.get_or_create(username='bench-auth', defaults={'email': 'bench-auth@example.com'})
+        header = f'Bearer {tokens_for(user)["access"]}'
+        factory = APIRequestFactory()
+        cases = [
+            ('JWTAuthentication', JWTAuthentication(), None),
+            ('ClaimsJWTAuthentication', ClaimsJWTAuthentication(), None),
+            ('Claims + unclaimed field', ClaimsJWTAuthentication(), 'unread_notifications'),
+        ]
+        for name, authenticator, field in cases:
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(opts['requests']):
+                    request = Request(factory.get('/api/auth/me/', HTTP_AUTHORIZATION=header))
+                    started = time.perf_counter()
+                    authenticated, _ = authenticator.authenticate(request)
+                    if field:
+                        getattr(authenticated, field)
+                    timings.append((time.perf_counter() - started) * 1e6)
+            timings.sort()
+            pct = lambda p: timings[min(int(len(timings) * p), len(timings) - 1)]
+            self.stdout.write(f'{name:>25}: {len(queries) / opts["requests"]:.2f} queries/request, '
+                              f'p50 {pct(0.5):.0f} us, p95 {pct(0.95):.0f} us, mean {sum(timings) / len(timings):.0f} us')
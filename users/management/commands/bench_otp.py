@@ -0,0 +1,57 @@
+"""Measure OTP verify latency as the OTPCode table grows, and the cost of sweeping expired codes.
+
+    python manage.py bench_otp --sizes 10000,100000,1000000 --lookups 500
+
+For each size the table is topped up with codes for random emails (about 80% already expired),
+then random existing emails are verified with wrong and right codes. Verify reads a bounded number
+of rows through the (email, created_at) index, so its latency should stay flat across sizes.
+Finally the expired rows are swept and timed.
+"""
+import random
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from users.models import OTPCode
+from .sweep_otps import sweep
+
+
+class Command(BaseCommand):
+    help = 'Benchmark OTP verify latency against table size and the expired-code sweep.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000')
+        parser.add_argument('--lookups', type=int, default=300)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(7)
+        emails = []
+        for size in [int(s) for s in opts['sizes'].split(',')]:
+            self.seed(size - OTPCode.objects.filter(email__startswith='bench-otp-').count(), emails, rng)
+            timings = []
+            for _ in range(opts['lookups']):
+                email = rng.choice(emails)
+                code = rng.choice(('000000', '123456'))
+                started = time.perf_counter()
+                OTPCode.verify(email, code)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            pct = lambda p: timings[min(int(len(timings) * p), len(timings) - 1)]
+            self.stdout.write(f'{OTPCode.objects.count()} codes: verify p50 {pct(0.5):.2f} ms, p95 {pct(0.95):.2f} ms, p99 {pct(0.99):.2f} ms')
+        started = time.perf_counter()
+        deleted = sweep(opts['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'swept {deleted} expired codes in {elapsed:.2f} s ({deleted / max(elapsed, 1e-9):.0f} rows/s)')
+        OTPCode.objects.filter(email__startswith='bench-otp-').delete()
+
+    def seed(self, count, emails, rng, batch_size=10000):
+        now = timezone.now()
+        for start in range(0, max(count, 0), batch_size):
+            rows = []
+            for _ in range(start, min(start + batch_size, count)):
+                email = f'bench-otp-{len(emails)}@example.com'
+                emails.append(email)
+                expires = now + timedelta(minutes=10) if rng.random() < 0.2 else now - timedelta(minutes=rng.randint(1, 10000))
+                rows.append(OTPCode(email=email, code_hash=OTPCode.hash_code(email, '123456'), expires_at=expires))
+            OTPCode.objects.bulk_create(rows)
@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from users import services
+
+
+class Command(BaseCommand):
+    help = 'Delete notifications older than NOTIFICATIONS_TTL_DAYS in batches, keeping unread counters in step.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Override NOTIFICATIONS_TTL_DAYS.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--recount', action='store_true', help='Also recompute every unread counter from scratch.')
+
+    def handle(self, *args, **opts):
+        days = opts['days'] if opts['days'] is not None else getattr(settings, 'NOTIFICATIONS_TTL_DAYS', 180)
+        deleted = services.prune(timezone.now() - timedelta(days=days), batch_size=opts['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} notification(s) older than {days} days deleted.'))
+        if opts['recount']:
+            self.stdout.write(f'Unread counters rebuilt for {services.recount_unread()} user(s).')
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from users import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails (OTP codes, notifications). Runs once, or as a long-lived worker with --loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running and send retries as they become due.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between drains with --loop.')
+        parser.add_argument('--requeue-dead', action='store_true', help='Retry dead-lettered emails first.')
+
+    def handle(self, *args, **opts):
+        if opts['requeue_dead']:
+            self.stdout.write(f'{outbox.requeue_dead()} dead email(s) requeued.')
+        if opts['loop']:
+            self.stdout.write('Email outbox worker running...')
+            next_prune = 0
+            while True:
+                outbox.drain()
+                if time.monotonic() >= next_prune:
+                    outbox.prune_sent()
+                    next_prune = time.monotonic() + 3600
+                time.sleep(opts['interval'])
+        counts = outbox.drain()
+        counts['pruned'] = outbox.prune_sent()
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{n} {kind}' for kind, n in counts.items())))
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from users.models import OTPCode
+
+
+class Command(BaseCommand):
+    help = 'Delete expired OTP codes in batches (walks the expires_at index). Runs once, or periodically with --loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--loop', action='store_true', help='Keep running and sweep every --interval seconds.')
+        parser.add_argument('--interval', type=int, default=300)
+
+    def handle(self, *args, **opts):
+        while True:
+            deleted = sweep(opts['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{deleted} expired OTP code(s) deleted.'))
+            if not opts['loop']:
+                return
+            time.sleep(opts['interval'])
+
+
+def sweep(batch_size, now=None):
+    """Delete codes that expired before `now`, one short transaction per batch so verifies are never blocked for long."""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        ids = list(OTPCode.objects.filter(expires_at__lt=now).order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += OTPCode.objects.filter(pk__in=ids).delete()[0]
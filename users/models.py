@@ -1,3 +1,6 @@
+import hashlib
+import hmac
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
@@ -6,25 +9,59 @@ from datetime import timedelta
 class User(AbstractUser):
     # Extend later with profile fields (phone, address, image)
     phone = models.CharField(max_length=20, blank=True)
+    # maintained by users.services; `manage.py prune_notifications --recount` repairs drift
+    unread_notifications = models.PositiveIntegerField(default=0)
+
+    # fields signed into access tokens (users.authentication); saving a change to one of them, or to
+    # is_active, makes earlier tokens fall back to a database lookup
+    TOKEN_CLAIMS = ('username', 'is_staff', 'email', 'first_name', 'last_name', 'phone')
+
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        tracked = cls.TOKEN_CLAIMS + ('is_active',)
+        user._saved_claims = {f: v for f, v in zip(field_names, values) if f in tracked}
+        return user
+
+class ClaimsUser(User):
+    """A user rebuilt from access token claims without a query (users.authentication).
+    The first access to any other field loads all of them in one query.
+    """
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+
 class OTPCode(models.Model):
-    """One-time code for OTP authentication. 
-    Stores the code (plaintext for demo) and expiry. In production, consider hashing the code.
+    """One-time code for OTP authentication.
+    Only a keyed hash of the code is stored (see hash_code); verify with `matches`.
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='otps', null=True, blank=True)
     email = models.EmailField()  # email the code was requested for (may be used to create a user)
-    code = models.CharField(max_length=10)
+    code_hash = models.CharField(max_length=64)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
 
     class Meta:
         indexes = [
-            models.Index(fields=['email']),
+            models.Index(fields=['email', '-created_at']),
             models.Index(fields=['expires_at']),
         ]
 
+    @staticmethod
+    def hash_code(email, code):
+        return hmac.new(settings.SECRET_KEY.encode(), f'{email.lower()}:{code}'.encode(), hashlib.sha256).hexdigest()
+
+    def matches(self, code):
+        return hmac.compare_digest(self.code_hash, self.hash_code(self.email, code))
+
     def is_expired(self):
         return timezone.now() > self.expires_at
 
@@ -33,17 +70,64 @@ class OTPCode(models.Model):
         return cls.objects.create(
             user=user,
             email=email,
-            code=code,
+            code_hash=cls.hash_code(email, code),
             expires_at=timezone.now() + timedelta(minutes=lifetime_minutes)
         )
 
+    @classmethod
+    def verify(cls, email, code):
+        """The matching unexpired code among the most recent few for this email, or None.
+        Reads at most OTP_MAX_ACTIVE rows through the (email, created_at) index, however large the table is.
+        """
+        recent = cls.objects.filter(email=email).order_by('-created_at')[:getattr(settings, 'OTP_MAX_ACTIVE', 5)]
+        now = timezone.now()
+        # compare against every candidate so timing does not reveal which one matched
+        found = None
+        for otp in recent:
+            if otp.matches(code) and otp.expires_at >= now:
+                found = otp
+        return found
+
 class Notification(models.Model):
-    """Simple Notification model to store messages for users."""
+    """Simple Notification model to store messages for users.
+    Create them through users.services.notify_many so the recipients' unread counters stay in step.
+    """
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     title = models.CharField(max_length=255)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),  # the per-user feed
+            models.Index(fields=['created_at']),  # TTL pruning
+        ]
+
     def __str__(self):
         return f"Notification to {self.user_id}: {self.title[:20]}"
+
+class OutboundEmail(models.Model):
+    """Transactional outbox for email: rows are written in the same transaction as the OTPCode or
+    Notification they belong to and delivered by the worker in users/outbox.py.
+    """
+    PENDING, SENT, DEAD = 'pending', 'sent', 'dead'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (DEAD, 'Dead')]
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)  # not picked up before this (lease, backoff, rate limit)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"Email to {self.to_email} ({self.status}): {self.subject[:20]}"
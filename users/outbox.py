@@ -0,0 +1,188 @@
+"""Email outbox: requests never talk to the mail server.
+
+`enqueue` / `enqueue_many` insert OutboundEmail rows inside the caller's transaction, so a message
+exists if and only if the OTPCode or Notification it belongs to was committed. After the commit a
+local worker pool is woken to drain the table:
+
+- rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED and leased by pushing `available_at`
+  out, so several workers (or processes) never send the same row at once;
+- each worker thread keeps one SMTP connection open for a whole drain and reopens it after an error;
+- a failed send is retried with exponential backoff and dead-lettered after OUTBOX_MAX_ATTEMPTS;
+- each recipient gets at most OUTBOX_RATE_LIMIT messages per OUTBOX_RATE_WINDOW seconds (counted in
+  the cache, so shared between processes with Redis); the rest wait for the next window;
+- a sent row keeps its recipient and subject but not its body, which may hold an OTP code, and is
+  deleted by `prune_sent` after OUTBOX_SENT_TTL_DAYS. Dead letters keep the body for `requeue_dead`.
+
+`manage.py run_outbox --loop` drains on a timer; it picks up retries and anything left behind by a
+crashed process. Set OUTBOX_EMAIL_BACKEND to 'django.core.mail.backends.locmem.EmailBackend' to
+deliver into django.core.mail.outbox instead of SMTP.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+_local = threading.local()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(to_email, subject, body):
+    """Queue one message in the current transaction; it is sent after the transaction commits."""
+    email = OutboundEmail.objects.create(to_email=to_email, subject=subject, body=body)
+    transaction.on_commit(wake)
+    return email
+
+
+def enqueue_many(messages):
+    """Queue (to_email, subject, body) tuples with one INSERT."""
+    rows = OutboundEmail.objects.bulk_create([OutboundEmail(to_email=to, subject=subject, body=body)
+                                              for to, subject, body in messages if to])
+    if rows:
+        transaction.on_commit(wake)
+    return rows
+
+
+def get_executor():
+    global _executor, _slots
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = _setting('OUTBOX_WORKERS', 2)
+                _slots = threading.BoundedSemaphore(workers)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox')
+    return _executor
+
+
+def wake():
+    """Start a drain unless every worker is already draining (a busy worker keeps going until the table is empty)."""
+    executor = get_executor()
+    if _slots.acquire(blocking=False):
+        executor.submit(_drain_in_worker)
+
+
+def _drain_in_worker():
+    try:
+        drain()
+    except Exception:
+        logger.exception('email outbox drain failed; run_outbox will pick the rows up')
+    finally:
+        _slots.release()
+        close_old_connections()
+
+
+def _connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        backend = _setting('OUTBOX_EMAIL_BACKEND', None) or settings.EMAIL_BACKEND
+        connection = _local.connection = get_connection(backend)
+        connection.open()
+    return connection
+
+
+def _reset_connection():
+    connection = getattr(_local, 'connection', None)
+    _local.connection = None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    lease = timedelta(seconds=_setting('OUTBOX_LEASE', 300))
+    with transaction.atomic():
+        rows = list(OutboundEmail.objects.select_for_update(skip_locked=True)
+                    .filter(status=OutboundEmail.PENDING, available_at__lte=now)
+                    .order_by('available_at', 'id')[:batch_size])
+        if rows:
+            OutboundEmail.objects.filter(pk__in=[row.pk for row in rows]).update(available_at=now + lease)
+    return rows
+
+
+def _allow(recipient):
+    window = _setting('OUTBOX_RATE_WINDOW', 60)
+    key = f'outbox:rate:{recipient.lower()}:{int(time.time() // window)}'
+    cache.add(key, 0, window)
+    try:
+        return cache.incr(key) <= _setting('OUTBOX_RATE_LIMIT', 10)
+    except ValueError:
+        return True  # the counter expired between add and incr
+
+
+def _backoff(attempts):
+    delay = min(_setting('OUTBOX_RETRY_DELAY', 30) * 2 ** (attempts - 1), _setting('OUTBOX_MAX_RETRY_DELAY', 3600))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _send(row):
+    now = timezone.now()
+    if not _allow(row.to_email):
+        window = _setting('OUTBOX_RATE_WINDOW', 60)
+        # try again when the recipient's next window opens
+        OutboundEmail.objects.filter(pk=row.pk).update(available_at=now + timedelta(seconds=window - time.time() % window))
+        return 'deferred'
+    from_email = _setting('DEFAULT_FROM_EMAIL', 'no-reply@auctioncraft.local')
+    try:
+        EmailMessage(row.subject, row.body, from_email, [row.to_email], connection=_connection()).send()
+    except Exception as e:
+        _reset_connection()
+        attempts = row.attempts + 1
+        dead = attempts >= _setting('OUTBOX_MAX_ATTEMPTS', 8)
+        OutboundEmail.objects.filter(pk=row.pk).update(
+            attempts=attempts, last_error=repr(e)[:2000], available_at=now + _backoff(attempts),
+            status=OutboundEmail.DEAD if dead else OutboundEmail.PENDING)
+        logger.warning('sending email %s to %s failed (attempt %s): %s', row.pk, row.to_email, attempts, e)
+        return 'dead' if dead else 'retry'
+    OutboundEmail.objects.filter(pk=row.pk).update(status=OutboundEmail.SENT, sent_at=now, attempts=row.attempts + 1, body='')
+    return 'sent'
+
+
+def drain(batch_size=None):
+    """Send everything that is due. Returns counts by outcome (sent, retry, dead, deferred)."""
+    batch_size = batch_size or _setting('OUTBOX_BATCH_SIZE', 100)
+    counts = {'sent': 0, 'retry': 0, 'dead': 0, 'deferred': 0}
+    try:
+        while True:
+            rows = _claim(batch_size)
+            if not rows:
+                return counts
+            for row in rows:
+                counts[_send(row)] += 1
+    finally:
+        _reset_connection()
+
+
+def prune_sent(batch_size=5000, now=None):
+    """Delete rows sent more than OUTBOX_SENT_TTL_DAYS ago, a batch per statement. Returns the number deleted."""
+    before = (now or timezone.now()) - timedelta(days=_setting('OUTBOX_SENT_TTL_DAYS', 7))
+    total = 0
+    while True:
+        ids = list(OutboundEmail.objects.filter(status=OutboundEmail.SENT, sent_at__lt=before)
+                   .values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += OutboundEmail.objects.filter(pk__in=ids).delete()[0]
+
+
+def requeue_dead(queryset=None):
+    """Give dead letters a fresh set of attempts."""
+    queryset = OutboundEmail.objects.all() if queryset is None else queryset
+    return queryset.filter(status=OutboundEmail.DEAD).update(status=OutboundEmail.PENDING, attempts=0, available_at=timezone.now())
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from .models import User, OTPCode, Notification
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt import serializers as jwt_serializers
+from .authentication import ClaimsRefreshToken
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -34,3 +36,10 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = ('id','title','message','is_read','created_at')
+
+# token/ and token/refresh/ issue access tokens carrying the user claims (users.authentication)
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
@@ -0,0 +1,66 @@
+# Notification inbox logic: every write that changes is_read or removes unread rows also adjusts User.unread_notifications
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from .models import User, Notification
+
+
+def _adjust_unread(deltas):
+    """Apply {user_id: delta} to the unread counters with one UPDATE per distinct delta."""
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(user_id)
+    for delta, user_ids in by_delta.items():
+        User.objects.filter(pk__in=user_ids).update(unread_notifications=Greatest(F('unread_notifications') + delta, 0))
+
+
+def notify_many(notifications):
+    """bulk_create unsaved Notification objects and count them as unread for their users."""
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(notifications)
+        _adjust_unread(Counter(n.user_id for n in created if not n.is_read))
+    return created
+
+
+def mark_read(user, ids=None):
+    """Mark the user's notifications (all of them, or those in `ids`) read with a single UPDATE. Returns how many changed."""
+    queryset = Notification.objects.filter(user=user, is_read=False)
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+    with transaction.atomic():
+        changed = queryset.update(is_read=True)
+        if ids is None:
+            User.objects.filter(pk=user.pk).update(unread_notifications=0)
+        else:
+            _adjust_unread({user.pk: -changed})
+    return changed
+
+
+def prune(older_than, batch_size=5000):
+    """Delete notifications created before `older_than` in batches along the created_at index. Returns the number deleted."""
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(Notification.objects.select_for_update().filter(created_at__lt=older_than)
+                        .order_by('created_at').values_list('pk', 'user_id', 'is_read')[:batch_size])
+            if not rows:
+                return total
+            Notification.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+            unread = Counter(user_id for _, user_id, is_read in rows if not is_read)
+            _adjust_unread({user_id: -n for user_id, n in unread.items()})
+        total += len(rows)
+
+
+def recount_unread():
+    """Recompute every user's unread counter from the notifications table."""
+    with transaction.atomic():
+        counts = dict(Notification.objects.filter(is_read=False).values_list('user_id').annotate(n=Count('id')))
+        User.objects.exclude(Q(pk__in=counts) | Q(unread_notifications=0)).update(unread_notifications=0)
+        by_count = defaultdict(list)
+        for user_id, n in counts.items():
+            by_count[n].append(user_id)
+        for n, user_ids in by_count.items():
+            User.objects.filter(pk__in=user_ids).update(unread_notifications=n)
+    return len(counts)
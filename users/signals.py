@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import User
+from . import authentication
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    deferred = instance.get_deferred_fields()
+    current = {f: getattr(instance, f) for f in User.TOKEN_CLAIMS + ('is_active',) if f not in deferred}
+    saved = getattr(instance, '_saved_claims', None)
+    if not created and (saved is None or any(f not in saved or saved[f] != v for f, v in current.items())):
+        # tokens issued before now assert the old values
+        authentication.invalidate(instance.pk)
+    instance._saved_claims = current
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    authentication.revoke(instance.pk)
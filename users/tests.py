@@ -0,0 +1,239 @@
+import re
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, close_old_connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import TokenError
+from .models import User, ClaimsUser, OTPCode, OutboundEmail, Notification
+from . import authentication, outbox, services
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication._local.clear()
+        self.user = User.objects.create_user('alice', email='alice@example.com')
+        self.tokens = authentication.tokens_for(self.user)
+
+    def authenticate(self):
+        header = f'Bearer {self.tokens["access"]}'
+        request = Request(APIRequestFactory().get('/api/auth/me/', HTTP_AUTHORIZATION=header))
+        user, _ = authentication.ClaimsJWTAuthentication().authenticate(request)
+        return user
+
+    @override_settings(CACHE_SHARED=True)
+    def test_shared_cache_trusts_the_claims(self):
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual((user.pk, user.username, user.email), (self.user.pk, 'alice', 'alice@example.com'))
+
+    @override_settings(CACHE_SHARED=False)
+    def test_local_cache_loads_the_user(self):
+        with self.assertNumQueries(1):
+            user = self.authenticate()
+        self.assertNotIsInstance(user, ClaimsUser)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_local_cache_sees_a_deactivation_from_another_process(self):
+        # the update bypasses the signal, as a write in another worker would with a per-process cache
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(CACHE_SHARED=True)
+    def test_changed_user_makes_earlier_tokens_stale(self):
+        self.user.is_staff = True
+        self.user.save()
+        with self.assertNumQueries(1):
+            self.assertTrue(self.authenticate().is_staff)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(CACHE_SHARED=True)
+    def test_revoked_tokens_are_rejected(self):
+        authentication.revoke(self.user.pk)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+        with self.assertRaises(TokenError):
+            authentication.ClaimsRefreshToken(self.tokens['refresh'])
+
+
+@override_settings(OUTBOX_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OTPTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def request_code(self, email='bob@example.com', **headers):
+        response = self.client.post('/api/auth/otp/request/', {'email': email}, **headers)
+        if response.status_code != 200:
+            return response, None
+        body = OutboundEmail.objects.filter(to_email=email).latest('id').body
+        return response, re.search(r'\b(\d{6})\b', body).group(1)
+
+    def verify(self, code, email='bob@example.com'):
+        return self.client.post('/api/auth/otp/verify/', {'email': email, 'code': code})
+
+    def test_code_signs_in_once(self):
+        _, code = self.request_code()
+        self.assertEqual(self.verify(f'{(int(code) + 1) % 10 ** 6:06d}').status_code, 400)
+        response = self.verify(code)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'access', 'refresh'})
+        self.assertEqual(self.verify(code).status_code, 400)
+        self.assertFalse(OTPCode.objects.exists())
+
+    def test_code_is_stored_hashed_and_expires(self):
+        _, code = self.request_code()
+        otp = OTPCode.objects.get()
+        self.assertNotIn(code, otp.code_hash)
+        with mock.patch('django.utils.timezone.now', return_value=otp.expires_at + timedelta(seconds=1)):
+            self.assertEqual(self.verify(code).status_code, 400)
+        self.assertEqual(self.verify(code).status_code, 200)
+
+    def test_sent_email_keeps_no_code(self):
+        _, code = self.request_code()
+        self.assertEqual(outbox.drain()['sent'], 1)
+        self.assertIn(code, mail.outbox[0].body)
+        row = OutboundEmail.objects.get()
+        self.assertEqual((row.status, row.body), (OutboundEmail.SENT, ''))
+        OutboundEmail.objects.filter(pk=row.pk).update(sent_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(outbox.prune_sent(), 1)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    @override_settings(OTP_THROTTLE={'otp_request': {'ip': (2, 3600), 'email': (3, 3600)}})
+    def test_requests_are_throttled_per_ip_and_email(self):
+        statuses = [self.request_code(f'user{i}@example.com', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}')[0].status_code
+                    for i in range(3)]
+        # a client choosing its own X-Forwarded-For is still the same client
+        self.assertEqual(statuses, [200, 200, 429])
+        cache.clear()
+        statuses = [self.request_code('bob@example.com', REMOTE_ADDR=f'10.0.0.{i}')[0].status_code for i in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    @override_settings(OTP_THROTTLE={'otp_verify': {'email': (2, 600)}})
+    def test_verify_attempts_are_throttled(self):
+        _, code = self.request_code()
+        self.assertEqual([self.verify('999999').status_code for _ in range(2)], [400, 400])
+        self.assertEqual(self.verify(code).status_code, 429)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def notify(self, user, count, **fields):
+        return services.notify_many([Notification(user=user, title='t', message='m', **fields) for _ in range(count)])
+
+    def unread(self):
+        return dict(User.objects.filter(pk__in=[self.alice.pk, self.bob.pk]).values_list('username', 'unread_notifications'))
+
+    def test_new_notifications_are_counted(self):
+        self.notify(self.alice, 3)
+        self.notify(self.bob, 1)
+        self.notify(self.bob, 1, is_read=True)
+        self.assertEqual(self.unread(), {'alice': 3, 'bob': 1})
+
+    def test_marking_read_lowers_and_resets(self):
+        first, *_ = self.notify(self.alice, 3)
+        self.assertEqual(services.mark_read(self.alice, ids=[first.pk]), 1)
+        self.assertEqual(services.mark_read(self.alice, ids=[first.pk]), 0)
+        self.assertEqual(self.unread()['alice'], 2)
+        self.assertEqual(services.mark_read(self.alice), 2)
+        self.assertEqual(self.unread()['alice'], 0)
+
+    def test_prune_removes_unread_from_the_counter(self):
+        self.notify(self.alice, 2)
+        read, = self.notify(self.bob, 1)
+        services.mark_read(self.bob, ids=[read.pk])
+        self.notify(self.bob, 1)
+        self.assertEqual(services.prune(timezone.now() + timedelta(seconds=1), batch_size=1), 4)
+        self.assertEqual(self.unread(), {'alice': 0, 'bob': 0})
+
+    def test_recount_repairs_drifted_counters(self):
+        self.notify(self.alice, 2)
+        User.objects.filter(pk=self.alice.pk).update(unread_notifications=9)
+        User.objects.filter(pk=self.bob.pk).update(unread_notifications=4)
+        self.assertEqual(services.recount_unread(), 1)
+        self.assertEqual(self.unread(), {'alice': 2, 'bob': 0})
+
+    def test_unread_count_endpoint(self):
+        self.notify(self.alice, 2)
+        header = f'Bearer {authentication.tokens_for(self.alice)["access"]}'
+        response = self.client.get('/api/auth/notifications/unread_count/', HTTP_AUTHORIZATION=header)
+        self.assertEqual(response.json(), {'unread': 2})
+
+
+@override_settings(OUTBOX_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', OUTBOX_RETRY_DELAY=30,
+                   OUTBOX_MAX_ATTEMPTS=3, OUTBOX_LEASE=300)
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def queue(self, *recipients):
+        return [outbox.enqueue(to, 'Subject', 'Body') for to in recipients]
+
+    def test_claimed_rows_are_leased(self):
+        row, = self.queue('a@example.com')
+        claimed = outbox._claim(10)
+        self.assertEqual(claimed, [row])
+        self.assertEqual(outbox._claim(10), [])
+        lease = OutboundEmail.objects.get().available_at - claimed[0].available_at
+        self.assertGreaterEqual(lease, timedelta(seconds=300))
+
+    def test_failed_send_backs_off_then_dead_letters(self):
+        row, = self.queue('a@example.com')
+        delays = []
+        with mock.patch.object(outbox.EmailMessage, 'send', side_effect=OSError('refused')), \
+                mock.patch.object(outbox.random, 'uniform', return_value=1), self.assertLogs('users.outbox', 'WARNING'):
+            for outcome in ('retry', 'retry', 'dead'):
+                started = timezone.now()
+                self.assertEqual(outbox.drain()[outcome], 1)
+                row.refresh_from_db()
+                delays.append(round((row.available_at - started).total_seconds()))
+                OutboundEmail.objects.filter(pk=row.pk).update(available_at=timezone.now())
+        self.assertEqual(delays[:2], [30, 60])
+        self.assertEqual((row.status, row.attempts, row.body), (OutboundEmail.DEAD, 3, 'Body'))
+        self.assertIn('refused', row.last_error)
+        self.assertEqual(outbox.drain()['sent'], 0)
+        self.assertEqual(outbox.requeue_dead(), 1)
+        self.assertEqual(outbox.drain()['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(OUTBOX_RATE_LIMIT=1)
+    def test_recipient_over_the_rate_limit_waits(self):
+        self.queue('a@example.com', 'A@example.com', 'b@example.com')
+        self.assertEqual(outbox.drain(), {'sent': 2, 'retry': 0, 'dead': 0, 'deferred': 1})
+        deferred = OutboundEmail.objects.get(status=OutboundEmail.PENDING)
+        self.assertEqual((deferred.to_email, deferred.attempts), ('A@example.com', 0))
+        self.assertGreater(deferred.available_at, timezone.now())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs SKIP LOCKED')
+class OutboxClaimTests(TransactionTestCase):
+    def test_rows_locked_by_another_worker_are_skipped(self):
+        first, second = (outbox.enqueue(f'{name}@example.com', 'Subject', 'Body') for name in ('a', 'b'))
+        claimed = []
+
+        def claim():
+            try:
+                claimed.extend(outbox._claim(10))
+            finally:
+                close_old_connections()
+
+        with transaction.atomic():
+            OutboundEmail.objects.select_for_update().get(pk=first.pk)
+            thread = threading.Thread(target=claim)
+            thread.start()
+            thread.join(10)
+        self.assertEqual(claimed, [second])
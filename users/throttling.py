@@ -0,0 +1,59 @@
+"""Token-bucket throttles for the OTP endpoints.
+
+Each bucket holds up to `capacity` tokens and refills continuously at capacity / period tokens per
+second; a request spends one token. Buckets live in the default cache (shared between processes
+with Redis) and are checked per client IP and per requested email, so flooding one address or
+spraying many addresses from one client are both limited. The client IP is REMOTE_ADDR, or the
+X-Forwarded-For entry added by the last of NUM_PROXIES trusted proxies (REST_FRAMEWORK setting). The read-modify-write is not atomic
+across processes; a burst racing on the same bucket can overspend by a token or two.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+
+def take(key, capacity, period):
+    """Spend one token from bucket `key`. Returns 0 if allowed, otherwise seconds until a token is available."""
+    rate = capacity / period
+    now = time.time()
+    tokens, stamp = cache.get(key) or (capacity, now)
+    tokens = min(capacity, tokens + (now - stamp) * rate)
+    if tokens < 1:
+        cache.set(key, (tokens, now), period)
+        return (1 - tokens) / rate
+    cache.set(key, (tokens - 1, now), period)
+    return 0
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle on the client IP and on the `email` field of the request body.
+    `scope` picks the (capacity, period) pairs from the OTP_THROTTLE setting.
+    """
+    scope = None
+
+    def allow_request(self, request, view):
+        rates = getattr(settings, 'OTP_THROTTLE', {}).get(self.scope, {})
+        keys = [('ip', self.get_ident(request))]
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if isinstance(email, str) and email:
+            keys.append(('email', email.strip().lower()))
+        self.retry_after = 0
+        for kind, value in keys:
+            if kind in rates:
+                capacity, period = rates[kind]
+                self.retry_after = take(f'throttle:{self.scope}:{kind}:{value}', capacity, period)
+                if self.retry_after:
+                    return False
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class OTPRequestThrottle(TokenBucketThrottle):
+    scope = 'otp_request'
+
+
+class OTPVerifyThrottle(TokenBucketThrottle):
+    scope = 'otp_verify'
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RegisterView, MeView, RequestOTPView, VerifyOTPView, NotificationListView, mark_notification_read
+from .views import RegisterView, MeView, RequestOTPView, VerifyOTPView, NotificationListView, mark_notification_read, mark_notifications_read, unread_notification_count
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
@@ -14,5 +14,7 @@ urlpatterns = [
 
     # Notifications
     path('notifications/', NotificationListView.as_view(), name='notifications'),
+    path('notifications/unread_count/', unread_notification_count, name='notification_unread_count'),
+    path('notifications/read/', mark_notifications_read, name='notifications_read'),
     path('notifications/<int:pk>/read/', mark_notification_read, name='notification_read'),
 ]
@@ -1,15 +1,17 @@
 from rest_framework import generics, permissions, status
 from .serializers import UserSerializer, RegisterSerializer, RequestOTPSerializer, VerifyOTPSerializer, NotificationSerializer
 from .models import User, OTPCode, Notification
+from . import authentication, outbox, services
+from .throttling import OTPRequestThrottle, OTPVerifyThrottle
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
 from django.utils.crypto import get_random_string
 from rest_framework.views import APIView
+from rest_framework.pagination import CursorPagination
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
+from auctioncraft_api.db_routing import ReplicaReadsMixin
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -23,6 +25,7 @@ class MeView(generics.RetrieveAPIView):
 
 class RequestOTPView(APIView):
     permission_classes = (permissions.AllowAny,)
+    throttle_classes = (OTPRequestThrottle,)
     def post(self, request):
         """Request an OTP be sent to the provided email. If user doesn't exist, we create a user record with random username.
         In production you may want to require verification of email before creating an account or use a separate signup flow.
@@ -41,30 +44,26 @@ class RequestOTPView(APIView):
 
         # generate numeric code
         code = get_random_string(6, allowed_chars='0123456789')
-        otp = OTPCode.create_for_email(email=email, code=code, user=user)
-
-        # send email (console or configured SMTP)
         subject = "Your AuctionCraft login code"
         message = f"Your one-time login code is: {code}. It expires in 10 minutes."
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@auctioncraft.local')
-        try:
-            send_mail(subject, message, from_email, [email])
-        except Exception as e:
-            # Sending could fail in dev without SMTP; still return success for dev but log.
-            print('Failed to send OTP email:', e)
+        # the email is queued with the code and sent by the outbox worker after commit
+        with transaction.atomic():
+            OTPCode.create_for_email(email=email, code=code, user=user)
+            outbox.enqueue(email, subject, message)
 
         return Response({'detail': 'OTP sent (if the email exists).'}, status=status.HTTP_200_OK)
 
 class VerifyOTPView(APIView):
     permission_classes = (permissions.AllowAny,)
+    throttle_classes = (OTPVerifyThrottle,)
     def post(self, request):
         serializer = VerifyOTPSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         email = serializer.validated_data['email']
         code = serializer.validated_data['code']
 
-        otp = OTPCode.objects.filter(email=email, code=code).order_by('-created_at').first()
-        if not otp or otp.is_expired():
+        otp = OTPCode.verify(email, code)
+        if not otp:
             return Response({'detail':'Invalid or expired code.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Get or create user for this otp
@@ -72,24 +71,54 @@ class VerifyOTPView(APIView):
         if not user:
             return Response({'detail':'No user found for this OTP.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # generate JWT tokens
-        refresh = RefreshToken.for_user(user)
-        # Optionally mark OTP as used / delete it
-        otp.delete()
+        # generate JWT tokens; the access token carries the user claims (users.authentication)
+        tokens = authentication.tokens_for(user)
+        # the code is used up, and so is every other code still outstanding for this email
+        OTPCode.objects.filter(email=email).delete()
+
+        return Response(tokens, status=status.HTTP_200_OK)
 
-        return Response({'access': str(refresh.access_token), 'refresh': str(refresh)}, status=status.HTTP_200_OK)
+class NotificationCursorPagination(CursorPagination):
+    """Keyset pagination over the (user, created_at, id) index: thousands of notices cost the same as a few."""
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
 
-class NotificationListView(generics.ListAPIView):
+class NotificationListView(ReplicaReadsMixin, generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = NotificationCursorPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Notification.objects.filter(user=self.request.user)
+        if self.request.query_params.get('unread') in ('1', 'true'):
+            queryset = queryset.filter(is_read=False)
+        return queryset
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_notification_count(request):
+    # maintained on the user row; a token-claims user loads it on first access
+    return Response({'unread': request.user.unread_notifications})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_notification_read(request, pk):
-    notification = get_object_or_404(Notification, pk=pk, user=request.user)
-    notification.is_read = True
-    notification.save()
+    get_object_or_404(Notification.objects.only('pk'), pk=pk, user=request.user)
+    services.mark_read(request.user, ids=[pk])
     return Response({'detail':'marked as read'})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def mark_notifications_read(request):
+    """Mark many notifications read: {"ids": [1, 2, 3]} or {"all": true}."""
+    if request.data.get('all') is True:
+        changed = services.mark_read(request.user)
+    else:
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            return Response({'detail': 'Expected "ids" (a list of notification ids) or "all": true.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > 1000:
+            return Response({'detail': 'At most 1000 ids per request.'}, status=status.HTTP_400_BAD_REQUEST)
+        changed = services.mark_read(request.user, ids=ids)
+    return Response({'marked': changed})